@@ -0,0 +1,318 @@
+"""Load test for the canvas API and WebSocket fan-out, run in-process.
+
+Seeds a scratch database at increasing fill levels (1%, 10% and 100% of the
+board by default) and, for each, drives the ASGI app directly (no sockets):
+
+- GET /level/{level} and /render/{level} on random views of every level, and POST /paint on
+  random pixels, reporting latency percentiles and requests per second
+  at the given concurrency
+- N WebSocket clients subscribed to the root view, reporting the time from
+  sending a paint until each client has received the delta frame with it
+
+Results are printed (or written with --output) as JSON. Two result files
+can be compared; regressions beyond --threshold exit non-zero:
+
+    python -m benchmarks.api_load [--fills 0.01,0.1,1] [--requests 200] [--output run.json]
+    python -m benchmarks.api_load --compare base.json run.json [--threshold 0.2]
+
+Each endpoint stops issuing requests after --budget seconds, so slow paths
+(the JSON root view on a full board) report fewer samples instead of
+stalling the run. The render cache is cleared before each endpoint so every run starts cold.
+Paint latency includes the journal wait of the selected --durability mode.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty sample list"""
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies: List[float], elapsed: float) -> dict:
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def view_params(level: int, rng: random.Random) -> dict:
+    """Random valid section_x/section_y for a level (none at level 1)"""
+    if level == 1:
+        return {}
+    # Views below level 1 are keyed by their parent section, 3^(level-1) per side
+    parents = 3 ** (level - 1)
+    return {"section_x": rng.randrange(parents), "section_y": rng.randrange(parents)}
+
+
+def seed(target: int, order: List[int], rng: random.Random) -> None:
+    """Paint the first `target` offsets of `order` straight into the database"""
+    from database import SessionLocal, canvas_upsert
+    from models.canvas import CanvasModel
+    size = CanvasModel.TOTAL_SIZE
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        for start in range(0, target, 50_000):
+            db.execute(canvas_upsert(), [
+                {
+                    "x": offset % size,
+                    "y": offset // size,
+                    "color": rng.choice(CanvasModel.COLORS),
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for offset in order[start:min(start + 50_000, target)]
+            ])
+        db.commit()
+
+
+async def measure(client, requests: int, concurrency: int, budget: float, make_request) -> dict:
+    """Issue up to `requests` requests, stopping early once `budget` seconds have passed"""
+    deadline = time.perf_counter() + budget
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            if time.perf_counter() > deadline:
+                return
+            started = time.perf_counter()
+            response = await make_request(client, i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{response.request.url} returned {response.status_code}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+class SimulatedSocket:
+    """Minimal ASGI WebSocket client that timestamps every frame it receives"""
+
+    def __init__(self, app):
+        self.app = app
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.frames: List[tuple] = []
+        self.subscribed = asyncio.Event()
+        self.task = None
+
+    async def open(self, subscribe: dict) -> None:
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": "/ws",
+            "raw_path": b"/ws", "query_string": b"", "root_path": "", "headers": [],
+            "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80), "subprotocols": [],
+        }
+        await self.inbox.put({"type": "websocket.connect"})
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps(subscribe)})
+        self.task = asyncio.get_running_loop().create_task(self.app(scope, self.inbox.get, self._send))
+        await self.subscribed.wait()
+
+    async def close(self) -> None:
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+        await self.task
+
+    def arrivals(self) -> Dict[tuple, float]:
+        """First time each pixel showed up in a delta frame"""
+        arrived: Dict[tuple, float] = {}
+        for received, frame in self.frames:
+            for x, y, _ in frame["pixels"]:
+                arrived.setdefault((x, y), received)
+        return arrived
+
+    async def _send(self, message: dict) -> None:
+        if message["type"] != "websocket.send":
+            return
+        received = time.perf_counter()
+        frame = json.loads(message["text"])
+        if frame.get("type") == "subscribed":
+            self.subscribed.set()
+        elif frame.get("type") == "delta":
+            self.frames.append((received, frame))
+
+
+async def measure_fanout(app, client, clients: int, paints: int, rng: random.Random) -> dict:
+    from models.canvas import CanvasModel
+    sockets = [SimulatedSocket(app) for _ in range(clients)]
+    for socket in sockets:
+        await socket.open({"type": "subscribe", "level": 1})
+
+    sent: Dict[tuple, float] = {}
+    for _ in range(paints):
+        pixel = (rng.randrange(CanvasModel.TOTAL_SIZE), rng.randrange(CanvasModel.TOTAL_SIZE))
+        sent[pixel] = time.perf_counter()
+        await client.post("/paint", json={"x": pixel[0], "y": pixel[1], "color": rng.choice(CanvasModel.COLORS)})
+    # Let the last broadcast tick go out
+    deadline = time.perf_counter() + 5
+    while time.perf_counter() < deadline and not all(sent.keys() <= socket.arrivals().keys() for socket in sockets):
+        await asyncio.sleep(0.01)
+
+    latencies: List[float] = []
+    missed = 0
+    for socket in sockets:
+        arrived = socket.arrivals()
+        for pixel, started in sent.items():
+            if pixel in arrived:
+                latencies.append(arrived[pixel] - started)
+            else:
+                missed += 1
+        await socket.close()
+
+    summary = summarize(latencies, 1) if latencies else {"count": 0}
+    summary.pop("rps", None)
+    summary.update({"clients": clients, "paints": paints, "missed": missed})
+    return summary
+
+
+async def run_fill(app, args, rng: random.Random) -> dict:
+    import httpx
+    from models.canvas import CanvasModel
+    from rendering import render_cache
+    from routes.canvas import MAX_VIEW_SIZE
+
+    results = {}
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for level in range(1, CanvasModel.MAX_LEVEL + 1):
+                if CanvasModel.view_size(level) > MAX_VIEW_SIZE:
+                    continue  # only served downsampled, through /render
+                render_cache.clear()
+                views = [view_params(level, rng) for _ in range(args.requests)]
+                results[f"GET /level/{level}"] = await measure(
+                    client, args.requests, args.concurrency, args.budget,
+                    lambda c, i, level=level, views=views: c.get(f"/level/{level}", params=views[i]),
+                )
+            for level in range(1, CanvasModel.MAX_LEVEL):
+                render_cache.clear()
+                views = [view_params(level, rng) for _ in range(args.requests)]
+                results[f"GET /render/{level}"] = await measure(
+                    client, args.requests, args.concurrency, args.budget,
+                    lambda c, i, level=level, views=views: c.get(f"/render/{level}", params=views[i]),
+                )
+            paints = [
+                {"x": rng.randrange(CanvasModel.TOTAL_SIZE), "y": rng.randrange(CanvasModel.TOTAL_SIZE),
+                 "color": rng.choice(CanvasModel.COLORS)}
+                for _ in range(args.requests)
+            ]
+            results["POST /paint"] = await measure(
+                client, args.requests, args.concurrency, args.budget, lambda c, i: c.post("/paint", json=paints[i]),
+            )
+            results["WS fan-out"] = await measure_fanout(app, client, args.clients, args.paints, rng)
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args) -> dict:
+    fills = [float(fill) for fill in args.fills.split(",")]
+    with tempfile.TemporaryDirectory() as tmp:
+        # Configure the app for a scratch database and journal before importing it
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["DOODLR_JOURNAL_PATH"] = os.path.join(tmp, "bench.journal")
+        os.environ["DOODLR_HISTORY_PATH"] = os.path.join(tmp, "bench.history")
+        os.environ["DOODLR_DURABILITY"] = args.durability
+        from main import app
+        from models.canvas import CanvasModel
+
+        rng = random.Random(args.seed)
+        total = CanvasModel.TOTAL_SIZE ** 2
+        order = rng.sample(range(total), total)
+        report = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("compare", "output")},
+            "fills": [],
+        }
+        for fill in sorted(fills):
+            target = int(total * fill)
+            seed(target, order, rng)
+            started = time.perf_counter()
+            endpoints = asyncio.run(run_fill(app, args, rng))
+            report["fills"].append({
+                "fill": fill,
+                "pixels": target,
+                "seconds": round(time.perf_counter() - started, 1),
+                "endpoints": endpoints,
+            })
+        return report
+
+
+def compare(base_path: str, head_path: str, threshold: float) -> int:
+    """Print p50/p99 changes per endpoint and fill; returns the number of regressions"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+    base_fills = {entry["fill"]: entry["endpoints"] for entry in base["fills"]}
+    regressions = 0
+    print(f"{base.get('revision')} -> {head.get('revision')}")
+    for entry in head["fills"]:
+        before = base_fills.get(entry["fill"])
+        if before is None:
+            continue
+        for name, stats in entry["endpoints"].items():
+            if name not in before or not stats.get("count"):
+                continue
+            for metric in ("p50_ms", "p99_ms"):
+                old, new = before[name].get(metric), stats.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                flag = ""
+                if change > threshold:
+                    flag = "  REGRESSION"
+                    regressions += 1
+                print(f"fill={entry['fill']:<5} {name:<16} {metric:<7} {old:>10.3f} -> {new:>10.3f} ({change:+.0%}){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fills", default="0.01,0.1,1")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and fill")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--budget", type=float, default=15.0, help="seconds per endpoint before it stops early")
+    parser.add_argument("--clients", type=int, default=100, help="simulated WebSocket clients")
+    parser.add_argument("--paints", type=int, default=50, help="paints timed through the fan-out")
+    parser.add_argument("--durability", default="async", choices=("sync", "group", "async"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="compare two reports")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,124 @@
+"""Before/after benchmark for the unique (x, y) index and upsert painting.
+
+Seeds a scratch SQLite file with N rows (500k by default), then times the
+range queries the section endpoints used to run and the paint write path,
+first without the composite index (select-then-insert/update) and again
+after migrate_canvas_xy_index (single upsert statement).
+
+    python -m benchmarks.index_upsert [--rows 500000] [--queries 200]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, select, text
+from database import Canvas, canvas_upsert, migrate_canvas_xy_index
+from models.canvas import CanvasModel
+
+
+def seed(engine, rows: int) -> None:
+    Canvas.__table__.create(engine)
+    with engine.begin() as conn:
+        # Start from the pre-migration schema: only the primary key is indexed
+        conn.execute(text("DROP INDEX ix_canvas_x_y"))
+        size = CanvasModel.TOTAL_SIZE
+        coords = random.sample(range(size * size), rows)
+        base = datetime(2025, 1, 1)
+        batch = []
+        for n, offset in enumerate(coords):
+            ts = base + timedelta(seconds=n)
+            batch.append({
+                "x": offset % size,
+                "y": offset // size,
+                "color": random.choice(CanvasModel.COLORS),
+                "created_at": ts,
+                "updated_at": ts,
+            })
+            if len(batch) == 50_000:
+                conn.execute(Canvas.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(Canvas.__table__.insert(), batch)
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def summarize(samples) -> dict:
+    return {
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+    }
+
+
+def time_range_queries(engine, span: int, count: int) -> dict:
+    size = CanvasModel.TOTAL_SIZE
+    samples = []
+    with engine.connect() as conn:
+        for _ in range(count):
+            sx = random.randrange(size // span) * span
+            sy = random.randrange(size // span) * span
+            start = time.perf_counter()
+            conn.execute(select(Canvas).where(
+                Canvas.x >= sx, Canvas.x <= sx + span - 1,
+                Canvas.y >= sy, Canvas.y <= sy + span - 1,
+            )).all()
+            samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def time_paints(engine, count: int, upsert: bool) -> dict:
+    size = CanvasModel.TOTAL_SIZE
+    table = Canvas.__table__
+    samples = []
+    with engine.begin() as conn:
+        for _ in range(count):
+            x, y = random.randrange(size), random.randrange(size)
+            color = random.choice(CanvasModel.COLORS)
+            now = datetime.utcnow()
+            start = time.perf_counter()
+            if upsert:
+                conn.execute(canvas_upsert(), {"x": x, "y": y, "color": color, "created_at": now, "updated_at": now})
+            else:
+                existing = conn.execute(select(table.c.id).where(table.c.x == x, table.c.y == y)).first()
+                if existing:
+                    conn.execute(table.update().where(table.c.id == existing.id).values(color=color, updated_at=now))
+                else:
+                    conn.execute(table.insert().values(x=x, y=y, color=color, created_at=now, updated_at=now))
+            samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def run(rows: int, queries: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed(engine, rows)
+        results = {"rows": rows, "queries": queries}
+        for phase in ("before", "after"):
+            if phase == "after":
+                start = time.perf_counter()
+                migrate_canvas_xy_index(engine)
+                results["migration_s"] = round(time.perf_counter() - start, 3)
+            results[phase] = {
+                "range_27x27": time_range_queries(engine, 27, queries),
+                "range_81x81": time_range_queries(engine, 81, queries),
+                "paint": time_paints(engine, queries, upsert=(phase == "after")),
+            }
+        engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    print(json.dumps(run(args.rows, args.queries), indent=2))
@@ -0,0 +1,117 @@
+"""Mixed read/write throughput with and without the SQLite tuning profile.
+
+Seeds two scratch databases with the same rows, then for each runs reader
+threads issuing section-sized range queries alongside one writer thread
+committing small upsert batches (the journal's group commits), and reports
+operations per second.
+
+    python -m benchmarks.sqlite_tuning [--rows 200000] [--readers 4] [--seconds 5]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select
+from database import Canvas, canvas_upsert, create_db_engine
+from models.canvas import CanvasModel
+
+
+def seed(engine, rows: int, rng: random.Random) -> None:
+    Canvas.__table__.create(engine)
+    size = CanvasModel.TOTAL_SIZE
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(canvas_upsert(), [
+            {
+                "x": offset % size,
+                "y": offset // size,
+                "color": rng.choice(CanvasModel.COLORS),
+                "created_at": now,
+                "updated_at": now,
+            }
+            for offset in rng.sample(range(size * size), rows)
+        ])
+
+
+def run_mixed(engine, readers: int, seconds: float, batch: int) -> dict:
+    size = CanvasModel.TOTAL_SIZE
+    span = CanvasModel.section_size(3)
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "write_commits": 0}
+    lock = threading.Lock()
+
+    def reader(seed_value: int) -> None:
+        rng = random.Random(seed_value)
+        done = 0
+        while not stop.is_set():
+            sx = rng.randrange(size // span) * span
+            sy = rng.randrange(size // span) * span
+            with engine.connect() as conn:
+                conn.execute(select(Canvas.x, Canvas.y, Canvas.color).where(
+                    Canvas.x >= sx, Canvas.x < sx + span,
+                    Canvas.y >= sy, Canvas.y < sy + span,
+                )).all()
+            done += 1
+        with lock:
+            counts["reads"] += done
+
+    def writer() -> None:
+        rng = random.Random(0)
+        commits = 0
+        while not stop.is_set():
+            now = datetime.utcnow()
+            with engine.begin() as conn:
+                conn.execute(canvas_upsert(), [
+                    {
+                        "x": rng.randrange(size),
+                        "y": rng.randrange(size),
+                        "color": rng.choice(CanvasModel.COLORS),
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for _ in range(batch)
+                ])
+            commits += 1
+        with lock:
+            counts["write_commits"] += commits
+            counts["writes"] += commits * batch
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        "reads_per_s": round(counts["reads"] / seconds, 1),
+        "pixels_written_per_s": round(counts["writes"] / seconds, 1),
+        "commits_per_s": round(counts["write_commits"] / seconds, 1),
+    }
+
+
+def run(rows: int, readers: int, seconds: float, batch: int, seed_value: int) -> dict:
+    results = {"rows": rows, "readers": readers, "seconds": seconds, "write_batch": batch}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, tuned in (("default", False), ("tuned", True)):
+            engine = create_db_engine(f"sqlite:///{os.path.join(tmp, label + '.db')}", tuned=tuned)
+            seed(engine, rows, random.Random(seed_value))
+            results[label] = run_mixed(engine, readers, seconds, batch)
+            engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.readers, args.seconds, args.batch, args.seed), indent=2))
@@ -0,0 +1,132 @@
+"""Broadcast bus connecting the workers that serve one canvas.
+
+Every paint and clear is published as an event on the bus and every worker,
+including the one that accepted the request, handles it: other workers apply
+it to their in-memory canvas, and all of them fan it out to their own
+WebSocket clients. This keeps the process-local state (canvas store, render
+cache, socket subscriptions) consistent when running uvicorn with several
+workers or on several hosts.
+
+DOODLR_BUS_URL selects the backend:
+    memory (default)    in-process only, for a single worker
+    redis://host:port   Redis pub/sub (requires the `redis` package, 5.0.1 or later)
+"""
+from typing import Awaitable, Callable, Optional
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+BUS_URL = os.environ.get("DOODLR_BUS_URL", "memory")
+BUS_CHANNEL = os.environ.get("DOODLR_BUS_CHANNEL", "doodlr:canvas")
+# Pause before resubscribing after the Redis subscription fails
+RECONNECT_S = float(os.environ.get("DOODLR_BUS_RECONNECT_S", "1"))
+
+# Identifies this process on the bus so it can recognise its own events
+WORKER_ID = uuid.uuid4().hex
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class InProcessBus:
+    """Delivers events straight to the local handler"""
+
+    def __init__(self, worker_id: str = WORKER_ID):
+        self.worker_id = worker_id
+        self.handler: Optional[EventHandler] = None
+
+    async def start(self, handler: EventHandler) -> None:
+        self.handler = handler
+
+    async def stop(self) -> None:
+        self.handler = None
+
+    async def publish(self, event: dict) -> None:
+        event = {**event, "origin": self.worker_id}
+        if self.handler is not None:
+            await self.handler(event)
+
+
+class RedisBus:
+    """Redis pub/sub fan-out; each worker subscribes to the shared channel.
+    Every subscriber gets every event, its own included; handlers tell them
+    apart by the "origin" field."""
+
+    def __init__(self, url: str, channel: str = BUS_CHANNEL, worker_id: str = WORKER_ID):
+        self.url = url
+        self.channel = channel
+        self.worker_id = worker_id
+        self.handler: Optional[EventHandler] = None
+        self._client = None
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: EventHandler) -> None:
+        try:
+            import redis.asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError("DOODLR_BUS_URL points at Redis but the `redis` package is not installed") from exc
+        self.handler = handler
+        self._client = redis.from_url(self.url)
+        self._pubsub = self._client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.aclose()
+            self._pubsub = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def publish(self, event: dict) -> None:
+        await self._client.publish(self.channel, json.dumps({**event, "origin": self.worker_id}))
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                if self._pubsub is None:
+                    self._pubsub = self._client.pubsub()
+                    await self._pubsub.subscribe(self.channel)
+                async for message in self._pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        await self.handler(json.loads(message["data"]))
+                    except Exception:
+                        logger.exception("Failed to handle bus event")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Events published while unsubscribed are lost to this worker
+                logger.exception("Bus subscription failed; resubscribing in %gs", RECONNECT_S)
+                pubsub, self._pubsub = self._pubsub, None
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+                await asyncio.sleep(RECONNECT_S)
+
+
+def create_bus(url: str = BUS_URL):
+    if url == "memory":
+        return InProcessBus()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBus(url)
+    raise ValueError(f"Unsupported DOODLR_BUS_URL {url!r}")
+
+
+bus = create_bus()
@@ -0,0 +1,197 @@
+"""Process-resident canvas state.
+
+The board is held in memory as palette indices (0 = unpainted,
+n = CanvasModel.COLORS[n - 1]) in chunks of DOODLR_CHUNK_SIZE pixels per
+side, allocated as they are first painted, so memory follows the painted
+area rather than the board size. It is loaded once from SQLite at startup;
+read endpoints slice the chunks and SQLite only serves as the durability
+layer for paints.
+"""
+from typing import Dict, Iterator, List, Tuple
+import os
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from database import Canvas
+from models.canvas import CanvasModel
+from pyramid import MipmapPyramid
+
+UNPAINTED = 0
+
+# Side of the storage chunks; a power of 3 (clamped to the board side)
+CHUNK_SIZE = int(os.environ.get("DOODLR_CHUNK_SIZE", "243"))
+
+# Palette index <-> color name lookups (index 0 is reserved for unpainted)
+INDEX_TO_COLOR: List[str] = [""] + list(CanvasModel.COLORS)
+COLOR_TO_INDEX = {color: i + 1 for i, color in enumerate(CanvasModel.COLORS)}
+
+
+def color_to_index(color: str) -> int:
+    """Return the palette index for a color name (0 if unknown)"""
+    return COLOR_TO_INDEX.get(color, UNPAINTED)
+
+
+def index_to_color(index: int) -> str:
+    """Return the color name for a palette index ("" for unpainted)"""
+    return INDEX_TO_COLOR[index]
+
+
+class ChunkGrid:
+    """Sparse board of palette indices in square chunks of chunk_size pixels.
+
+    A chunk is allocated by the first paint inside it, so unpainted regions
+    cost nothing, and reads only visit the chunks overlapping their window.
+    """
+
+    def __init__(self, size: int = CanvasModel.TOTAL_SIZE, chunk_size: int = CHUNK_SIZE):
+        chunk_size = min(chunk_size, size)
+        if size % chunk_size:
+            raise ValueError(f"Chunk size {chunk_size} does not divide the board side {size}")
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunks: Dict[Tuple[int, int], bytearray] = {}
+
+    def get(self, x: int, y: int) -> int:
+        """Palette index at (x, y)"""
+        c = self.chunk_size
+        chunk = self.chunks.get((x // c, y // c))
+        return chunk[(y % c) * c + x % c] if chunk is not None else UNPAINTED
+
+    def put(self, x: int, y: int, index: int) -> int:
+        """Store a palette index at (x, y) and return the previous one"""
+        c = self.chunk_size
+        key = (x // c, y // c)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            if index == UNPAINTED:
+                return UNPAINTED
+            chunk = self.chunks[key] = bytearray(c * c)
+        offset = (y % c) * c + x % c
+        previous = chunk[offset]
+        chunk[offset] = index
+        return previous
+
+    def painted_chunks(self) -> Iterator[Tuple[Tuple[int, int], bytearray]]:
+        """((cx, cy), cells) for every chunk holding at least one painted pixel"""
+        for key, chunk in self.chunks.items():
+            if chunk.count(UNPAINTED) != len(chunk):
+                yield key, chunk
+
+    def fill(self, cells: bytes) -> None:
+        """Replace the contents with a dense row-major board"""
+        if len(cells) != self.size * self.size:
+            raise ValueError(f"Expected {self.size * self.size} cells, got {len(cells)}")
+        c = self.chunk_size
+        self.chunks = {}
+        for cy in range(self.size // c):
+            for cx in range(self.size // c):
+                chunk = bytearray(c * c)
+                for row in range(c):
+                    offset = (cy * c + row) * self.size + cx * c
+                    chunk[row * c:(row + 1) * c] = cells[offset:offset + c]
+                if chunk.count(UNPAINTED) != len(chunk):
+                    self.chunks[(cx, cy)] = chunk
+
+    def to_bytes(self) -> bytes:
+        """The whole board as dense row-major palette indices"""
+        return self.window(0, 0, self.size, self.size)
+
+    def _clip(self, start_x: int, start_y: int, end_x: int, end_y: int) -> Tuple[int, int, int, int]:
+        return max(start_x, 0), max(start_y, 0), min(end_x, self.size - 1), min(end_y, self.size - 1)
+
+    def window(self, start_x: int, start_y: int, width: int, height: int) -> bytes:
+        """Row-major palette indices for a width x height window (0 outside the board)"""
+        out = bytearray(width * height)
+        x0, y0, x1, y1 = self._clip(start_x, start_y, start_x + width - 1, start_y + height - 1)
+        c = self.chunk_size
+        for cy in range(y0 // c, y1 // c + 1):
+            for cx in range(x0 // c, x1 // c + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+                # Overlap of the window and this chunk, in board coordinates
+                ax, bx = max(x0, cx * c), min(x1, cx * c + c - 1)
+                ay, by = max(y0, cy * c), min(y1, cy * c + c - 1)
+                span = bx - ax + 1
+                src = (ay - cy * c) * c + ax - cx * c
+                dst = (ay - start_y) * width + ax - start_x
+                for _ in range(by - ay + 1):
+                    out[dst:dst + span] = chunk[src:src + span]
+                    src += c
+                    dst += width
+        return bytes(out)
+
+    def pixels_in(self, start_x: int, start_y: int, end_x: int, end_y: int) -> List[Tuple[int, int, str]]:
+        """Painted pixels inside the inclusive bounds as (x, y, color), row-major"""
+        x0, y0, x1, y1 = self._clip(start_x, start_y, end_x, end_y)
+        c = self.chunk_size
+        pixels: List[Tuple[int, int, str]] = []
+        for cy in range(y0 // c, y1 // c + 1):
+            band = [(cx, self.chunks.get((cx, cy))) for cx in range(x0 // c, x1 // c + 1)]
+            band = [(cx, max(x0, cx * c), min(x1, cx * c + c - 1), chunk) for cx, chunk in band if chunk is not None]
+            if not band:
+                continue
+            for y in range(max(y0, cy * c), min(y1, cy * c + c - 1) + 1):
+                row_offset = (y - cy * c) * c
+                for cx, ax, bx, chunk in band:
+                    offset = row_offset + ax - cx * c
+                    row = chunk[offset:offset + bx - ax + 1]
+                    # Skip empty rows with a single C-level count
+                    if row.count(UNPAINTED) == len(row):
+                        continue
+                    for dx, index in enumerate(row):
+                        if index:
+                            pixels.append((ax + dx, y, INDEX_TO_COLOR[index]))
+        return pixels
+
+
+class CanvasStore(ChunkGrid):
+    """In-memory copy of the canvas, one byte per pixel of each painted chunk"""
+
+    def __init__(self, size: int = CanvasModel.TOTAL_SIZE, chunk_size: int = CHUNK_SIZE):
+        super().__init__(size, chunk_size)
+        self.pyramid = MipmapPyramid(size, self.chunk_size)
+
+    def load(self, db: Session) -> int:
+        """Populate the chunks from the canvas table. Returns rows applied."""
+        self.chunks = {}
+        # Oldest first so that the newest row wins for any duplicated coordinate
+        rows = db.execute(
+            select(Canvas.x, Canvas.y, Canvas.color).order_by(Canvas.updated_at, Canvas.id)
+        )
+        count = 0
+        for x, y, color in rows:
+            if 0 <= x < self.size and 0 <= y < self.size:
+                self.put(x, y, color_to_index(color))
+                count += 1
+        self.pyramid.rebuild(self.chunks, self.chunk_size)
+        return count
+
+    def get_color(self, x: int, y: int) -> str:
+        """Color name at (x, y), or "" if unpainted"""
+        return INDEX_TO_COLOR[self.get(x, y)]
+
+    def set(self, x: int, y: int, color: str) -> int:
+        """Paint (x, y) and return the previous palette index"""
+        current = color_to_index(color)
+        previous = self.put(x, y, current)
+        self.pyramid.update(x, y, previous, current)
+        return previous
+
+    def clear(self) -> None:
+        self.chunks = {}
+        self.pyramid.reset()
+
+    def replace(self, cells: bytes) -> None:
+        """Swap in a whole board of palette indices (snapshot import)"""
+        self.fill(cells)
+        self.pyramid.rebuild(self.chunks, self.chunk_size)
+
+    def adopt(self, board: "CanvasStore") -> None:
+        """Take over the chunks and pyramid of a store built elsewhere, e.g. in
+        a worker thread, without copying"""
+        self.chunks = board.chunks
+        self.pyramid = board.pyramid
+
+
+# Shared store for this process, loaded on application startup
+canvas_store = CanvasStore()
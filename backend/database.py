@@ -1,5 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text
+from sqlalchemy import create_engine, event, make_url, Column, Integer, String, DateTime, Text, Index, inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
@@ -7,29 +9,86 @@ import os
 # Create database directory if it doesn't exist
 os.makedirs(os.path.dirname(os.path.abspath(__file__)), exist_ok=True)
 
-# Database URL
-DATABASE_URL = "sqlite:///./doodlr.db"
+# Database URL (override with the DATABASE_URL environment variable). Only SQLite
+# is supported: the upsert, the bulk statements and the tuning are SQLite-specific.
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./doodlr.db")
+
+# SQLite tuning profile, applied to every new connection (DOODLR_SQLITE_TUNING=0 disables)
+SQLITE_TUNING = os.environ.get("DOODLR_SQLITE_TUNING", "1") != "0"
+SQLITE_PRAGMAS = {
+    # Readers no longer block on the writer, and commits append to the WAL instead of
+    # rewriting pages through the rollback journal
+    "journal_mode": "WAL",
+    # Safe with WAL: only the checkpoint fsyncs, a power loss can drop the last commits
+    "synchronous": "NORMAL",
+    # Negative values are KiB
+    "cache_size": -int(os.environ.get("DOODLR_SQLITE_CACHE_KB", "65536")),
+    "mmap_size": int(os.environ.get("DOODLR_SQLITE_MMAP_MB", "256")) * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+# Connection pool sizing; sized for the journal flusher plus the threadpool used by sync code
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _engine_options(url: str) -> dict:
+    if make_url(url).get_backend_name() != "sqlite":
+        raise ValueError(f"DATABASE_URL must be a SQLite URL (sqlite:///path), got {make_url(url).render_as_string()!r}")
+    options = {"connect_args": {"check_same_thread": False}}
+    if ":memory:" in url or url.rstrip("/").endswith(":"):
+        # In-memory databases use a single static connection
+        return options
+    options["pool_size"] = DB_POOL_SIZE
+    options["max_overflow"] = DB_MAX_OVERFLOW
+    return options
+
+
+def create_db_engine(url: str = DATABASE_URL, tuned: bool = SQLITE_TUNING):
+    """Create a sync engine, with the SQLite tuning profile when enabled"""
+    db_engine = create_engine(url, **_engine_options(url))
+    if tuned:
+        event.listen(db_engine, "connect", _apply_sqlite_pragmas)
+    return db_engine
+
+
+def create_async_db_engine(url: str = DATABASE_URL, tuned: bool = SQLITE_TUNING):
+    """Create the async engine for request handlers (on aiosqlite)"""
+    options = _engine_options(url)
+    db_engine = create_async_engine(make_url(url).set(drivername="sqlite+aiosqlite"), **options)
+    if tuned:
+        event.listen(db_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return db_engine
+
 
 # Create engine
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_db_engine()
 
-# Create SessionLocal class
+# Create SessionLocal class (startup migration, scripts and benchmarks)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for request handlers; aiosqlite runs statements off the event loop
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Create Base class
 Base = declarative_base()
 
-# Database dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Canvas model
 class Canvas(Base):
     __tablename__ = "canvas"
+    __table_args__ = (
+        # One row per coordinate; also turns x/y range filters into index range scans
+        Index("ix_canvas_x_y", "x", "y", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     x = Column(Integer, nullable=False)
@@ -38,5 +97,93 @@ class Canvas(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+# Content reports. Repeat reports of a section merge into its open report
+# (unique while resolved_at is NULL) and add to `count`.
+class Report(Base):
+    __tablename__ = "reports"
+    __table_args__ = (
+        Index("ix_reports_open_section", "level", "x", "y", unique=True, sqlite_where=text("resolved_at IS NULL")),
+        # Spatial lookup: reports whose section starts inside a pixel rectangle
+        Index("ix_reports_start", "start_x", "start_y"),
+        Index("ix_reports_last_reported", "last_reported_at"),
+        Index("ix_reports_count", "count"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # The reported section: section (x, y) of `level`, 3^level sections per side
+    level = Column(Integer, nullable=False)
+    x = Column(Integer, nullable=False)
+    y = Column(Integer, nullable=False)
+    # Its pixel bounds, inclusive
+    start_x = Column(Integer, nullable=False)
+    start_y = Column(Integer, nullable=False)
+    end_x = Column(Integer, nullable=False)
+    end_y = Column(Integer, nullable=False)
+    # Reason given by the most recent reporter
+    reason = Column(String(500), nullable=False)
+    count = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_reported_at = Column(DateTime, default=datetime.utcnow)
+    resolved_at = Column(DateTime, nullable=True)
+
+# Open reports per section at every level of the hierarchy: a report at level L
+# counts toward the section containing it at each level 1..L
+class ReportCount(Base):
+    __tablename__ = "report_counts"
+    __table_args__ = (
+        Index("ix_report_counts_level_reports", "level", "reports"),
+    )
+
+    level = Column(Integer, primary_key=True)
+    section_x = Column(Integer, primary_key=True)
+    section_y = Column(Integer, primary_key=True)
+    reports = Column(Integer, nullable=False, default=0)
+
+def canvas_upsert():
+    """INSERT ... ON CONFLICT(x, y) DO UPDATE statement for painting pixels.
+
+    Execute with one parameter dict (x, y, color, created_at, updated_at) per
+    pixel; a list of dicts runs as a single executemany.
+    """
+    stmt = sqlite_insert(Canvas)
+    return stmt.on_conflict_do_update(
+        index_elements=[Canvas.x, Canvas.y],
+        set_={"color": stmt.excluded.color, "updated_at": stmt.excluded.updated_at},
+    )
+
+# Plain DB-API insert for bulk loads (snapshot import): one executemany of tuples,
+# skipping per-row parameter processing. Timestamps must be canvas_timestamp() strings.
+CANVAS_BULK_INSERT = "INSERT INTO canvas (x, y, color, created_at, updated_at) VALUES (?, ?, ?, ?, ?)"
+
+# Erases (palette index 0, see journal.py): one executemany of (x, y) tuples
+CANVAS_BULK_DELETE = "DELETE FROM canvas WHERE x = ? AND y = ?"
+
+def canvas_timestamp(value: datetime) -> str:
+    """A DateTime value in the format SQLAlchemy stores in SQLite"""
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def migrate_canvas_xy_index(bind=engine):
+    """Add the unique (x, y) index to databases created before it existed.
+
+    Duplicate rows for a coordinate are collapsed first, keeping the one with
+    the newest updated_at.
+    """
+    with bind.begin() as conn:
+        indexes = {ix["name"] for ix in inspect(conn).get_indexes("canvas")}
+        if "ix_canvas_x_y" in indexes:
+            return
+        conn.execute(text("""
+            DELETE FROM canvas WHERE id NOT IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY x, y ORDER BY updated_at DESC, id DESC
+                    ) AS rn
+                    FROM canvas
+                ) WHERE rn = 1
+            )
+        """))
+        conn.execute(text("CREATE UNIQUE INDEX ix_canvas_x_y ON canvas (x, y)"))
+
 # Create tables
-Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+Base.metadata.create_all(bind=engine)
+migrate_canvas_xy_index() 
\ No newline at end of file
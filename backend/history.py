@@ -0,0 +1,442 @@
+"""Append-only paint history: replay and point-in-time reads.
+
+Every committed paint is kept so the board can be replayed (GET /history)
+or a region rolled back to an earlier time (POST /admin/revert). Keeping it
+costs the paint path nothing: the journal already writes each paint as a
+packed record (x, y, palette index, time), and once a segment has been
+committed to the database its bytes are appended here instead of deleted.
+Palette index 0 in a record is an erase (written by reverts).
+
+DOODLR_HISTORY_PATH is a directory holding:
+
+    events-<start>-<pid>.log  one worker's records for the partition starting
+                              at <start> (DOODLR_HISTORY_PARTITION_S long),
+                              in the order they were committed
+    events-<start>.idx        a sealed partition: all workers' records sorted
+                              by tile and time behind a sorted table of the
+                              painted tiles and their offsets, so a region
+                              reads only its own tiles
+    checkpoint-<ms>.bin       the board at a time: its painted chunks, each
+                              zlib-compressed behind a table of offsets so a
+                              window decompresses only the chunks it overlaps
+    reset-<ms>.bin            the same, written when the board is cleared or
+                              replaced by a snapshot import (and on first start)
+
+A partition is sealed once it ended DOODLR_HISTORY_GRACE_S ago, and a
+checkpoint for its end is derived from the previous checkpoint and its
+events. The board at time T is the latest checkpoint before T plus the
+events recorded since, so a query reads one or two partitions instead of
+replaying the log from the start.
+
+Times are the journal's: Unix epoch seconds. Changing
+the partition length of an existing history directory is not supported.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+import asyncio
+import fcntl
+import glob
+import logging
+import math
+import os
+import re
+import struct
+import zlib
+from canvas_store import ChunkGrid
+from journal import RECORD
+from models.canvas import CanvasModel
+
+logger = logging.getLogger(__name__)
+
+HISTORY_ENABLED = os.environ.get("DOODLR_HISTORY", "1") != "0"
+HISTORY_PATH = os.environ.get("DOODLR_HISTORY_PATH", "./doodlr.history")
+PARTITION_S = int(os.environ.get("DOODLR_HISTORY_PARTITION_S", "3600"))
+GRACE_S = int(os.environ.get("DOODLR_HISTORY_GRACE_S", "60"))
+# Side of the square tiles the sealed partitions are indexed by
+TILE_SIZE = int(os.environ.get("DOODLR_HISTORY_TILE", "27"))
+
+# How often each worker looks for partitions to seal
+SEAL_EVERY_S = 30
+
+CHECKPOINT_MAGIC = b"DDCK"
+CHECKPOINT_VERSION = 2
+# magic, version, time, board side, chunk side, chunk count; then per chunk
+# (cx, cy, offset, length) of its zlib-compressed cells, which follow
+CHECKPOINT_HEADER = struct.Struct("<4sBdIII")
+CHECKPOINT_CHUNK = struct.Struct("<HHII")
+
+INDEX_MAGIC = b"DDEV"
+INDEX_VERSION = 2
+# magic, version, partition start, tile size, tiles per side, painted tiles (n);
+# then the n painted tile numbers in ascending order (u32), n + 1 u32 record
+# offsets (tile i spans records offsets[i]..offsets[i + 1]) and the records,
+# grouped by tile. Unpainted tiles take no space.
+INDEX_HEADER = struct.Struct("<4sBdHHI")
+
+# Logs claimed by a seal that did not finish keep a .sealing suffix
+_RAW_NAME = re.compile(r"events-(\d+)-(\d+)\.log(\.sealing)?$")
+_INDEX_NAME = re.compile(r"events-(\d+)\.idx$")
+_CHECKPOINT_NAME = re.compile(r"(checkpoint|reset)-(\d+)\.bin$")
+
+Event = Tuple[int, int, int, float]
+
+
+def parse_time(value: str) -> float:
+    """History time for an ISO 8601 string (naive values are UTC); ValueError if invalid"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def format_time(ts: float) -> str:
+    """Naive UTC ISO 8601 string for a history time"""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def history_now() -> float:
+    """The current time on the journal's clock"""
+    return datetime.now(timezone.utc).timestamp()
+
+
+def _unpack(data: bytes) -> List[Event]:
+    """Decode packed records, ignoring a torn trailing record"""
+    usable = len(data) - len(data) % RECORD.size
+    return list(RECORD.iter_unpack(data[:usable]))
+
+
+class Checkpoint:
+    def __init__(self, path: str, ts: float, kind: str):
+        self.path = path
+        self.time = ts
+        self.kind = kind
+
+    def load(self, size: int, region: Tuple[int, int, int, int] = None) -> ChunkGrid:
+        """The board of side `size`; with an inclusive region (x0, y0, x1, y1),
+        only the chunks overlapping it"""
+        with open(self.path, "rb") as f:
+            magic, version, _, side, chunk_size, count = CHECKPOINT_HEADER.unpack(f.read(CHECKPOINT_HEADER.size))
+            if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+                raise ValueError(f"{self.path} is not a checkpoint")
+            if side != size:
+                raise ValueError(f"{self.path} holds a {side}x{side} board, not {size}x{size}")
+            board = ChunkGrid(size, chunk_size)
+            table = list(CHECKPOINT_CHUNK.iter_unpack(f.read(count * CHECKPOINT_CHUNK.size)))
+            x0, y0, x1, y1 = region if region is not None else (0, 0, size - 1, size - 1)
+            for cx, cy, offset, length in table:
+                if not (x0 // chunk_size <= cx <= x1 // chunk_size and y0 // chunk_size <= cy <= y1 // chunk_size):
+                    continue
+                f.seek(offset)
+                board.chunks[(cx, cy)] = bytearray(zlib.decompress(f.read(length)))
+        return board
+
+
+class PaintHistory:
+    def __init__(self, path: str = HISTORY_PATH, partition_s: int = PARTITION_S,
+                 grace_s: int = GRACE_S, tile: int = TILE_SIZE, size: int = CanvasModel.TOTAL_SIZE):
+        self.path = path
+        self.partition_s = partition_s
+        self.grace_s = grace_s
+        self.tile = tile
+        self.size = size
+        self.tiles_per_side = -(-size // tile)
+        self._task = None
+
+    # --- writing ---
+
+    def start(self, board: ChunkGrid) -> None:
+        """Open the history; a new one starts from the current board"""
+        if not HISTORY_ENABLED:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        if not self.checkpoints():
+            self.reset(board)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def archive(self, segment: str) -> None:
+        """Append a committed journal segment to the log of its partition(s)"""
+        if not HISTORY_ENABLED or not os.path.exists(segment):
+            return
+        try:
+            with open(segment, "rb") as f:
+                data = f.read()
+            data = data[:len(data) - len(data) % RECORD.size]
+            if not data:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            first = self._partition(RECORD.unpack_from(data, 0)[3])
+            last = self._partition(RECORD.unpack_from(data, len(data) - RECORD.size)[3])
+            if first == last:
+                self._append(first, data)
+                return
+            # A segment straddling a partition boundary (or a clock step) is split record by record
+            parts = {}
+            for offset in range(0, len(data), RECORD.size):
+                start = self._partition(RECORD.unpack_from(data, offset)[3])
+                parts.setdefault(start, []).append(data[offset:offset + RECORD.size])
+            for start, records in parts.items():
+                self._append(start, b"".join(records))
+        except OSError:
+            logger.exception("Could not archive %s to the paint history", segment)
+
+    def reset(self, board: ChunkGrid, ts: float = None) -> None:
+        """Record that the board was replaced wholesale (clear or snapshot import)
+        at `ts` (default now)"""
+        if HISTORY_ENABLED:
+            os.makedirs(self.path, exist_ok=True)
+            self._write_checkpoint("reset", history_now() if ts is None else ts, board)
+
+    def _partition(self, ts: float) -> int:
+        return int(ts // self.partition_s * self.partition_s)
+
+    def _append(self, start: int, data: bytes) -> None:
+        with open(os.path.join(self.path, f"events-{start}-{os.getpid()}.log"), "ab") as f:
+            f.write(data)
+
+    def _write_checkpoint(self, kind: str, ts: float, board: ChunkGrid) -> Checkpoint:
+        # Listings read the time from the name, so it is kept to whole milliseconds
+        ms = math.ceil(ts * 1000)
+        ts = ms / 1000
+        path = os.path.join(self.path, f"{kind}-{ms}.bin")
+        chunks = [(key, zlib.compress(bytes(cells), 6)) for key, cells in board.painted_chunks()]
+        offset = CHECKPOINT_HEADER.size + len(chunks) * CHECKPOINT_CHUNK.size
+        table = []
+        for (cx, cy), data in chunks:
+            table.append(CHECKPOINT_CHUNK.pack(cx, cy, offset, len(data)))
+            offset += len(data)
+        header = CHECKPOINT_HEADER.pack(
+            CHECKPOINT_MAGIC, CHECKPOINT_VERSION, ts, self.size, board.chunk_size, len(chunks)
+        )
+        with open(path + ".tmp", "wb") as f:
+            f.write(header + b"".join(table) + b"".join(data for _, data in chunks))
+        os.replace(path + ".tmp", path)
+        return Checkpoint(path, ts, kind)
+
+    # --- reading ---
+
+    def checkpoints(self) -> List[Checkpoint]:
+        """Checkpoints oldest first"""
+        found = []
+        for path in glob.glob(os.path.join(glob.escape(self.path), "*.bin")):
+            match = _CHECKPOINT_NAME.search(path)
+            if match:
+                found.append(Checkpoint(path, int(match.group(2)) / 1000, match.group(1)))
+        return sorted(found, key=lambda checkpoint: checkpoint.time)
+
+    def earliest(self) -> Optional[float]:
+        checkpoints = self.checkpoints()
+        return checkpoints[0].time if checkpoints else None
+
+    def _partitions(self) -> Tuple[dict, dict]:
+        """Sealed index file per partition start, and unsealed log files per partition start"""
+        sealed, raw = {}, {}
+        for path in glob.glob(os.path.join(glob.escape(self.path), "events-*")):
+            match = _INDEX_NAME.search(path)
+            if match:
+                sealed[int(match.group(1))] = path
+                continue
+            match = _RAW_NAME.search(path)
+            if match:
+                raw.setdefault(int(match.group(1)), []).append(path)
+        return sealed, raw
+
+    def _tile_ranges(self, x0: int, y0: int, x1: int, y1: int) -> List[Tuple[int, int]]:
+        """First and last tile number of each tile row covering the inclusive region"""
+        tx0, tx1 = max(x0, 0) // self.tile, min(x1, self.size - 1) // self.tile
+        ty0, ty1 = max(y0, 0) // self.tile, min(y1, self.size - 1) // self.tile
+        return [(ty * self.tiles_per_side + tx0, ty * self.tiles_per_side + tx1) for ty in range(ty0, ty1 + 1)]
+
+    def _read_index(self, path: str, region: Tuple[int, int, int, int]) -> List[Event]:
+        """Records of a sealed partition in the tiles covering `region`"""
+        with open(path, "rb") as f:
+            magic, version, _, tile, per_side, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic != INDEX_MAGIC or version != INDEX_VERSION or (tile, per_side) != (self.tile, self.tiles_per_side):
+                raise ValueError(f"{path} was sealed with a different layout")
+            tiles, offsets = array("I"), array("I")
+            tiles.frombytes(f.read(count * tiles.itemsize))
+            offsets.frombytes(f.read((count + 1) * offsets.itemsize))
+            base = f.tell()
+            events: List[Event] = []
+            for first, last in self._tile_ranges(*region):
+                # The painted tiles of this tile row are adjacent in the sorted table
+                lo = bisect_left(tiles, first)
+                hi = bisect_right(tiles, last, lo)
+                if lo == hi:
+                    continue
+                f.seek(base + offsets[lo] * RECORD.size)
+                events.extend(_unpack(f.read((offsets[hi] - offsets[lo]) * RECORD.size)))
+        return events
+
+    def _partition_events(self, start: int, sealed: Optional[str], raw: List[str], since: float, until: float,
+                          region: Tuple[int, int, int, int]) -> List[Event]:
+        events: List[Event] = []
+        if sealed is not None:
+            events.extend(self._read_index(sealed, region))
+        for path in raw:
+            with open(path, "rb") as f:
+                events.extend(_unpack(f.read()))
+        x0, y0, x1, y1 = region
+        events = [
+            event for event in events
+            if since <= event[3] < until and x0 <= event[0] <= x1 and y0 <= event[1] <= y1
+        ]
+        # Stable, so records sharing a time keep their commit order
+        events.sort(key=lambda event: event[3])
+        return events
+
+    def events(self, since: float, until: float, region: Tuple[int, int, int, int] = None) -> Iterator[List[Event]]:
+        """Records with since <= time < until inside the inclusive region (x0, y0, x1, y1),
+        in time order, one list per partition"""
+        if region is None:
+            region = (0, 0, self.size - 1, self.size - 1)
+        sealed, raw = self._partitions()
+        for start in sorted(set(sealed) | set(raw)):
+            if start + self.partition_s <= since or start >= until:
+                continue
+            events = self._partition_events(start, sealed.get(start), raw.get(start, []), since, until, region)
+            if events:
+                yield events
+
+    def _base(self, ts: float) -> Checkpoint:
+        checkpoints = [checkpoint for checkpoint in self.checkpoints() if checkpoint.time <= ts]
+        if not checkpoints:
+            earliest = self.earliest()
+            raise ValueError("History starts at " + format_time(earliest) if earliest else "No history recorded")
+        return checkpoints[-1]
+
+    def state_at(self, ts: float, start_x: int, start_y: int, width: int, height: int) -> bytearray:
+        """Row-major palette indices of a window as it was at time `ts`"""
+        base = self._base(ts)
+        region = (start_x, start_y, start_x + width - 1, start_y + height - 1)
+        cells = bytearray(base.load(self.size, region).window(start_x, start_y, width, height))
+        for events in self.events(base.time, ts, region):
+            for x, y, index, _ in events:
+                cells[(y - start_y) * width + x - start_x] = index
+        return cells
+
+    def replay(self, since: float, until: float, start_x: int, start_y: int, width: int, height: int) -> Iterator[tuple]:
+        """("state", time, cells) for the window at `since` and after every reset,
+        interleaved with ("events", records) in time order"""
+        yield "state", since, self.state_at(since, start_x, start_y, width, height)
+        region = (start_x, start_y, start_x + width - 1, start_y + height - 1)
+        resets = [checkpoint for checkpoint in self.checkpoints()
+                  if checkpoint.kind == "reset" and since < checkpoint.time < until]
+        bounds = [since] + [checkpoint.time for checkpoint in resets] + [until]
+        for i, (begin, end) in enumerate(zip(bounds, bounds[1:])):
+            if i:
+                yield "state", begin, self.state_at(begin, start_x, start_y, width, height)
+            for events in self.events(begin, end, region):
+                yield "events", events
+
+    def pixel_history(self, x: int, y: int, limit: int) -> List[Event]:
+        """Up to `limit` most recent records for one pixel, newest first"""
+        sealed, raw = self._partitions()
+        region = (x, y, x, y)
+        found: List[Event] = []
+        for start in sorted(set(sealed) | set(raw), reverse=True):
+            events = self._partition_events(start, sealed.get(start), raw.get(start, []), 0, float("inf"), region)
+            found.extend(reversed(events))
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+    # --- sealing ---
+
+    def seal(self, now: float = None) -> int:
+        """Seal partitions past their grace period and derive their checkpoints.
+        Returns partitions sealed; a no-op while another worker is sealing."""
+        if now is None:
+            now = history_now()
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "seal.lock"), "ab") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            sealed, raw = self._partitions()
+            done = sorted(start for start in raw if start + self.partition_s + self.grace_s <= now)
+            for start in done:
+                if start in sealed:
+                    # Late records (a crashed worker's journal replayed after the partition
+                    # was sealed): every checkpoint derived after it is stale
+                    for checkpoint in self.checkpoints():
+                        if checkpoint.kind == "checkpoint" and checkpoint.time > start:
+                            os.remove(checkpoint.path)
+                sealed[start] = self._seal_partition(start, sealed.get(start), raw[start])
+            self._derive_checkpoints(sorted(sealed))
+        return len(done)
+
+    def _seal_partition(self, start: int, sealed: Optional[str], raw: List[str]) -> str:
+        events: List[Event] = []
+        if sealed is not None:
+            events.extend(self._read_index(sealed, (0, 0, self.size - 1, self.size - 1)))
+        claimed = []
+        for path in raw:
+            if not path.endswith(".sealing"):
+                # Renamed first, so an append racing with the seal starts a new log instead of being lost
+                os.replace(path, path + ".sealing")
+                path += ".sealing"
+            claimed.append(path)
+            with open(path, "rb") as f:
+                events.extend(_unpack(f.read()))
+        per_side = self.tiles_per_side
+        tile_of = [0] * len(events)
+        for i, (x, y, _, _) in enumerate(events):
+            tile_of[i] = (y // self.tile) * per_side + x // self.tile
+        order = sorted(range(len(events)), key=lambda i: (tile_of[i], events[i][3]))
+        tiles, offsets = array("I"), array("I")
+        for position, i in enumerate(order):
+            if not tiles or tiles[-1] != tile_of[i]:
+                tiles.append(tile_of[i])
+                offsets.append(position)
+        offsets.append(len(order))
+        path = os.path.join(self.path, f"events-{start}.idx")
+        with open(path + ".tmp", "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, start, self.tile, per_side, len(tiles)))
+            f.write(tiles.tobytes())
+            f.write(offsets.tobytes())
+            f.write(b"".join(RECORD.pack(*events[i]) for i in order))
+        os.replace(path + ".tmp", path)
+        for claimed_path in claimed:
+            os.remove(claimed_path)
+        return path
+
+    def _derive_checkpoints(self, sealed_starts: List[int]) -> None:
+        """Write the missing checkpoint at the end of each sealed partition"""
+        for start in sealed_starts:
+            end = start + self.partition_s
+            checkpoints = self.checkpoints()
+            if not checkpoints or checkpoints[0].time > end:
+                continue  # before the history began
+            if any(checkpoint.time == end and checkpoint.kind == "checkpoint" for checkpoint in checkpoints):
+                continue
+            base = [checkpoint for checkpoint in checkpoints if checkpoint.time <= end][-1]
+            board = base.load(self.size)
+            for events in self.events(base.time, end):
+                for x, y, index, _ in events:
+                    board.put(x, y, index)
+            self._write_checkpoint("checkpoint", end, board)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(SEAL_EVERY_S)
+            try:
+                await asyncio.to_thread(self.seal)
+            except Exception:
+                logger.exception("Sealing paint history failed; will retry")
+
+
+paint_history = PaintHistory()
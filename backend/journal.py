@@ -0,0 +1,334 @@
+"""Write-behind paint journal with group commit.
+
+Paints are applied to the in-memory canvas by the route handlers and then
+handed to the journal, which appends a packed record to an on-disk journal
+file and queues the pixel for the database. A background task flushes the
+queue to the canvas table in one transaction when it reaches
+GROUP_COMMIT_MAX pixels or every GROUP_COMMIT_MS, collapsing repeated
+writes to the same (x, y) within the window.
+
+Committed segments are handed to `archive` (the paint history, see
+history.py) before they are deleted. A pixel painted "" (palette index 0)
+is an erase and deletes its row.
+
+Each worker process journals to its own segment files (<path>-<pid>) and
+holds an flock on <path>-<pid>.lock while running, so several uvicorn
+workers can share one journal directory. On startup a worker replays every
+segment whose lock is no longer held, i.e. those left behind by crashed
+processes.
+
+Durability modes (DOODLR_DURABILITY):
+    async  the request returns once the record is in the journal file
+           (default); a crash loses nothing that reached the OS, and the
+           unflushed journal is replayed into the database on the next startup
+    group  the request also waits for the next group commit, adding up to
+           GROUP_COMMIT_MS of latency to every paint
+    sync   the request waits for a commit that includes its pixels
+
+A paint is accepted once its record is in the journal file. If the commit
+it waits for fails, the pixels stay queued for the next group commit (and
+in the segment, for recovery after a crash), so append() still returns
+normally. The paint will reach the database, and the caller has already
+applied and broadcast it.
+"""
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import fcntl
+import glob
+import logging
+import os
+import struct
+import time
+from sqlalchemy import delete
+from database import CANVAS_BULK_DELETE, CANVAS_BULK_INSERT, AsyncSessionLocal, Canvas, SessionLocal, canvas_upsert
+from canvas_store import color_to_index, index_to_color
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ("sync", "group", "async")
+
+DURABILITY = os.environ.get("DOODLR_DURABILITY", "async")
+JOURNAL_PATH = os.environ.get("DOODLR_JOURNAL_PATH", "./doodlr.journal")
+GROUP_COMMIT_MS = int(os.environ.get("DOODLR_GROUP_COMMIT_MS", "50"))
+GROUP_COMMIT_MAX = int(os.environ.get("DOODLR_GROUP_COMMIT_MAX", "2048"))
+
+# x, y, palette index, paint time (Unix epoch seconds)
+RECORD = struct.Struct("<IIBd")
+
+Pixel = Tuple[int, int, str]
+
+
+def _read_records(path: str) -> List[Tuple[int, int, int, float]]:
+    """Decode a journal segment, ignoring a torn trailing record"""
+    with open(path, "rb") as f:
+        data = f.read()
+    usable = len(data) - len(data) % RECORD.size
+    return [RECORD.unpack_from(data, offset) for offset in range(0, usable, RECORD.size)]
+
+
+def _record_datetime(ts: float) -> datetime:
+    """Naive UTC datetime (as stored in the canvas table) for a record's epoch time"""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+class PaintJournal:
+    def __init__(self, path: str = JOURNAL_PATH, mode: str = DURABILITY,
+                 interval_ms: int = GROUP_COMMIT_MS, max_batch: int = GROUP_COMMIT_MAX):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode {mode!r}; expected one of {DURABILITY_MODES}")
+        self.base_path = path
+        self.path = f"{path}-{os.getpid()}"
+        # Segment handed to an in-progress (or failed) flush; replayed first on recovery
+        self.flushing_path = self.path + ".1"
+        self.lock_path = self.path + ".lock"
+        self.mode = mode
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self._pending: Dict[Tuple[int, int], Tuple[str, datetime]] = {}
+        self._waiters: List[asyncio.Future] = []
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._file = None
+        self._task = None
+        self._lock_file = None
+        # Called with the path of each segment once its pixels are committed
+        self.archive: Optional[Callable[[str], None]] = None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def _stale_segments(self) -> Tuple[List[List[str]], list]:
+        """Segment groups (flushing segment first) whose owner is gone, plus the
+        lock files now held for them. Also picks up the unsuffixed files written
+        by single-process versions."""
+        groups = [[self.base_path + ".1", self.base_path]]
+        held = []
+        for lock_path in glob.glob(glob.escape(self.base_path) + "-*.lock"):
+            if lock_path == self.lock_path and self._lock_file is not None:
+                continue
+            lock_file = open(lock_path, "ab")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue  # a live worker owns it
+            held.append(lock_file)
+            segment = lock_path[:-len(".lock")]
+            groups.append([segment + ".1", segment, lock_path])
+        return groups, held
+
+    def recover(self) -> int:
+        """Replay journal segments left by crashed processes. Returns pixels written."""
+        groups, held = self._stale_segments()
+        latest: Dict[Tuple[int, int], Tuple[int, float]] = {}
+        for group in groups:
+            for path in group:
+                if os.path.exists(path) and not path.endswith(".lock"):
+                    for x, y, index, ts in _read_records(path):
+                        # Segments from different workers interleave; newest paint wins
+                        previous = latest.get((x, y))
+                        if previous is None or ts >= previous[1]:
+                            latest[(x, y)] = (index, ts)
+        if latest:
+            painted = [
+                {
+                    "x": x,
+                    "y": y,
+                    "color": index_to_color(index),
+                    "created_at": _record_datetime(ts),
+                    "updated_at": _record_datetime(ts),
+                }
+                for (x, y), (index, ts) in latest.items() if index
+            ]
+            erased = [(x, y) for (x, y), (index, _) in latest.items() if not index]
+            with SessionLocal() as db:
+                if painted:
+                    db.execute(canvas_upsert(), painted)
+                if erased:
+                    db.connection().exec_driver_sql(CANVAS_BULK_DELETE, erased)
+                db.commit()
+            logger.info("Replayed %d journaled pixels", len(latest))
+        for group in groups:
+            for path in group:
+                if self.archive is not None and not path.endswith(".lock"):
+                    self.archive(path)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        for lock_file in held:
+            lock_file.close()
+        return len(latest)
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        # Bind the synchronization primitives to the loop that runs the flusher
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        if self._lock_file is None:
+            self._lock_file = open(self.lock_path, "ab")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._file = open(self.path, "ab")
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still queued and stop the background task"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+        self._file.close()
+        self._file = None
+        # Everything is committed; leave nothing for the next startup to replay
+        for path in (self.path, self.flushing_path, self.lock_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._lock_file.close()
+        self._lock_file = None
+
+    async def append(self, pixels: Iterable[Pixel]) -> None:
+        """Journal already-validated paints and wait as the durability mode requires"""
+        self.start()
+        ts = datetime.now(timezone.utc).timestamp()
+        now = _record_datetime(ts)
+        records = []
+        for x, y, color in pixels:
+            self._pending[(x, y)] = (color, now)
+            records.append(RECORD.pack(x, y, color_to_index(color), ts))
+        self._file.write(b"".join(records))
+        self._file.flush()
+
+        if self.mode == "sync":
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Commit failed; the paints stay queued for the next group commit")
+        elif self.mode == "group":
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            if len(self._pending) >= self.max_batch:
+                self._wake.set()
+            try:
+                await waiter
+            except Exception:
+                pass  # logged by the flusher, which retries the requeued paints
+        elif len(self._pending) >= self.max_batch:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Commit all queued pixels in one transaction. Returns pixels written."""
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            waiters, self._waiters = self._waiters, []
+            if not pending:
+                self._resolve(waiters)
+                return 0
+            self._rotate()
+            started = time.perf_counter()
+            try:
+                painted = [
+                    {"x": x, "y": y, "color": color, "created_at": ts, "updated_at": ts}
+                    for (x, y), (color, ts) in pending.items() if color
+                ]
+                erased = [(x, y) for (x, y), (color, _) in pending.items() if not color]
+                async with AsyncSessionLocal() as db:
+                    if painted:
+                        await db.execute(canvas_upsert(), painted)
+                    if erased:
+                        connection = await db.connection()
+                        await connection.exec_driver_sql(CANVAS_BULK_DELETE, erased)
+                    await db.commit()
+            except Exception as exc:
+                # Requeue without clobbering newer paints; the segment stays for recovery
+                for key, value in pending.items():
+                    self._pending.setdefault(key, value)
+                self._resolve(waiters, exc)
+                raise
+            metrics.PAINT_COMMIT_SECONDS.observe(time.perf_counter() - started)
+            metrics.PAINT_COMMIT_PIXELS.observe(len(pending))
+            if os.path.exists(self.flushing_path):
+                if self.archive is not None:
+                    # History file I/O; the lock keeps the segment in place meanwhile
+                    await asyncio.to_thread(self.archive, self.flushing_path)
+                os.remove(self.flushing_path)
+            self._resolve(waiters)
+            return len(pending)
+
+    async def clear(self, rows: List[tuple] = None) -> None:
+        """Drop queued paints and delete every pixel row. When `rows` are
+        given (CANVAS_BULK_INSERT tuples from a snapshot import) they are
+        inserted in the same transaction."""
+        async with self._lock:
+            waiters = self._drop_queued()
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(Canvas))
+                if rows:
+                    connection = await db.connection()
+                    await connection.exec_driver_sql(CANVAS_BULK_INSERT, rows)
+                await db.commit()
+            self._resolve(waiters)
+
+    async def discard(self) -> None:
+        """Drop queued paints and their records without committing them, for a
+        board cleared or replaced by another worker"""
+        async with self._lock:
+            self._resolve(self._drop_queued())
+
+    def _drop_queued(self) -> List[asyncio.Future]:
+        """Forget queued paints and truncate their segments; returns their waiters"""
+        self._pending.clear()
+        waiters, self._waiters = self._waiters, []
+        if self._file is not None:
+            self._file.truncate(0)
+        if os.path.exists(self.flushing_path):
+            os.remove(self.flushing_path)
+        return waiters
+
+    def _rotate(self) -> None:
+        """Hand the active segment to the flush and start a new one"""
+        if self._file is None:
+            return
+        self._file.close()
+        if os.path.exists(self.flushing_path):
+            # A previous flush failed; keep its records ahead of the new ones
+            with open(self.path, "rb") as src, open(self.flushing_path, "ab") as dst:
+                dst.write(src.read())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.flushing_path)
+        self._file = open(self.path, "ab")
+
+    @staticmethod
+    def _resolve(waiters: List[asyncio.Future], exc: Exception = None) -> None:
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._pending or self._waiters:
+                try:
+                    await self.flush()
+                except Exception:
+                    logger.exception("Group commit failed; will retry")
+
+
+paint_journal = PaintJournal()
@@ -1,6 +1,14 @@
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from routes import canvas
+from database import AsyncSessionLocal, async_engine, engine
+from canvas_store import canvas_store
+from journal import paint_journal
+from history import paint_history
+from realtime import manager
+from bus import bus
+import metrics
 from fastapi.staticfiles import StaticFiles
 import os
 import base64
@@ -23,6 +31,37 @@ app.add_middleware(
 # Include routers
 app.include_router(canvas.router)
 
+# Request latency and database timing (DOODLR_METRICS=0 disables all of it)
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(engine)
+    metrics.instrument_engine(async_engine.sync_engine)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.on_event("startup")
+async def start_canvas_services():
+    # Committed journal segments are kept as paint history instead of deleted
+    paint_journal.archive = paint_history.archive
+    # Replay paints journaled but not committed before the last shutdown or crash
+    paint_journal.recover()
+    # Reads are served from memory; load the persisted pixels once per process
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(canvas_store.load)
+    paint_history.start(canvas_store)
+    paint_journal.start()
+    manager.start()
+    await bus.start(canvas.handle_bus_event)
+
+@app.on_event("shutdown")
+async def stop_canvas_services():
+    await bus.stop()
+    await manager.stop()
+    await paint_journal.stop()
+    await paint_history.stop()
+
 # Simple dev-only Basic Auth for static admin dashboard
 ADMIN_USER = "admin"
 ADMIN_PASS = "evergreen"
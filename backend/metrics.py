@@ -0,0 +1,241 @@
+"""Prometheus-style metrics for the hot paths.
+
+A small in-process registry of counters, histograms and callback gauges,
+rendered in the Prometheus text exposition format by GET /metrics. Enabled
+by default; DOODLR_METRICS=0 skips the middleware, the SQL hooks and the
+/metrics route, and turns every observe()/inc() into a flag check.
+
+Per-request database activity is attributed through a context variable set
+by MetricsMiddleware, so queries issued while serving a request count toward
+that request's route; queries from background tasks (the journal flusher)
+only show up in the process-wide totals.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import os
+import time
+from sqlalchemy import event
+
+METRICS_ENABLED = os.environ.get("DOODLR_METRICS", "1") != "0"
+
+# Starlette appends the charset for text/* responses
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 50_000_000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 50, 100, 500, 1000, 5000)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        if METRICS_ENABLED:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # Per label set: non-cumulative bucket counts (+Inf last), sum
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total[0]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter read from a function at scrape time"""
+
+    def __init__(self, name: str, help: str, read: Callable[[], float], kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+
+    def collect(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {self.read()}"]
+
+
+REGISTRY: List = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def gauge(name: str, help: str, read: Callable[[], float]) -> CallbackMetric:
+    return register(CallbackMetric(name, help, read))
+
+
+def counter(name: str, help: str, read: Callable[[], float]) -> CallbackMetric:
+    """Counter kept elsewhere (e.g. a running total on a manager object)"""
+    return register(CallbackMetric(name, help, read, kind="counter"))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUEST_SECONDS = register(Histogram(
+    "doodlr_http_request_duration_seconds", "HTTP request latency by route",
+    labelnames=("method", "route", "status"),
+))
+HTTP_REQUEST_DB_QUERIES = register(Histogram(
+    "doodlr_http_request_db_queries", "Database statements executed per HTTP request",
+    buckets=COUNT_BUCKETS, labelnames=("route",),
+))
+HTTP_REQUEST_DB_SECONDS = register(Histogram(
+    "doodlr_http_request_db_seconds", "Time spent in database statements per HTTP request",
+    labelnames=("route",),
+))
+DB_QUERIES = register(Counter("doodlr_db_queries_total", "Database statements executed"))
+DB_QUERY_SECONDS = register(Counter("doodlr_db_query_seconds_total", "Time spent in database statements"))
+SVG_RENDER_SECONDS = register(Histogram(
+    "doodlr_svg_render_seconds", "Time to render a view as SVG", labelnames=("level",),
+))
+SVG_RENDER_BYTES = register(Histogram(
+    "doodlr_svg_render_bytes", "Size of rendered SVG views", buckets=SIZE_BUCKETS, labelnames=("level",),
+))
+PAINT_COMMIT_SECONDS = register(Histogram(
+    "doodlr_paint_commit_seconds", "Time to commit one journal group to the database",
+))
+PAINT_COMMIT_PIXELS = register(Histogram(
+    "doodlr_paint_commit_pixels", "Pixels written per journal group commit", buckets=COUNT_BUCKETS,
+))
+RATE_LIMITED = register(Counter(
+    "doodlr_rate_limited_total", "Requests rejected by admission control", labelnames=("reason",),
+))
+BROADCAST_FANOUT_SECONDS = register(Histogram(
+    "doodlr_broadcast_fanout_seconds", "Time to build and enqueue one broadcast tick for all clients",
+))
+
+
+class _RequestStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("doodlr_request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("doodlr_query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["doodlr_query_started"].pop()
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.inc(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+def instrument_engine(sync_engine) -> None:
+    """Count and time every statement run through an engine (pass async_engine.sync_engine for async)"""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing HTTP requests per route template"""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[Callable, str] = {}
+
+    def _route_label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        label = self._routes.get(endpoint)
+        if label is None:
+            label = "unmatched"
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint or getattr(route, "app", None) is endpoint:
+                    label = route.path
+                    break
+            self._routes[endpoint] = label
+        return label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = self._route_label(scope)
+            HTTP_REQUEST_SECONDS.observe(elapsed, scope["method"], route, str(status))
+            HTTP_REQUEST_DB_QUERIES.observe(stats.queries, route)
+            HTTP_REQUEST_DB_SECONDS.observe(stats.seconds, route)
@@ -1,6 +1,13 @@
 from typing import Dict, List, Tuple, Optional
 from pydantic import BaseModel
 from datetime import datetime
+import os
+
+# Levels of the 3^n hierarchy (DOODLR_CANVAS_DEPTH); the board is 3^depth pixels per side.
+# Wire formats carry coordinates as u16, which caps the depth at 10 (59,049 per side).
+CANVAS_DEPTH = int(os.environ.get("DOODLR_CANVAS_DEPTH", "6"))
+if not 2 <= CANVAS_DEPTH <= 10:
+    raise ValueError(f"DOODLR_CANVAS_DEPTH must be between 2 and 10, got {CANVAS_DEPTH}")
 
 class PixelData(BaseModel):
     x: int
@@ -18,6 +25,17 @@ class PaintRequest(BaseModel):
     y: int
     color: str
 
+class PaintRun(BaseModel):
+    """Horizontal run of `length` pixels starting at (x, y)"""
+    x: int
+    y: int
+    length: int
+    color: str
+
+class PaintBatchRequest(BaseModel):
+    pixels: List[PaintRequest] = []
+    runs: List[PaintRun] = []
+
 class ZoomRequest(BaseModel):
     level: int
     section_x: int
@@ -26,14 +44,15 @@ class ZoomRequest(BaseModel):
 class CanvasModel:
     """Business logic for the hierarchical canvas system"""
     
-    # Canvas dimensions (6-level system)
-    TOTAL_SIZE = 729  # 729x729 = 531,441 pixels total
-    LEVEL1_SECTION_SIZE = 243  # 243x243 pixels per Level 1 section
-    LEVEL2_SECTION_SIZE = 81   # 81x81 pixels per Level 2 section
-    LEVEL3_SECTION_SIZE = 27   # 27x27 pixels per Level 3 section
-    LEVEL4_SECTION_SIZE = 9    # 9x9 pixels per Level 4 section
-    LEVEL5_SECTION_SIZE = 3    # 3x3 pixels per Level 5 section
-    # Level 6 is individual pixels (size = 1)
+    # Canvas dimensions: a 3^DEPTH board in DEPTH levels. Level 1 shows the whole
+    # board as 3x3 sections; each level below zooms into one section of the level
+    # above, down to level DEPTH whose sections are single pixels.
+    DEPTH = CANVAS_DEPTH
+    MAX_LEVEL = DEPTH
+    TOTAL_SIZE = 3 ** DEPTH  # 729x729 = 531,441 pixels at the default depth of 6
+    
+    # Upper bound on pixels (after run expansion) accepted by one /paint/batch
+    MAX_BATCH_PIXELS = 4096
     
     # Available colors
     COLORS = [
@@ -41,47 +60,27 @@ class CanvasModel:
         "white", "black", "gray", "orange", "purple", "pink", "brown", "teal"
     ]
     
+    @staticmethod
+    def section_size(level: int) -> int:
+        """Pixels per side of one section at a level (243, 81, 27, 9, 3, 1 at depth 6)"""
+        return 3 ** (CanvasModel.DEPTH - level)
+    
+    @staticmethod
+    def view_size(level: int) -> int:
+        """Pixels per side of the 3x3 sections shown at a level"""
+        return 3 * CanvasModel.section_size(level)
+    
+    @staticmethod
+    def is_valid_level(level: int) -> bool:
+        return 1 <= level <= CanvasModel.MAX_LEVEL
+    
     @staticmethod
     def get_section_bounds(level: int, section_x: int, section_y: int) -> Tuple[int, int, int, int]:
         """Get the pixel bounds for a section at a given level"""
-        if level == 1:
-            # Level 1 - each section is 243x243 pixels
-            start_x = section_x * CanvasModel.LEVEL1_SECTION_SIZE
-            start_y = section_y * CanvasModel.LEVEL1_SECTION_SIZE
-            end_x = start_x + CanvasModel.LEVEL1_SECTION_SIZE - 1
-            end_y = start_y + CanvasModel.LEVEL1_SECTION_SIZE - 1
-        elif level == 2:
-            # Level 2 - each section is 81x81 pixels
-            start_x = section_x * CanvasModel.LEVEL2_SECTION_SIZE
-            start_y = section_y * CanvasModel.LEVEL2_SECTION_SIZE
-            end_x = start_x + CanvasModel.LEVEL2_SECTION_SIZE - 1
-            end_y = start_y + CanvasModel.LEVEL2_SECTION_SIZE - 1
-        elif level == 3:
-            # Level 3 - each section is 27x27 pixels
-            start_x = section_x * CanvasModel.LEVEL3_SECTION_SIZE
-            start_y = section_y * CanvasModel.LEVEL3_SECTION_SIZE
-            end_x = start_x + CanvasModel.LEVEL3_SECTION_SIZE - 1
-            end_y = start_y + CanvasModel.LEVEL3_SECTION_SIZE - 1
-        elif level == 4:
-            # Level 4 - each section is 9x9 pixels
-            start_x = section_x * CanvasModel.LEVEL4_SECTION_SIZE
-            start_y = section_y * CanvasModel.LEVEL4_SECTION_SIZE
-            end_x = start_x + CanvasModel.LEVEL4_SECTION_SIZE - 1
-            end_y = start_y + CanvasModel.LEVEL4_SECTION_SIZE - 1
-        elif level == 5:
-            # Level 5 - each section is 3x3 pixels
-            start_x = section_x * CanvasModel.LEVEL5_SECTION_SIZE
-            start_y = section_y * CanvasModel.LEVEL5_SECTION_SIZE
-            end_x = start_x + CanvasModel.LEVEL5_SECTION_SIZE - 1
-            end_y = start_y + CanvasModel.LEVEL5_SECTION_SIZE - 1
-        else:
-            # Level 6 - individual pixels
-            start_x = section_x
-            start_y = section_y
-            end_x = start_x
-            end_y = start_y
-            
-        return start_x, start_y, end_x, end_y
+        size = CanvasModel.section_size(level)
+        start_x = section_x * size
+        start_y = section_y * size
+        return start_x, start_y, start_x + size - 1, start_y + size - 1
     
     @staticmethod
     def get_sections_for_level(level: int) -> List[Tuple[int, int]]:
@@ -91,7 +90,7 @@ class CanvasModel:
         sections: List[Tuple[int, int]] = []
         
         if level == 1:
-            # 3x3 grid of sections (243x243 each)
+            # 3x3 grid of top-level sections
             for x in range(3):
                 for y in range(3):
                     sections.append((x, y))
@@ -101,6 +100,19 @@ class CanvasModel:
                     
         return sections
     
+    @staticmethod
+    def get_view_sections_for_pixel(x: int, y: int) -> List[Tuple[int, int, int]]:
+        """Get the (level, section_x, section_y) views that contain a pixel.
+        A view at level N is addressed by its parent section at level N-1,
+        matching the section_x/section_y query parameters of the endpoints.
+        Level 1 has a single view, keyed as (1, 0, 0).
+        """
+        views = [(1, 0, 0)]
+        for level in range(2, CanvasModel.MAX_LEVEL + 1):
+            parent_size = CanvasModel.section_size(level - 1)
+            views.append((level, x // parent_size, y // parent_size))
+        return views
+    
     @staticmethod
     def is_valid_pixel(x: int, y: int) -> bool:
         """Check if pixel coordinates are valid"""
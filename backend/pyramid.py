@@ -0,0 +1,142 @@
+"""Pre-aggregated mipmap pyramid over the 3^n canvas hierarchy.
+
+For every section size of the hierarchy above single pixels (3, 9, 27, 81
+and 243 at the default depth) the pyramid keeps a palette histogram and the
+dominant painted color of each block. A paint touches exactly one block per
+level, so zoomed-out views can be served without visiting the underlying
+pixels.
+
+Like the canvas store's chunks, blocks are stored in tiles allocated on the
+first paint inside them: unpainted regions hold no tiles and their blocks
+read as entirely unpainted.
+"""
+from array import array
+from typing import Dict, List, Tuple
+from models.canvas import CanvasModel
+
+# Histogram slots per block: index 0 counts unpainted pixels, 1..N the palette
+PALETTE_SLOTS = len(CanvasModel.COLORS) + 1
+
+# Section sizes of levels MAX_LEVEL - 1 .. 1, smallest first
+BLOCK_SIZES = tuple(CanvasModel.section_size(level) for level in range(CanvasModel.MAX_LEVEL - 1, 0, -1))
+
+
+class PyramidLevel:
+    """Histograms and dominant colors for one block size"""
+
+    def __init__(self, canvas_size: int, block_size: int, tile_size: int):
+        self.block_size = block_size
+        self.grid = canvas_size // block_size
+        self.area = block_size * block_size
+        # Narrowest counter that holds a whole block
+        self.typecode = "B" if self.area < 1 << 8 else "H" if self.area < 1 << 16 else "I"
+        # Blocks per tile side; a tile spans at least tile_size pixels
+        self.tile_blocks = max(1, tile_size // block_size)
+        self.tiles_per_side = self.grid // self.tile_blocks
+        self._counts: Dict[int, array] = {}
+        self._dominant: Dict[int, bytearray] = {}
+
+    def block_index(self, x: int, y: int) -> int:
+        return (y // self.block_size) * self.grid + x // self.block_size
+
+    def _locate(self, block: int) -> Tuple[int, int]:
+        """(tile, block within the tile) for a block index"""
+        by, bx = divmod(block, self.grid)
+        per = self.tile_blocks
+        return (by // per) * self.tiles_per_side + bx // per, (by % per) * per + bx % per
+
+    def dominant(self, block: int) -> int:
+        tile, local = self._locate(block)
+        dominant = self._dominant.get(tile)
+        return dominant[local] if dominant is not None else 0
+
+    def histogram(self, block: int) -> List[int]:
+        tile, local = self._locate(block)
+        counts = self._counts.get(tile)
+        if counts is None:
+            return [self.area] + [0] * (PALETTE_SLOTS - 1)
+        base = local * PALETTE_SLOTS
+        return list(counts[base:base + PALETTE_SLOTS])
+
+    def update(self, x: int, y: int, previous: int, current: int) -> None:
+        tile, local = self._locate(self.block_index(x, y))
+        counts = self._counts.get(tile)
+        if counts is None:
+            blocks = self.tile_blocks * self.tile_blocks
+            counts = self._counts[tile] = array(self.typecode, [self.area] + [0] * (PALETTE_SLOTS - 1)) * blocks
+            self._dominant[tile] = bytearray(blocks)
+        dominants = self._dominant[tile]
+        base = local * PALETTE_SLOTS
+        counts[base + previous] -= 1
+        counts[base + current] += 1
+        dominant = dominants[local]
+        if current and (not dominant or counts[base + current] > counts[base + dominant]):
+            dominants[local] = current
+        elif previous and previous == dominant:
+            # The leading color lost a pixel; rescan this block's histogram
+            best, best_count = 0, 0
+            for index in range(1, PALETTE_SLOTS):
+                if counts[base + index] > best_count:
+                    best, best_count = index, counts[base + index]
+            dominants[local] = best
+
+
+class MipmapPyramid:
+    """All pyramid levels for a canvas, keyed by block size"""
+
+    def __init__(self, canvas_size: int = CanvasModel.TOTAL_SIZE, tile_size: int = CanvasModel.TOTAL_SIZE):
+        self.canvas_size = canvas_size
+        self.tile_size = tile_size
+        self.levels: Dict[int, PyramidLevel] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        self.levels = {
+            block: PyramidLevel(self.canvas_size, block, self.tile_size)
+            for block in BLOCK_SIZES
+            if block <= self.canvas_size
+        }
+
+    def rebuild(self, chunks: Dict[Tuple[int, int], bytes], chunk_size: int) -> None:
+        """Recompute every level from the canvas store's chunks"""
+        self.reset()
+        blank = bytes(chunk_size)
+        levels = list(self.levels.values())
+        for (cx, cy), cells in chunks.items():
+            x0, y0 = cx * chunk_size, cy * chunk_size
+            for dy in range(chunk_size):
+                row = cells[dy * chunk_size:(dy + 1) * chunk_size]
+                if row == blank:
+                    continue
+                for dx, index in enumerate(row):
+                    if index:
+                        for level in levels:
+                            level.update(x0 + dx, y0 + dy, 0, index)
+
+    def update(self, x: int, y: int, previous: int, current: int) -> None:
+        if previous == current:
+            return
+        for level in self.levels.values():
+            level.update(x, y, previous, current)
+
+    def tiles(self, block_size: int, start_x: int, start_y: int, width: int, height: int) -> List[int]:
+        """Block indices (row-major) covering a pixel window aligned to block_size"""
+        level = self.levels[block_size]
+        bx0, by0 = start_x // block_size, start_y // block_size
+        cols, rows = width // block_size, height // block_size
+        blocks = []
+        for by in range(by0, by0 + rows):
+            for bx in range(bx0, bx0 + cols):
+                if 0 <= bx < level.grid and 0 <= by < level.grid:
+                    blocks.append(by * level.grid + bx)
+                else:
+                    blocks.append(-1)
+        return blocks
+
+    def dominant_window(self, block_size: int, start_x: int, start_y: int, width: int, height: int) -> bytes:
+        """Dominant palette index of each block of an aligned window, row-major (0 outside the board)"""
+        level = self.levels[block_size]
+        return bytes(
+            level.dominant(index) if index >= 0 else 0
+            for index in self.tiles(block_size, start_x, start_y, width, height)
+        )
@@ -0,0 +1,168 @@
+"""Admission control for paints and reports.
+
+Each client IP address (the first X-Forwarded-For hop with
+DOODLR_TRUST_PROXY=1) gets a token bucket held in memory; a paint costs one
+token per pixel. Paints sent over a WebSocket draw from the same bucket as
+HTTP paints from that address, so opening more sockets buys no extra rate.
+Buckets live in an insertion-ordered dict touched on every use, so idle
+clients fall off the front after DOODLR_LIMIT_TTL_S: state is O(active
+clients) and every check is O(1) amortized.
+
+DOODLR_PAINT_LIMIT selects the per-client policy:
+    bucket    (default) DOODLR_PAINT_RATE pixels/s, bursts of DOODLR_PAINT_BURST
+    cooldown  one pixel every DOODLR_PAINT_COOLDOWN_S seconds, r/place style
+    off       no per-client limit
+
+Independently, a global write budget sheds paints before the database
+writer falls behind: a shared bucket of DOODLR_GLOBAL_PAINT_RATE pixels/s
+(0 disables it) and a cap of DOODLR_WRITE_QUEUE_MAX pixels waiting in the
+journal for their group commit.
+
+Rejections surface as 429 with a Retry-After header.
+"""
+from collections import OrderedDict
+from typing import Optional
+import math
+import os
+import time
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+import metrics
+from models.canvas import CanvasModel
+
+PAINT_LIMIT_MODES = ("bucket", "cooldown", "off")
+
+PAINT_LIMIT = os.environ.get("DOODLR_PAINT_LIMIT", "bucket")
+PAINT_RATE = float(os.environ.get("DOODLR_PAINT_RATE", "50"))
+PAINT_BURST = float(os.environ.get("DOODLR_PAINT_BURST", "4096"))
+PAINT_COOLDOWN_S = float(os.environ.get("DOODLR_PAINT_COOLDOWN_S", "5"))
+GLOBAL_PAINT_RATE = float(os.environ.get("DOODLR_GLOBAL_PAINT_RATE", "0"))
+WRITE_QUEUE_MAX = int(os.environ.get("DOODLR_WRITE_QUEUE_MAX", "50000"))
+REPORT_RATE = float(os.environ.get("DOODLR_REPORT_RATE", "0.1"))
+REPORT_BURST = float(os.environ.get("DOODLR_REPORT_BURST", "5"))
+LIMIT_TTL_S = float(os.environ.get("DOODLR_LIMIT_TTL_S", "600"))
+# Take the client address from X-Forwarded-For (only behind a trusted reverse proxy)
+TRUST_PROXY = os.environ.get("DOODLR_TRUST_PROXY", "0") == "1"
+
+
+class TokenBucketLimiter:
+    """Token buckets per key: `rate` tokens/s refill up to `burst`"""
+
+    def __init__(self, rate: float, burst: float, ttl: float = LIMIT_TTL_S):
+        # A bucket that never refilled would still be reset by eviction; use
+        # DOODLR_PAINT_LIMIT=off (or a global rate of 0) to disable a limit instead
+        if rate <= 0 or burst <= 0:
+            raise ValueError(f"Token bucket needs a positive rate and burst, got rate={rate}, burst={burst}")
+        self.rate = rate
+        self.burst = burst
+        self.ttl = ttl
+        # key -> [tokens, last update]; least recently used first
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, key: str, cost: float = 1, now: float = None) -> float:
+        """Take `cost` tokens. Returns 0 when admitted, otherwise the seconds
+        until the bucket will hold enough (math.inf if it never can)."""
+        if now is None:
+            now = time.monotonic()
+        self._evict(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if cost > self.burst:
+            return math.inf
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / self.rate
+
+    def refund(self, key: str, cost: float = 1) -> None:
+        """Return tokens taken by an acquire whose request was rejected later on"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(self.burst, bucket[0] + cost)
+
+    def _evict(self, now: float) -> None:
+        # A bucket idle for `ttl` is full again (or soon will be); forgetting it is lossless
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < self.ttl:
+                break
+            del self._buckets[key]
+
+
+def _paint_limiter(mode: str = PAINT_LIMIT) -> Optional[TokenBucketLimiter]:
+    if mode not in PAINT_LIMIT_MODES:
+        raise ValueError(f"Unknown DOODLR_PAINT_LIMIT {mode!r}; expected one of {PAINT_LIMIT_MODES}")
+    if mode == "bucket":
+        return TokenBucketLimiter(PAINT_RATE, PAINT_BURST)
+    if mode == "cooldown":
+        if PAINT_COOLDOWN_S <= 0:
+            raise ValueError(f"DOODLR_PAINT_COOLDOWN_S must be positive, got {PAINT_COOLDOWN_S}")
+        return TokenBucketLimiter(1 / PAINT_COOLDOWN_S, 1)
+    return None
+
+
+paint_limiter = _paint_limiter()
+# The global burst always fits one full batch, so a large batch is delayed rather than refused
+global_paint_limiter = (
+    TokenBucketLimiter(GLOBAL_PAINT_RATE, max(GLOBAL_PAINT_RATE, CanvasModel.MAX_BATCH_PIXELS))
+    if GLOBAL_PAINT_RATE > 0 else None
+)
+report_limiter = TokenBucketLimiter(REPORT_RATE, REPORT_BURST)
+
+
+def client_key(request: HTTPConnection) -> str:
+    """Rate-limit key for an HTTP request or WebSocket"""
+    if TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _reject(reason: str, detail: str, retry_after: float) -> HTTPException:
+    metrics.RATE_LIMITED.inc(1, reason)
+    headers = {}
+    if retry_after != math.inf:
+        headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return HTTPException(status_code=429, detail=detail, headers=headers)
+
+
+def check_paint(key: str, pixels: int, queued: int) -> None:
+    """Admit a paint of `pixels` pixels from `key` or raise 429.
+    `queued` is the number of pixels waiting for the next group commit."""
+    if queued + pixels > WRITE_QUEUE_MAX:
+        raise _reject("write_queue", "Server is busy, try again shortly", 1)
+    if paint_limiter is not None:
+        wait = paint_limiter.acquire(key, pixels)
+        if wait == math.inf:
+            raise _reject("client", f"Paints are limited to {paint_limiter.burst:g} pixels at a time", wait)
+        if wait:
+            raise _reject("client", "Painting too fast, slow down", wait)
+    if global_paint_limiter is not None:
+        wait = global_paint_limiter.acquire("*", pixels)
+        if wait:
+            if paint_limiter is not None:
+                paint_limiter.refund(key, pixels)
+            raise _reject("global", "Server is busy, try again shortly", wait)
+
+
+def check_report(key: str) -> None:
+    wait = report_limiter.acquire(key)
+    if wait:
+        raise _reject("report", "Too many reports, try again later", wait)
+
+
+def stats() -> dict:
+    return {
+        "paint_limit": PAINT_LIMIT,
+        "tracked_paint_clients": len(paint_limiter) if paint_limiter is not None else 0,
+        "tracked_report_clients": len(report_limiter),
+    }
@@ -0,0 +1,277 @@
+"""WebSocket connection management and viewport-scoped fan-out.
+
+Clients subscribe over /ws to the (level, section_x, section_y) view they are
+looking at. The manager keeps an index from view key to subscribed sockets,
+so a paint is delivered only to clients whose view contains the pixel: the
+DEPTH views (one per level) that contain it are looked up
+(CanvasModel.get_view_sections_for_pixel) and only subscribers of those views
+get it. Connections that never subscribe keep receiving every update, as
+before.
+
+Sending never blocks the caller. Every connection owns a bounded outbound
+queue drained by its own writer task; broadcasts only enqueue. When a slow
+client's queue is full the overflow policy (DOODLR_WS_OVERFLOW) either drops
+the oldest queued message or coalesces the backlog into a single "resync"
+message telling the client to refetch its view. Sockets whose send fails are
+evicted.
+
+Pixel updates are not sent one message per paint. Paints are gathered for
+one broadcast tick (DOODLR_BROADCAST_TICK_MS), deduplicated by coordinate,
+and each interested client gets a single delta frame per tick with the
+changed cells in its view:
+
+    {"type": "delta", "tick": n, "pixels": [[x, y, color], ...]}
+
+or, for clients that subscribed with "format": "bin", the binary frame
+described in wire.py.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+import asyncio
+import json
+import logging
+import os
+import time
+from fastapi import WebSocket
+from canvas_store import color_to_index
+from models.canvas import CanvasModel
+from wire import encode_delta_frame
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ViewKey = Tuple[int, int, int]
+Message = Union[str, bytes]
+
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce")
+
+WS_QUEUE_SIZE = int(os.environ.get("DOODLR_WS_QUEUE_SIZE", "256"))
+WS_OVERFLOW = os.environ.get("DOODLR_WS_OVERFLOW", "drop_oldest")
+BROADCAST_TICK_MS = int(os.environ.get("DOODLR_BROADCAST_TICK_MS", "100"))
+
+RESYNC_MESSAGE = json.dumps({"type": "resync"})
+
+
+def normalize_view(level: int, section_x: int, section_y: int) -> ViewKey:
+    """Level 1 has a single view; its section parameters are ignored"""
+    if level == 1:
+        return (1, 0, 0)
+    return (level, section_x, section_y)
+
+
+class ClientQueue:
+    """Bounded outbound queue and writer task for one connection"""
+
+    def __init__(self, websocket: WebSocket, maxsize: int, overflow: str):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.overflow = overflow
+        self.dropped = 0
+        # Delta frames as binary instead of JSON
+        self.binary = False
+        self.task: asyncio.Task = None
+
+    def put(self, message: Message) -> int:
+        """Enqueue without waiting. Returns the number of messages dropped."""
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+            return 0
+        if self.overflow == "coalesce":
+            # Replace the whole backlog; the client refetches instead of replaying it
+            dropped = self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_MESSAGE)
+        else:
+            dropped = 1
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+        self.dropped += dropped
+        return dropped
+
+
+# WebSocket connection manager
+class ConnectionManager:
+    def __init__(self, queue_size: int = WS_QUEUE_SIZE, overflow: str = WS_OVERFLOW,
+                 tick_ms: int = BROADCAST_TICK_MS):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}; expected one of {OVERFLOW_POLICIES}")
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.clients: Dict[WebSocket, ClientQueue] = {}
+        # view key -> sockets viewing it, and the reverse mapping per socket
+        self.subscriptions: Dict[ViewKey, Set[WebSocket]] = {}
+        self.views: Dict[WebSocket, ViewKey] = {}
+        self.dropped_total = 0
+        self.evicted_total = 0
+        self.tick_interval = tick_ms / 1000
+        self.tick = 0
+        # Paints gathered for the next tick, deduplicated by coordinate
+        self._pending: Dict[Tuple[int, int], str] = {}
+        self._tick_task: Optional[asyncio.Task] = None
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        client = ClientQueue(websocket, self.queue_size, self.overflow)
+        client.task = asyncio.get_running_loop().create_task(self._writer(client))
+        self.clients[websocket] = client
+
+    def disconnect(self, websocket: WebSocket):
+        self.unsubscribe(websocket)
+        client = self.clients.pop(websocket, None)
+        if client is not None and client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def subscribe(self, websocket: WebSocket, view: ViewKey, binary: bool = False) -> None:
+        """Point a connection at a single view, replacing any previous one"""
+        self.unsubscribe(websocket)
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.binary = binary
+        self.views[websocket] = view
+        self.subscriptions.setdefault(view, set()).add(websocket)
+
+    def unsubscribe(self, websocket: WebSocket) -> None:
+        view = self.views.pop(websocket, None)
+        if view is None:
+            return
+        subscribers = self.subscriptions.get(view)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.subscriptions[view]
+
+    def send_personal_message(self, message: Message, websocket: WebSocket):
+        self._enqueue([websocket], message)
+
+    def broadcast(self, message: Message):
+        self._enqueue(list(self.clients), message)
+
+    def start(self) -> None:
+        if self._tick_task is None:
+            self._tick_task = asyncio.get_running_loop().create_task(self._run_ticks())
+
+    async def stop(self) -> None:
+        if self._tick_task is None:
+            return
+        self._tick_task.cancel()
+        try:
+            await self._tick_task
+        except asyncio.CancelledError:
+            pass
+        self._tick_task = None
+        self.flush_tick()
+
+    def queue_pixels(self, pixels: Iterable[Tuple[int, int, str]]) -> None:
+        """Record paints for the next delta frame (later paints of a cell win)"""
+        self.start()
+        for x, y, color in pixels:
+            self._pending[(x, y)] = color
+
+    def discard_pending(self) -> None:
+        self._pending.clear()
+
+    def flush_tick(self) -> None:
+        """Send one delta frame per interested client for everything painted this tick"""
+        if not self._pending:
+            return
+        started = time.perf_counter()
+        pending, self._pending = self._pending, {}
+        self.tick += 1
+        cells = [(x, y, color) for (x, y), color in pending.items()]
+
+        # Bucket cells by subscribed view; only views someone is watching matter
+        by_view: Dict[ViewKey, List[Tuple[int, int, str]]] = {}
+        if self.subscriptions:
+            for cell in cells:
+                for view in CanvasModel.get_view_sections_for_pixel(cell[0], cell[1]):
+                    if view in self.subscriptions:
+                        by_view.setdefault(view, []).append(cell)
+        for view, view_cells in by_view.items():
+            self._send_frame(self.subscriptions[view], view_cells)
+
+        unsubscribed = [ws for ws in self.clients if ws not in self.views]
+        if unsubscribed:
+            self._send_frame(unsubscribed, cells)
+        metrics.BROADCAST_FANOUT_SECONDS.observe(time.perf_counter() - started)
+
+    def _send_frame(self, connections: Iterable[WebSocket], cells: List[Tuple[int, int, str]]) -> None:
+        text_frame = None
+        binary_frame = None
+        for websocket in connections:
+            client = self.clients.get(websocket)
+            if client is None:
+                continue
+            if client.binary:
+                if binary_frame is None:
+                    binary_frame = encode_delta_frame(
+                        self.tick, ((x, y, color_to_index(color)) for x, y, color in cells)
+                    )
+                message = binary_frame
+            else:
+                if text_frame is None:
+                    text_frame = json.dumps({"type": "delta", "tick": self.tick, "pixels": cells})
+                message = text_frame
+            self.dropped_total += client.put(message)
+
+    async def _run_ticks(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                self.flush_tick()
+            except Exception:
+                logger.exception("Broadcast tick failed")
+
+    def stats(self) -> dict:
+        depths = [client.queue.qsize() for client in self.clients.values()]
+        return {
+            "connections": len(self.clients),
+            "subscribed": len(self.views),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "dropped_messages": self.dropped_total,
+            "evicted_connections": self.evicted_total,
+            "pending_pixels": len(self._pending),
+            "tick": self.tick,
+        }
+
+    def _enqueue(self, connections: Iterable[WebSocket], message: Message):
+        for websocket in connections:
+            client = self.clients.get(websocket)
+            if client is not None:
+                self.dropped_total += client.put(message)
+
+    async def _writer(self, client: ClientQueue):
+        websocket = client.websocket
+        try:
+            while True:
+                message = await client.queue.get()
+                if isinstance(message, bytes):
+                    await websocket.send_bytes(message)
+                else:
+                    await websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Dead or broken socket: stop queueing for it
+            if websocket in self.clients:
+                self.evicted_total += 1
+                self.disconnect(websocket)
+                try:
+                    await websocket.close()
+                except Exception:
+                    pass
+
+
+manager = ConnectionManager()
+
+metrics.gauge("doodlr_websocket_connections", "Open WebSocket connections", lambda: len(manager.clients))
+metrics.gauge("doodlr_websocket_queued_messages", "Messages waiting in WebSocket send queues",
+              lambda: sum(client.queue.qsize() for client in manager.clients.values()))
+metrics.counter("doodlr_websocket_dropped_messages_total", "Messages dropped by the overflow policy",
+                lambda: manager.dropped_total)
+metrics.counter("doodlr_websocket_evicted_connections_total", "Connections evicted after a failed send",
+                lambda: manager.evicted_total)
@@ -0,0 +1,205 @@
+"""Raster output for rendered canvas views and the render cache.
+
+Views are encoded straight from the palette-index buffer in canvas_store:
+`raw` is the row-major index bytes themselves, `png` wraps them in an
+8-bit indexed-color PNG (decode_indexed_png reads such files back, e.g. for
+snapshot imports). Encoded outputs are kept in a bounded LRU keyed by
+(level, section_x, section_y) and dropped when a pixel inside the view changes.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import struct
+import zlib
+from models.canvas import CanvasModel
+
+RENDER_FORMATS = ("svg", "png", "raw")
+
+MEDIA_TYPES = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+    "raw": "application/octet-stream",
+}
+
+ViewKey = Tuple[int, int, int]
+
+
+def color_to_hex(color: str) -> str:
+    mapping = {
+        "red": "#FF0000",
+        "green": "#00FF00",
+        "blue": "#0000FF",
+        "yellow": "#FFFF00",
+        "cyan": "#00FFFF",
+        "magenta": "#FF00FF",
+        "white": "#FFFFFF",
+        "black": "#000000",
+        "gray": "#808080",
+        "orange": "#FFA500",
+        "purple": "#800080",
+        "pink": "#FFC0CB",
+        "brown": "#A52A2A",
+        "teal": "#008080",
+    }
+    return mapping.get(color, "#000000")
+
+
+# Palette for raster output: index 0 is the unpainted background, then COLORS in order
+RENDER_PALETTE = ["#f0f0f0"] + [color_to_hex(color) for color in CanvasModel.COLORS]
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+def _hex_to_rgb(color: str) -> bytes:
+    return bytes.fromhex(color.lstrip("#")[:6])
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _png_head(width: int, height: int, palette: Sequence[str], text: Dict[str, str] = None) -> bytes:
+    """Signature, IHDR, PLTE and tEXt chunks of an 8-bit indexed PNG"""
+    header = struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)
+    plte = b"".join(_hex_to_rgb(color) for color in palette)
+    text_chunks = [
+        _png_chunk(b"tEXt", key.encode("latin-1") + b"\x00" + value.encode("latin-1"))
+        for key, value in (text or {}).items()
+    ]
+    return b"".join([PNG_SIGNATURE, _png_chunk(b"IHDR", header), _png_chunk(b"PLTE", plte), *text_chunks])
+
+
+def encode_indexed_png(indices: bytes, width: int, height: int, palette: Sequence[str],
+                       text: Dict[str, str] = None) -> bytes:
+    """Encode row-major palette indices as an 8-bit indexed PNG.
+    `palette` holds "#RRGGBB" strings; entry i is used for index i.
+    `text` entries are stored as tEXt chunks.
+    """
+    # Each scanline is prefixed with filter type 0 (none)
+    scanlines = b"".join(
+        b"\x00" + indices[row * width:(row + 1) * width] for row in range(height)
+    )
+    return b"".join([
+        _png_head(width, height, palette, text),
+        _png_chunk(b"IDAT", zlib.compress(scanlines, 6)),
+        _png_chunk(b"IEND", b""),
+    ])
+
+
+def iter_indexed_png(bands: Iterable[bytes], width: int, height: int, palette: Sequence[str],
+                     text: Dict[str, str] = None) -> Iterator[bytes]:
+    """encode_indexed_png, piece by piece, for images too large to hold encoded.
+    `bands` yields the rows top to bottom, any whole number of rows at a time;
+    each band's compressed scanlines go out as their own IDAT chunk."""
+    yield _png_head(width, height, palette, text)
+    compressor = zlib.compressobj(6)
+    for band in bands:
+        scanlines = b"".join(b"\x00" + band[offset:offset + width] for offset in range(0, len(band), width))
+        data = compressor.compress(scanlines)
+        if data:
+            yield _png_chunk(b"IDAT", data)
+    yield _png_chunk(b"IDAT", compressor.flush()) + _png_chunk(b"IEND", b"")
+
+
+def _unfilter(scanlines: bytes, width: int, height: int) -> bytearray:
+    """Undo PNG scanline filters for 1 byte per pixel"""
+    out = bytearray(width * height)
+    previous = bytes(width)
+    for row in range(height):
+        offset = row * (width + 1)
+        filter_type = scanlines[offset]
+        line = bytearray(scanlines[offset + 1:offset + 1 + width])
+        if filter_type == 1:
+            for i in range(1, width):
+                line[i] = (line[i] + line[i - 1]) & 0xFF
+        elif filter_type == 2:
+            line = bytearray((a + b) & 0xFF for a, b in zip(line, previous))
+        elif filter_type == 3:
+            for i in range(width):
+                left = line[i - 1] if i else 0
+                line[i] = (line[i] + ((left + previous[i]) >> 1)) & 0xFF
+        elif filter_type == 4:
+            for i in range(width):
+                a = line[i - 1] if i else 0
+                b = previous[i]
+                c = previous[i - 1] if i else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                predictor = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+                line[i] = (line[i] + predictor) & 0xFF
+        elif filter_type != 0:
+            raise ValueError(f"Unknown PNG filter type {filter_type}")
+        out[row * width:(row + 1) * width] = line
+        previous = bytes(line)
+    return out
+
+
+def decode_indexed_png(data: bytes) -> Tuple[bytearray, int, int, List[str], Dict[str, str]]:
+    """Decode a non-interlaced 8-bit indexed PNG into (indices, width, height, palette, text).
+    Raises ValueError for anything else."""
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("Not a PNG file")
+    offset = len(PNG_SIGNATURE)
+    header = None
+    palette: List[str] = []
+    text: Dict[str, str] = {}
+    idat: List[bytes] = []
+    while offset + 8 <= len(data):
+        length, tag = struct.unpack_from(">I4s", data, offset)
+        chunk = data[offset + 8:offset + 8 + length]
+        if len(chunk) != length:
+            raise ValueError("Truncated PNG chunk")
+        offset += 12 + length
+        if tag == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif tag == b"PLTE":
+            palette = ["#" + chunk[i:i + 3].hex().upper() for i in range(0, len(chunk), 3)]
+        elif tag == b"tEXt":
+            key, _, value = chunk.partition(b"\x00")
+            text[key.decode("latin-1")] = value.decode("latin-1")
+        elif tag == b"IDAT":
+            idat.append(chunk)
+        elif tag == b"IEND":
+            break
+    if header is None:
+        raise ValueError("PNG has no IHDR chunk")
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if (bit_depth, color_type, interlace) != (8, 3, 0):
+        raise ValueError("Only non-interlaced 8-bit indexed PNGs are supported")
+    try:
+        scanlines = zlib.decompress(b"".join(idat))
+    except zlib.error as exc:
+        raise ValueError("Corrupt PNG image data") from exc
+    if len(scanlines) != (width + 1) * height:
+        raise ValueError("PNG image data has the wrong size")
+    return _unfilter(scanlines, width, height), width, height, palette, text
+
+
+class RenderCache:
+    """Bounded LRU of encoded outputs per view, all formats of a view evicted together"""
+
+    def __init__(self, max_views: int = 512):
+        self.max_views = max_views
+        self._views: "OrderedDict[ViewKey, Dict[str, bytes]]" = OrderedDict()
+
+    def get(self, view: ViewKey, fmt: str) -> Optional[bytes]:
+        outputs = self._views.get(view)
+        if outputs is None or fmt not in outputs:
+            return None
+        self._views.move_to_end(view)
+        return outputs[fmt]
+
+    def put(self, view: ViewKey, fmt: str, content: bytes) -> None:
+        self._views.setdefault(view, {})[fmt] = content
+        self._views.move_to_end(view)
+        while len(self._views) > self.max_views:
+            self._views.popitem(last=False)
+
+    def invalidate(self, view: ViewKey) -> None:
+        self._views.pop(view, None)
+
+    def clear(self) -> None:
+        self._views.clear()
+
+
+render_cache = RenderCache()
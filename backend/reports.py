@@ -0,0 +1,194 @@
+"""Content reports, persisted and aggregated for moderation.
+
+A report names a section of the 3^n hierarchy: section (x, y) of a level,
+with 3^level sections per side (the frontend reports the top-left section
+of the view being shown). Repeat reports of a section merge into its open
+report, which counts them and keeps the latest reason. Every report also
+increments the open-report count of the section containing it at each
+level above, so hot spots are found by walking those counts down from the
+root instead of scanning reports. Resolving a report takes its count back
+out.
+
+All state lives in the database, so every worker sees the same reports.
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import Report, ReportCount
+from models.canvas import CanvasModel
+
+REPORT_ORDERS = ("recent", "count")
+REPORT_STATUSES = ("open", "resolved", "all")
+MAX_REASON_LENGTH = 500
+MAX_PAGE_SIZE = 200
+
+
+def sections_per_side(level: int) -> int:
+    return 3 ** level
+
+
+def section_bounds(level: int, x: int, y: int) -> Tuple[int, int, int, int]:
+    """Inclusive pixel bounds of section (x, y) at `level`"""
+    size = CanvasModel.TOTAL_SIZE // sections_per_side(level)
+    return x * size, y * size, (x + 1) * size - 1, (y + 1) * size - 1
+
+
+def is_valid_section(level: int, x: int, y: int) -> bool:
+    return CanvasModel.is_valid_level(level) and 0 <= x < sections_per_side(level) and 0 <= y < sections_per_side(level)
+
+
+def _ancestors(level: int, x: int, y: int) -> List[Tuple[int, int, int]]:
+    """The section itself and the one containing it at every level above"""
+    return [(k, x // 3 ** (level - k), y // 3 ** (level - k)) for k in range(1, level + 1)]
+
+
+def _counts_upsert(delta: int):
+    stmt = sqlite_insert(ReportCount)
+    return stmt.on_conflict_do_update(
+        index_elements=[ReportCount.level, ReportCount.section_x, ReportCount.section_y],
+        set_={"reports": ReportCount.reports + delta},
+    )
+
+
+async def record_report(db: AsyncSession, level: int, x: int, y: int, reason: str) -> int:
+    """Store a report (merging into the section's open report); returns the report id"""
+    now = datetime.utcnow()
+    start_x, start_y, end_x, end_y = section_bounds(level, x, y)
+    stmt = sqlite_insert(Report).values(
+        level=level, x=x, y=y, start_x=start_x, start_y=start_y, end_x=end_x, end_y=end_y,
+        reason=reason[:MAX_REASON_LENGTH], count=1, created_at=now, last_reported_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Report.level, Report.x, Report.y],
+        index_where=Report.resolved_at.is_(None),
+        set_={
+            "count": Report.count + 1,
+            "reason": stmt.excluded.reason,
+            "last_reported_at": stmt.excluded.last_reported_at,
+        },
+    ).returning(Report.id)
+    report_id = (await db.execute(stmt)).scalar_one()
+    await db.execute(_counts_upsert(1), [
+        {"level": k, "section_x": sx, "section_y": sy, "reports": 1} for k, sx, sy in _ancestors(level, x, y)
+    ])
+    await db.commit()
+    return report_id
+
+
+async def resolve_report(db: AsyncSession, report_id: int) -> Optional[dict]:
+    """Close an open report and remove it from the section counts; None if not open"""
+    report = (await db.execute(
+        update(Report)
+        .where(Report.id == report_id, Report.resolved_at.is_(None))
+        .values(resolved_at=datetime.utcnow())
+        .returning(Report)
+    )).scalar_one_or_none()
+    if report is None:
+        return None
+    for k, sx, sy in _ancestors(report.level, report.x, report.y):
+        await db.execute(
+            update(ReportCount)
+            .where(ReportCount.level == k, ReportCount.section_x == sx, ReportCount.section_y == sy)
+            .values(reports=ReportCount.reports - report.count)
+        )
+    await db.execute(delete(ReportCount).where(ReportCount.reports <= 0))
+    await db.commit()
+    return serialize_report(report)
+
+
+async def clear_reports(db: AsyncSession) -> None:
+    await db.execute(delete(Report))
+    await db.execute(delete(ReportCount))
+    await db.commit()
+
+
+def _cursor(report: Report, order: str) -> str:
+    value = report.count if order == "count" else report.last_reported_at.isoformat()
+    return f"{value}|{report.id}"
+
+
+def _parse_cursor(cursor: str, order: str) -> tuple:
+    """(sort value, id) from a cursor; ValueError if malformed"""
+    value, report_id = cursor.rsplit("|", 1)
+    return (int(value) if order == "count" else datetime.fromisoformat(value)), int(report_id)
+
+
+async def list_reports(db: AsyncSession, status: str = "open", order: str = "recent", level: int = None,
+                       bounds: Tuple[int, int, int, int] = None, limit: int = 50,
+                       cursor: str = None) -> Tuple[List[dict], Optional[str]]:
+    """One page of reports, newest (or most reported) first, and the cursor of the next page.
+    `bounds` (x0, y0, x1, y1) keeps reports whose section starts inside the rectangle."""
+    sort = Report.count if order == "count" else Report.last_reported_at
+    query = select(Report)
+    if status == "open":
+        query = query.where(Report.resolved_at.is_(None))
+    elif status == "resolved":
+        query = query.where(Report.resolved_at.is_not(None))
+    if level is not None:
+        query = query.where(Report.level == level)
+    if bounds is not None:
+        x0, y0, x1, y1 = bounds
+        query = query.where(Report.start_x.between(x0, x1), Report.start_y.between(y0, y1))
+    if cursor:
+        query = query.where(tuple_(sort, Report.id) < tuple_(*_parse_cursor(cursor, order)))
+    # Keyset pagination: one extra row tells whether there is a next page
+    rows = (await db.execute(query.order_by(sort.desc(), Report.id.desc()).limit(limit + 1))).scalars().all()
+    next_cursor = _cursor(rows[limit - 1], order) if len(rows) > limit else None
+    return [serialize_report(report) for report in rows[:limit]], next_cursor
+
+
+async def section_counts(db: AsyncSession, level: int, parent_x: int, parent_y: int) -> List[dict]:
+    """Open-report counts of the 3x3 sections of `level` inside parent section
+    (parent_x, parent_y) of the level above (ignored at level 1)"""
+    if level == 1:
+        parent_x, parent_y = 0, 0
+    x0, y0 = parent_x * 3, parent_y * 3
+    rows = await db.execute(
+        select(ReportCount.section_x, ReportCount.section_y, ReportCount.reports).where(
+            ReportCount.level == level,
+            ReportCount.section_x.between(x0, x0 + 2),
+            ReportCount.section_y.between(y0, y0 + 2),
+        )
+    )
+    counts = {(sx, sy): reports for sx, sy, reports in rows}
+    return [
+        _serialize_section(level, sx, sy, counts.get((sx, sy), 0))
+        for sy in range(y0, y0 + 3) for sx in range(x0, x0 + 3)
+    ]
+
+
+async def hotspots(db: AsyncSession, level: int, limit: int) -> List[dict]:
+    """Sections of `level` with the most open reports"""
+    rows = await db.execute(
+        select(ReportCount.section_x, ReportCount.section_y, ReportCount.reports)
+        .where(ReportCount.level == level, ReportCount.reports > 0)
+        .order_by(ReportCount.reports.desc())
+        .limit(limit)
+    )
+    return [_serialize_section(level, sx, sy, reports) for sx, sy, reports in rows]
+
+
+def _serialize_section(level: int, x: int, y: int, reports: int) -> dict:
+    x0, y0, x1, y1 = section_bounds(level, x, y)
+    return {"level": level, "x": x, "y": y, "reports": reports, "bounds": {"x0": x0, "y0": y0, "x1": x1, "y1": y1}}
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() + "Z" if value else None
+
+
+def serialize_report(report: Report) -> dict:
+    return {
+        "id": report.id,
+        "level": report.level,
+        "x": report.x,
+        "y": report.y,
+        "bounds": {"x0": report.start_x, "y0": report.start_y, "x1": report.end_x, "y1": report.end_y},
+        "reason": report.reason,
+        "count": report.count,
+        "created_at": _timestamp(report.created_at),
+        "last_reported_at": _timestamp(report.last_reported_at),
+        "resolved_at": _timestamp(report.resolved_at),
+    }
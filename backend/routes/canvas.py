@@ -1,16 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import Response
-from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import List, Tuple
-from database import get_db, Canvas
-from models.canvas import CanvasModel, PixelData, CanvasSection, PaintRequest, ZoomRequest
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import metrics
+import ratelimit
+import reports
+from sqlalchemy import func, select
+from database import AsyncSessionLocal, Canvas, SessionLocal
+from journal import paint_journal
+from realtime import RESYNC_MESSAGE, manager, normalize_view
+from bus import bus
+from canvas_store import CanvasStore, canvas_store, INDEX_TO_COLOR
+from pyramid import BLOCK_SIZES, PALETTE_SLOTS
+from wire import (BINARY_MEDIA_TYPE, decode_paint_frame, encode_ack_frame, encode_history_frame, encode_section_window,
+                  peek_paint_sequence, wants_binary)
+from rendering import RENDER_FORMATS, RENDER_PALETTE, MEDIA_TYPES, encode_indexed_png, render_cache
+from history import format_time, history_now, paint_history, parse_time
+from snapshot import (SNAPSHOT_FORMATS, decode_snapshot, iter_snapshot, parse_timestamp, reset_history, snapshot_metadata,
+                      snapshot_rows)
+from versions import change_ring, etag_matches, section_versions
+from models.canvas import CanvasModel, PaintRequest, PaintBatchRequest, ZoomRequest
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 
 router = APIRouter()
 
-# In-memory reports store (simple MVP; replace with DB later)
-REPORTS: List[dict] = []
+logger = logging.getLogger(__name__)
+
+# Paints one socket may have awaiting their ack before the server stops reading from it
+WS_MAX_INFLIGHT_PAINTS = int(os.environ.get("DOODLR_WS_MAX_INFLIGHT_PAINTS", "64"))
+
+# Paints per NDJSON line or binary frame of a GET /history replay
+HISTORY_CHUNK = 4096
+
+# Widest view (pixels per side) served pixel by pixel; on deeper boards the
+# top levels are only available downsampled, through /render and /overview
+MAX_VIEW_SIZE = int(os.environ.get("DOODLR_MAX_VIEW_SIZE", "729"))
 
 # Basic auth for admin endpoints (development only)
 security = HTTPBasic()
@@ -20,421 +49,557 @@ def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
         raise HTTPException(status_code=401, detail="Unauthorized", headers={"WWW-Authenticate": "Basic"})
     return True
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                pass
-
-manager = ConnectionManager()
-
 # --- SVG rendering helpers ---
 
-def _level_base_section_size(level: int) -> int:
-    if level == 1:
-        return CanvasModel.LEVEL1_SECTION_SIZE
-    if level == 2:
-        return CanvasModel.LEVEL2_SECTION_SIZE
-    if level == 3:
-        return CanvasModel.LEVEL3_SECTION_SIZE
-    if level == 4:
-        return CanvasModel.LEVEL4_SECTION_SIZE
-    if level == 5:
-        return CanvasModel.LEVEL5_SECTION_SIZE
-    return 1
+def _check_level(level: int) -> None:
+    if not CanvasModel.is_valid_level(level):
+        raise HTTPException(status_code=400, detail=f"Level must be between 1 and {CanvasModel.MAX_LEVEL}")
 
 
 def _area_bounds_for_level(level: int, section_x: int = None, section_y: int = None) -> Tuple[int, int, int, int]:
     """Return (start_x, start_y, span_x, span_y) covering the 3x3 grid shown at the given level."""
-    if level < 1 or level > 6:
-        raise HTTPException(status_code=400, detail="Level must be between 1 and 6")
-
+    _check_level(level)
+    span = CanvasModel.view_size(level)
     if level == 1:
-        base = CanvasModel.LEVEL1_SECTION_SIZE
-        return 0, 0, base * 3, base * 3
+        return 0, 0, span, span
 
-    # For levels 2..5 section_x/y are required and indicate the parent section at the previous level
-    parent_size = _level_base_section_size(level - 1)
+    # Below level 1 section_x/y are required and indicate the parent section at the previous level
+    parent_size = CanvasModel.section_size(level - 1)
     if section_x is None or section_y is None:
         raise HTTPException(status_code=400, detail="section_x and section_y required for this level")
-    start_x = section_x * parent_size
-    start_y = section_y * parent_size
-    base = _level_base_section_size(level)
-    return start_x, start_y, base * 3, base * 3
-
-
-def _color_to_hex(color: str) -> str:
-    mapping = {
-        "red": "#FF0000",
-        "green": "#00FF00",
-        "blue": "#0000FF",
-        "yellow": "#FFFF00",
-        "cyan": "#00FFFF",
-        "magenta": "#FF00FF",
-        "white": "#FFFFFF",
-        "black": "#000000",
-        "gray": "#808080",
-        "orange": "#FFA500",
-        "purple": "#800080",
-        "pink": "#FFC0CB",
-        "brown": "#A52A2A",
-        "teal": "#008080",
-    }
-    return mapping.get(color, "#000000")
-
-
-def _render_svg(level: int, section_x: int, section_y: int, db: Session) -> str:
+    # One view per parent section; anything else lies off the board
+    sections = 3 ** (level - 1)
+    if not (0 <= section_x < sections and 0 <= section_y < sections):
+        raise HTTPException(status_code=400, detail=f"section_x and section_y must be between 0 and {sections - 1} at level {level}")
+    return section_x * parent_size, section_y * parent_size, span, span
+
+
+def _pixel_bounds_for_level(level: int, section_x: int = None, section_y: int = None) -> Tuple[int, int, int, int]:
+    """_area_bounds_for_level for endpoints that send every pixel of the view"""
+    bounds = _area_bounds_for_level(level, section_x, section_y)
+    if bounds[2] > MAX_VIEW_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Level {level} views are {bounds[2]} pixels wide, over the {MAX_VIEW_SIZE} pixel limit; "
+                   "use /render or /overview, or a deeper level",
+        )
+    return bounds
+
+
+def _render_block(span: int) -> int:
+    """Pyramid block size a view is rendered at: 1 (every pixel) unless it is wider than MAX_VIEW_SIZE"""
+    block = 1
+    while span // block > MAX_VIEW_SIZE and block * 3 < span:
+        block *= 3
+    return block
+
+
+def _render_window(level: int, section_x: int, section_y: int) -> Tuple[bytes, int, int, int]:
+    """(palette indices, width, height, block size) of a view as rendered.
+    Views wider than MAX_VIEW_SIZE come from the pyramid, one dominant color per block."""
     start_x, start_y, span_x, span_y = _area_bounds_for_level(level, section_x, section_y)
-
-    # Query a single window for all pixels to be drawn
-    pixels = db.query(Canvas).filter(
-        Canvas.x >= start_x,
-        Canvas.x <= start_x + span_x - 1,
-        Canvas.y >= start_y,
-        Canvas.y <= start_y + span_y - 1,
-    ).all()
-
-    # SVG header with viewBox matching the pixel span (1 unit per pixel)
-    svg_parts: List[str] = []
-    svg_parts.append(f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {span_x} {span_y}" shape-rendering="crispEdges" preserveAspectRatio="none">')
-
-    # Background (solid, non-transparent)
-    svg_parts.append('<rect x="0" y="0" width="100%" height="100%" fill="#f0f0f0" shape-rendering="crispEdges"/>')
-
-    # Draw painted pixels (single-unit rects)
-    for p in pixels:
-        lx = p.x - start_x
-        ly = p.y - start_y
-        color = _color_to_hex(p.color)
-        svg_parts.append(f'<rect x="{lx}" y="{ly}" width="1" height="1" fill="{color}" shape-rendering="crispEdges" />')
-
-    # Grid lines for 3x3 sections
-    base = _level_base_section_size(level)
+    block = _render_block(span_x)
+    if block == 1:
+        return canvas_store.window(start_x, start_y, span_x, span_y), span_x, span_y, 1
+    cells = canvas_store.pyramid.dominant_window(block, start_x, start_y, span_x, span_y)
+    return cells, span_x // block, span_y // block, block
+
+
+# Rows per streamed SVG chunk; each chunk holds one <path> per color present in it
+SVG_BAND_ROWS = 27
+
+# Horizontal runs of one painted palette index (index 0 is unpainted)
+_PAINTED_RUN = re.compile(rb"([\x01-\xff])\1*")
+
+
+def _svg_chunks(level: int, cells: bytes, span_x: int, span_y: int, block: int = 1) -> Iterator[str]:
+    """SVG document for a view's palette indices, in row bands.
+    Same-colored horizontal runs are merged and every color in a band is
+    drawn as a single path, instead of one 1x1 rect per pixel. A downsampled
+    view has one unit per block of `block` pixels."""
+    # SVG header with viewBox matching the pixel span (1 unit per pixel);
+    # crispEdges on the root is inherited by every shape
+    yield (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {span_x} {span_y}" '
+           f'shape-rendering="crispEdges" preserveAspectRatio="none">'
+           # Background (solid, non-transparent)
+           '<rect x="0" y="0" width="100%" height="100%" fill="#f0f0f0"/>')
+
+    for band_start in range(0, span_y, SVG_BAND_ROWS):
+        runs: Dict[int, List[str]] = {}
+        for ly in range(band_start, min(band_start + SVG_BAND_ROWS, span_y)):
+            row = cells[ly * span_x:(ly + 1) * span_x]
+            for match in _PAINTED_RUN.finditer(row):
+                lx = match.start()
+                length = match.end() - lx
+                runs.setdefault(row[lx], []).append(f"M{lx} {ly}h{length}v1h-{length}z")
+        if runs:
+            yield ''.join(f'<path fill="{RENDER_PALETTE[index]}" d="{"".join(segments)}"/>'
+                          for index, segments in sorted(runs.items()))
+
+    # Grid lines for 3x3 sections (constant on-screen thickness)
+    base = CanvasModel.section_size(level) // block
     stroke = 'rgba(0,0,0,0.35)'
-    dash = '1,2'
-    # Vertical lines (constant on-screen thickness)
+    lines: List[str] = []
     for i in range(1, 3):
         x = i * base
-        svg_parts.append(f'<line x1="{x}" y1="0" x2="{x}" y2="{span_y}" stroke="{stroke}" stroke-width="1" vector-effect="non-scaling-stroke" stroke-dasharray="3,3" shape-rendering="crispEdges" />')
-    # Horizontal lines (constant on-screen thickness)
+        lines.append(f'<line x1="{x}" y1="0" x2="{x}" y2="{span_y}" stroke="{stroke}" stroke-width="1" vector-effect="non-scaling-stroke" stroke-dasharray="3,3" />')
     for i in range(1, 3):
         y = i * base
-        svg_parts.append(f'<line x1="0" y1="{y}" x2="{span_x}" y2="{y}" stroke="{stroke}" stroke-width="1" vector-effect="non-scaling-stroke" stroke-dasharray="3,3" shape-rendering="crispEdges" />')
-
-    svg_parts.append('</svg>')
-    return ''.join(svg_parts)
+        lines.append(f'<line x1="0" y1="{y}" x2="{span_x}" y2="{y}" stroke="{stroke}" stroke-width="1" vector-effect="non-scaling-stroke" stroke-dasharray="3,3" />')
+    yield ''.join(lines) + '</svg>'
+
+
+async def _stream_svg(view: Tuple[int, int, int], cells: bytes, span_x: int, span_y: int,
+                      block: int = 1) -> AsyncIterator[bytes]:
+    """Stream a rendered view and fill the render cache once it is complete"""
+    version = section_versions.get(view)
+    elapsed = 0.0
+    parts: List[bytes] = []
+    chunks = _svg_chunks(view[0], cells, span_x, span_y, block)
+    while True:
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        elapsed += time.perf_counter() - started
+        if chunk is None:
+            break
+        data = chunk.encode()
+        parts.append(data)
+        yield data
+    content = b''.join(parts)
+    metrics.SVG_RENDER_SECONDS.observe(elapsed, str(view[0]))
+    metrics.SVG_RENDER_BYTES.observe(len(content), str(view[0]))
+    # A paint may have landed while streaming; the snapshot is then already stale
+    if section_versions.get(view) == version:
+        render_cache.put(view, "svg", content)
+
+
+
+def _render_raster(level: int, section_x: int, section_y: int, fmt: str) -> bytes:
+    indices, width, height, _ = _render_window(level, section_x, section_y)
+    if fmt == "raw":
+        return indices
+    return encode_indexed_png(indices, width, height, RENDER_PALETTE)
+
+
+def _section_window_response(level: int, section_x: int, section_y: int, headers: Dict[str, str] = None) -> Response:
+    """Binary section payload: header plus the view's palette indices, no per-pixel models"""
+    start_x, start_y, span_x, span_y = _pixel_bounds_for_level(level, section_x, section_y)
+    cells = canvas_store.window(start_x, start_y, span_x, span_y)
+    content = encode_section_window(
+        level, start_x, start_y, span_x, span_y, CanvasModel.section_size(level), cells
+    )
+    return Response(content=content, media_type=BINARY_MEDIA_TYPE, headers=headers)
+
+
+def _validators(request: Request, view: Tuple[int, int, int], representation: str) -> Tuple[Dict[str, str], Optional[Response]]:
+    """Caching headers for a view, plus a 304 response when the client's copy is current"""
+    etag = section_versions.etag(view, representation)
+    # Clients may keep the payload but must revalidate before reusing it
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        # Starting point for GET /changes after a reconnect
+        "X-Canvas-Version": str(section_versions.sequence),
+        "X-Canvas-Generation": section_versions.generation,
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
+
+def _apply_pixel(x: int, y: int, color: str) -> None:
+    """Update in-memory state for a committed paint and drop stale renders"""
+    canvas_store.set(x, y, color)
+    views = CanvasModel.get_view_sections_for_pixel(x, y)
+    for view in views:
+        render_cache.invalidate(view)
+    change_ring.record(section_versions.bump(views), x, y, color)
+
+
+def _clear_canvas_state() -> None:
+    canvas_store.clear()
+    render_cache.clear()
+    section_versions.clear()
+    change_ring.clear(section_versions.sequence)
+
+
+def _load_board() -> CanvasStore:
+    """The persisted board in a new store; uses a sync session so it can run in a worker thread"""
+    board = CanvasStore(canvas_store.size, canvas_store.chunk_size)
+    with SessionLocal() as db:
+        board.load(db)
+    return board
+
+
+async def handle_bus_event(event: dict) -> None:
+    """Apply a paint or clear published by any worker, this one included.
+    The publishing worker has already updated its own canvas; every worker
+    fans the change out to its own WebSocket clients."""
+    local = event.get("origin") == bus.worker_id
+    if event["type"] == "pixels":
+        pixels = [(x, y, color) for x, y, color in event["pixels"]]
+        if not local:
+            for x, y, color in pixels:
+                _apply_pixel(x, y, color)
+        manager.queue_pixels(pixels)
+    elif event["type"] == "clear":
+        if not local:
+            # Paints queued here before the clear must not be committed after its DELETE
+            await paint_journal.discard()
+            _clear_canvas_state()
+        manager.discard_pending()
+        manager.broadcast("{\"type\": \"canvas_cleared\"}")
+    elif event["type"] == "reload":
+        # The board was replaced wholesale (snapshot import); reread it from the database
+        if not local:
+            await paint_journal.discard()
+            board = await asyncio.to_thread(_load_board)
+            _clear_canvas_state()
+            canvas_store.adopt(board)
+        manager.discard_pending()
+        manager.broadcast(RESYNC_MESSAGE)
 
 
 @router.get("/render/{level}")
-async def render_level(level: int, section_x: int = None, section_y: int = None, db: Session = Depends(get_db)):
-    if level < 1 or level > 6:
-        raise HTTPException(status_code=400, detail="Level must be between 1 and 6")
+async def render_level(request: Request, level: int, section_x: int = None, section_y: int = None, format: str = "svg"):
+    _check_level(level)
+    if format not in RENDER_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be one of svg, png, raw")
     if level == 1:
         # section parameters are ignored at level 1
-        svg = _render_svg(1, 0, 0, db)
-        return Response(content=svg, media_type="image/svg+xml")
-    if level == 6:
-        raise HTTPException(status_code=400, detail="Rendering endpoint is for levels 1..5")
-    if section_x is None or section_y is None:
+        section_x, section_y = 0, 0
+    elif level == CanvasModel.MAX_LEVEL:
+        raise HTTPException(status_code=400, detail=f"Rendering endpoint is for levels 1..{CanvasModel.MAX_LEVEL - 1}")
+    elif section_x is None or section_y is None:
         raise HTTPException(status_code=400, detail="section_x and section_y required for this level")
-    svg = _render_svg(level, section_x, section_y, db)
-    return Response(content=svg, media_type="image/svg+xml")
-
-# Existing JSON endpoints
-@router.get("/")
-async def get_root_canvas(db: Session = Depends(get_db)):
-    """Get the root canvas (Level 1) - shows all 531,441 pixels via 9 sections"""
-    # Level 1: Show 9 sections (3x3 grid), each containing 59,049 pixels (243x243)
-    sections = CanvasModel.get_sections_for_level(1)
-    canvas_data = []
     
-    for section_x, section_y in sections:
-        # Get pixels for this section
-        start_x, start_y, end_x, end_y = CanvasModel.get_section_bounds(1, section_x, section_y)
-        
-        # Query database for pixels in this section
-        pixels = db.query(Canvas).filter(
-            Canvas.x >= start_x,
-            Canvas.x <= end_x,
-            Canvas.y >= start_y,
-            Canvas.y <= end_y
-        ).all()
-        
-        pixel_data = [PixelData(x=p.x, y=p.y, color=p.color) for p in pixels]
-        
-        canvas_data.append(CanvasSection(
-            x=section_x,
-            y=section_y,
-            pixels=pixel_data,
-            level=1
-        ))
-    
-    return {"sections": canvas_data, "level": 1}
-
-@router.get("/level/{level}")
-async def get_canvas_level(level: int, section_x: int = None, section_y: int = None, db: Session = Depends(get_db)):
-    """Get canvas data for a specific level"""
-    if level < 1 or level > 6:
-        raise HTTPException(status_code=400, detail="Level must be between 1 and 6")
+    view = (level, section_x, section_y)
+    headers, not_modified = _validators(request, view, format)
+    if not_modified is not None:
+        return not_modified
+    content = render_cache.get(view, format)
+    if content is None and format == "svg":
+        # Snapshot the view now so the streamed document matches the ETag
+        cells, width, height, block = _render_window(level, section_x, section_y)
+        headers["X-Block-Size"] = str(block)
+        return StreamingResponse(_stream_svg(view, cells, width, height, block), media_type=MEDIA_TYPES[format], headers=headers)
+    if content is None:
+        content = _render_raster(level, section_x, section_y, format)
+        render_cache.put(view, format, content)
     
+    # Pixels per rendered unit: 1 unless the view was downsampled from the pyramid
+    block = _render_block(CanvasModel.view_size(level))
+    headers["X-Block-Size"] = str(block)
+    if format == "raw":
+        span = CanvasModel.view_size(level) // block
+        headers.update({"X-Width": str(span), "X-Height": str(span)})
+    return Response(content=content, media_type=MEDIA_TYPES[format], headers=headers)
+
+@router.get("/overview/{level}")
+async def get_overview(level: int, section_x: int = None, section_y: int = None, block: int = None, histogram: bool = False):
+    """Downsampled view from the mipmap pyramid: one dominant color per block"""
+    if level < 1 or level >= CanvasModel.MAX_LEVEL:
+        raise HTTPException(status_code=400, detail=f"Overview is available for levels 1..{CanvasModel.MAX_LEVEL - 1}")
     if level == 1:
-        # Level 1: Show 9 sections (3x3 grid), each containing 59,049 pixels (243x243)
-        sections = CanvasModel.get_sections_for_level(level)
-        canvas_data = []
-        
-        for section_x, section_y in sections:
-            # Get pixels for this section
-            start_x, start_y, end_x, end_y = CanvasModel.get_section_bounds(level, section_x, section_y)
-            
-            # Query database for pixels in this section
-            pixels = db.query(Canvas).filter(
-                Canvas.x >= start_x,
-                Canvas.x <= end_x,
-                Canvas.y >= start_y,
-                Canvas.y <= end_y
-            ).all()
-            
-            pixel_data = [PixelData(x=p.x, y=p.y, color=p.color) for p in pixels]
-            
-            canvas_data.append(CanvasSection(
-                x=section_x,
-                y=section_y,
-                pixels=pixel_data,
-                level=level
-            ))
-    elif level == 2:
-        # Level 2: Show 9 sections (3x3 grid), each containing 6,561 pixels (81x81)
-        if section_x is None or section_y is None:
-            raise HTTPException(status_code=400, detail="section_x and section_y required for level 2")
-        
-        # Calculate the 9 sections that belong to this Level 1 section
-        # Each Level 2 section is 81x81 pixels
-        start_x = section_x * CanvasModel.LEVEL1_SECTION_SIZE
-        start_y = section_y * CanvasModel.LEVEL1_SECTION_SIZE
-        
-        canvas_data = []
-        
-        # Create 9 sections (3x3 grid) for the 9 Level 2 subsections in this Level 1 section
-        for y in range(3):
-            for x in range(3):
-                subsection_x = start_x + x * CanvasModel.LEVEL2_SECTION_SIZE
-                subsection_y = start_y + y * CanvasModel.LEVEL2_SECTION_SIZE
-                
-                # Get pixels for this subsection
-                subsection_start_x = subsection_x
-                subsection_start_y = subsection_y
-                subsection_end_x = subsection_x + CanvasModel.LEVEL2_SECTION_SIZE - 1
-                subsection_end_y = subsection_y + CanvasModel.LEVEL2_SECTION_SIZE - 1
-                
-                pixels = db.query(Canvas).filter(
-                    Canvas.x >= subsection_start_x,
-                    Canvas.x <= subsection_end_x,
-                    Canvas.y >= subsection_start_y,
-                    Canvas.y <= subsection_end_y
-                ).all()
-                
-                pixel_data = [PixelData(x=p.x, y=p.y, color=p.color) for p in pixels]
-                
-                canvas_data.append(CanvasSection(
-                    x=x,
-                    y=y,
-                    pixels=pixel_data,
-                    level=level
-                ))
-    elif level == 3:
-        # Level 3: Show 9 sections (3x3 grid), each containing 729 pixels (27x27)
-        if section_x is None or section_y is None:
-            raise HTTPException(status_code=400, detail="section_x and section_y required for level 3")
-        
-        # Calculate the 9 sections that belong to this Level 2 section
-        # Each Level 3 section is 27x27 pixels
-        start_x = section_x * CanvasModel.LEVEL2_SECTION_SIZE
-        start_y = section_y * CanvasModel.LEVEL2_SECTION_SIZE
-        
-        canvas_data = []
-        
-        for y in range(3):
-            for x in range(3):
-                subsection_x = start_x + x * CanvasModel.LEVEL3_SECTION_SIZE
-                subsection_y = start_y + y * CanvasModel.LEVEL3_SECTION_SIZE
-                
-                subsection_start_x = subsection_x
-                subsection_start_y = subsection_y
-                subsection_end_x = subsection_x + CanvasModel.LEVEL3_SECTION_SIZE - 1
-                subsection_end_y = subsection_y + CanvasModel.LEVEL3_SECTION_SIZE - 1
-                
-                pixels = db.query(Canvas).filter(
-                    Canvas.x >= subsection_start_x,
-                    Canvas.x <= subsection_end_x,
-                    Canvas.y >= subsection_start_y,
-                    Canvas.y <= subsection_end_y
-                ).all()
-                
-                pixel_data = [PixelData(x=p.x, y=p.y, color=p.color) for p in pixels]
-                
-                canvas_data.append(CanvasSection(
-                    x=x,
-                    y=y,
-                    pixels=pixel_data,
-                    level=level
-                ))
-    elif level == 4:
-        # Level 4: Show 9 sections (3x3 grid), each containing 81 pixels (9x9)
-        if section_x is None or section_y is None:
-            raise HTTPException(status_code=400, detail="section_x and section_y required for level 4")
-        
-        # Each Level 4 section is 9x9 pixels
-        start_x = section_x * CanvasModel.LEVEL3_SECTION_SIZE
-        start_y = section_y * CanvasModel.LEVEL3_SECTION_SIZE
-        
-        canvas_data = []
-        
-        for y in range(3):
-            for x in range(3):
-                subsection_x = start_x + x * CanvasModel.LEVEL4_SECTION_SIZE
-                subsection_y = start_y + y * CanvasModel.LEVEL4_SECTION_SIZE
-                
-                subsection_start_x = subsection_x
-                subsection_start_y = subsection_y
-                subsection_end_x = subsection_x + CanvasModel.LEVEL4_SECTION_SIZE - 1
-                subsection_end_y = subsection_y + CanvasModel.LEVEL4_SECTION_SIZE - 1
-                
-                pixels = db.query(Canvas).filter(
-                    Canvas.x >= subsection_start_x,
-                    Canvas.x <= subsection_end_x,
-                    Canvas.y >= subsection_start_y,
-                    Canvas.y <= subsection_end_y
-                ).all()
-                
-                pixel_data = [PixelData(x=p.x, y=p.y, color=p.color) for p in pixels]
-                
-                canvas_data.append(CanvasSection(
-                    x=x,
-                    y=y,
-                    pixels=pixel_data,
-                    level=level
-                ))
-    elif level == 5:
-        # Level 5: Show 9 sections (3x3 grid), each containing 9 pixels (3x3)
-        if section_x is None or section_y is None:
-            raise HTTPException(status_code=400, detail="section_x and section_y required for level 5")
-        
-        start_x = section_x * CanvasModel.LEVEL4_SECTION_SIZE
-        start_y = section_y * CanvasModel.LEVEL4_SECTION_SIZE
-        
-        canvas_data = []
-        
-        for y in range(3):
-            for x in range(3):
-                subsection_x = start_x + x * CanvasModel.LEVEL5_SECTION_SIZE
-                subsection_y = start_y + y * CanvasModel.LEVEL5_SECTION_SIZE
-                
-                subsection_start_x = subsection_x
-                subsection_start_y = subsection_y
-                subsection_end_x = subsection_x + CanvasModel.LEVEL5_SECTION_SIZE - 1
-                subsection_end_y = subsection_y + CanvasModel.LEVEL5_SECTION_SIZE - 1
-                
-                pixels = db.query(Canvas).filter(
-                    Canvas.x >= subsection_start_x,
-                    Canvas.x <= subsection_end_x,
-                    Canvas.y >= subsection_start_y,
-                    Canvas.y <= subsection_end_y
-                ).all()
-                
-                pixel_data = [PixelData(x=p.x, y=p.y, color=p.color) for p in pixels]
-                
-                canvas_data.append(CanvasSection(
-                    x=x,
-                    y=y,
-                    pixels=pixel_data,
-                    level=level
-                ))
-    else:
-        # Level 6: Show 9 individual pixels (3x3 grid, 1x1 each)
-        if section_x is None or section_y is None:
-            raise HTTPException(status_code=400, detail="section_x and section_y required for level 6")
-        
-        start_x = section_x * CanvasModel.LEVEL5_SECTION_SIZE
-        start_y = section_y * CanvasModel.LEVEL5_SECTION_SIZE
-        
-        canvas_data = []
-        
-        for y in range(3):
-            for x in range(3):
-                pixel_x = start_x + x
-                pixel_y = start_y + y
-                
-                pixel = db.query(Canvas).filter(Canvas.x == pixel_x, Canvas.y == pixel_y).first()
-                
-                pixel_data: List[PixelData] = []
-                if pixel:
-                    pixel_data = [PixelData(x=pixel.x, y=pixel.y, color=pixel.color)]
-                
-                canvas_data.append(CanvasSection(
-                    x=x,
-                    y=y,
-                    pixels=pixel_data,
-                    level=level
-                ))
+        section_x, section_y = 0, 0
+    start_x, start_y, span_x, span_y = _area_bounds_for_level(level, section_x, section_y)
+    if block is None:
+        # Default to 27 blocks per side, or the finest block available for deep levels
+        block = max(span_x // 27, BLOCK_SIZES[0])
+    if block not in BLOCK_SIZES or block > span_x:
+        raise HTTPException(status_code=400, detail="block must be a pyramid block size no larger than the view")
+    if span_x // block > MAX_VIEW_SIZE:
+        raise HTTPException(status_code=400, detail=f"Overview would be over {MAX_VIEW_SIZE} blocks wide; use a larger block")
     
-    return {"sections": canvas_data, "level": level}
-
-@router.post("/paint")
-async def paint_pixel(request: PaintRequest, db: Session = Depends(get_db)):
-    """Paint a pixel with a specific color"""
-    if not CanvasModel.is_valid_pixel(request.x, request.y):
-        raise HTTPException(status_code=400, detail="Invalid pixel coordinates")
+    pyramid_level = canvas_store.pyramid.levels[block]
+    cells: List[str] = []
+    painted: List[int] = []
+    histograms: List[List[int]] = []
+    for index in canvas_store.pyramid.tiles(block, start_x, start_y, span_x, span_y):
+        if index < 0:
+            cells.append(None)
+            painted.append(0)
+            if histogram:
+                histograms.append([0] * (PALETTE_SLOTS - 1))
+            continue
+        dominant = pyramid_level.dominant(index)
+        cells.append(INDEX_TO_COLOR[dominant] if dominant else None)
+        counts = pyramid_level.histogram(index)
+        painted.append(block * block - counts[0])
+        if histogram:
+            histograms.append(counts[1:])
     
-    if not CanvasModel.is_valid_color(request.color):
-        raise HTTPException(status_code=400, detail="Invalid color")
+    overview = {
+        "level": level,
+        "section_x": section_x,
+        "section_y": section_y,
+        "block_size": block,
+        "width": span_x // block,
+        "height": span_y // block,
+        "cells": cells,
+        "painted": painted,
+    }
+    if histogram:
+        # Counts per color, in CanvasModel.COLORS order
+        overview["histograms"] = histograms
+    return overview
+
+
+def _level_sections(level: int, section_x: int, section_y: int) -> List[dict]:
+    """Build the nine sections of a view (CanvasSection-shaped dicts) from a single
+    window read. Pixels are bucketed into the 3x3 grid by their offset from the
+    view origin. Plain dicts: per-pixel models cost more than the rest of the read.
+    """
+    start_x, start_y, span_x, span_y = _pixel_bounds_for_level(level, section_x, section_y)
+    base = CanvasModel.section_size(level)
     
-    # Check if pixel already exists
-    existing_pixel = db.query(Canvas).filter(Canvas.x == request.x, Canvas.y == request.y).first()
+    buckets: Dict[Tuple[int, int], List[dict]] = {(x, y): [] for y in range(3) for x in range(3)}
+    for px, py, color in canvas_store.pixels_in(start_x, start_y, start_x + span_x - 1, start_y + span_y - 1):
+        buckets[((px - start_x) // base, (py - start_y) // base)].append({"x": px, "y": py, "color": color})
     
-    if existing_pixel:
-        # Update existing pixel
-        existing_pixel.color = request.color
-        existing_pixel.updated_at = datetime.utcnow()
+    # Level 1 keeps the column-major order of get_sections_for_level; deeper levels are row-major
+    if level == 1:
+        order = CanvasModel.get_sections_for_level(1)
     else:
-        # Create new pixel
-        new_pixel = Canvas(x=request.x, y=request.y, color=request.color)
-        db.add(new_pixel)
+        order = [(x, y) for y in range(3) for x in range(3)]
+    return [{"x": x, "y": y, "pixels": buckets[(x, y)], "level": level} for x, y in order]
+
+def _level_response(request: Request, level: int, section_x: int, section_y: int, format: Optional[str]):
+    """JSON or binary view payload, or 304 when the client's ETag is still current"""
+    _pixel_bounds_for_level(level, section_x, section_y)
+    binary = wants_binary(request.headers.get("accept"), format)
+    headers, not_modified = _validators(request, (level, section_x, section_y), "bin" if binary else "json")
+    # The representation depends on Accept as well as the URL
+    headers["Vary"] = "Accept"
+    if not_modified is not None:
+        return not_modified
+    if binary:
+        return _section_window_response(level, section_x, section_y, headers)
+    # Encoded once per view and kept until a paint inside it invalidates the render cache
+    view = (level, section_x, section_y)
+    content = render_cache.get(view, "json")
+    if content is None:
+        payload = {"sections": _level_sections(level, section_x, section_y), "level": level}
+        content = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        render_cache.put(view, "json", content)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+# Existing JSON endpoints
+@router.get("/")
+async def get_root_canvas(request: Request, format: str = None):
+    """Get the root canvas (Level 1) - shows every pixel of the board via 9 sections"""
+    return _level_response(request, 1, 0, 0, format)
+
+@router.get("/level/{level}")
+async def get_canvas_level(request: Request, level: int, section_x: int = None, section_y: int = None, format: str = None):
+    """Get canvas data for a specific level.
+    Level 1 shows the 9 top-level sections; deeper levels show the 3x3 children of
+    section (section_x, section_y) at the previous level (81x81 down to 1x1 each
+    at the default depth).
+    """
+    _check_level(level)
     
-    db.commit()
+    if level == 1:
+        # section parameters are ignored at level 1
+        section_x, section_y = 0, 0
+    elif section_x is None or section_y is None:
+        raise HTTPException(status_code=400, detail=f"section_x and section_y required for level {level}")
     
-    # Broadcast update to all connected clients (frontend throttles fetch to ~1/s)
-    update_message = {
-        "type": "pixel_updated",
-        "x": request.x,
-        "y": request.y,
-        "color": request.color
+    return _level_response(request, level, section_x, section_y, format)
+
+@router.get("/changes")
+async def get_changes(since: int, level: int = 1, section_x: int = None, section_y: int = None, generation: str = None):
+    """Pixels painted in a view after version `since` (from X-Canvas-Version or a
+    previous call). Falls back to a full snapshot of the view when the change
+    ring no longer reaches back that far or the version came from another process.
+    """
+    _check_level(level)
+    if level == 1:
+        section_x, section_y = 0, 0
+    elif section_x is None or section_y is None:
+        raise HTTPException(status_code=400, detail=f"section_x and section_y required for level {level}")
+    start_x, start_y, span_x, span_y = _pixel_bounds_for_level(level, section_x, section_y)
+    
+    changes = {
+        "level": level,
+        "section_x": section_x,
+        "section_y": section_y,
+        "generation": section_versions.generation,
+        "version": section_versions.sequence,
+    }
+    pixels = None
+    if generation in (None, section_versions.generation) and since <= section_versions.sequence:
+        pixels = change_ring.since(since, start_x, start_y, start_x + span_x - 1, start_y + span_y - 1)
+    if pixels is None:
+        changes["full"] = True
+        changes["sections"] = _level_sections(level, section_x, section_y)
+    else:
+        changes["full"] = False
+        changes["pixels"] = pixels
+    # Already plain JSON types; skip the per-item walk of jsonable_encoder
+    return JSONResponse(content=changes)
+
+def _history_time(value: str) -> float:
+    try:
+        return parse_time(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time {value!r}; expected ISO 8601")
+
+def _history_start() -> float:
+    earliest = paint_history.earliest()
+    if earliest is None:
+        raise HTTPException(status_code=404, detail="No paint history recorded")
+    return earliest
+
+async def _stream_history(level: int, section_x: int, section_y: int, since: float, until: float,
+                          binary: bool) -> AsyncIterator[bytes]:
+    start_x, start_y, span_x, span_y = _area_bounds_for_level(level, section_x, section_y)
+    frames = paint_history.replay(since, until, start_x, start_y, span_x, span_y)
+    while True:
+        # Partitions are read from disk; keep that off the event loop
+        frame = await asyncio.to_thread(next, frames, None)
+        if frame is None:
+            break
+        if frame[0] == "state":
+            _, ts, cells = frame
+            if binary:
+                yield encode_section_window(
+                    level, start_x, start_y, span_x, span_y, CanvasModel.section_size(level), bytes(cells)
+                )
+                continue
+            pixels = [
+                [start_x + offset % span_x, start_y + offset // span_x, INDEX_TO_COLOR[index]]
+                for offset, index in enumerate(cells) if index
+            ]
+            yield (json.dumps({
+                "type": "state", "time": format_time(ts), "level": level, "section_x": section_x,
+                "section_y": section_y, "x": start_x, "y": start_y, "width": span_x, "height": span_y,
+                "pixels": pixels,
+            }) + "\n").encode()
+            continue
+        events = frame[1]
+        for start in range(0, len(events), HISTORY_CHUNK):
+            chunk = events[start:start + HISTORY_CHUNK]
+            if binary:
+                yield encode_history_frame(chunk)
+            else:
+                yield (json.dumps({
+                    "type": "paints",
+                    "pixels": [[x, y, INDEX_TO_COLOR[index], format_time(ts)] for x, y, index, ts in chunk],
+                }) + "\n").encode()
+
+@router.get("/history")
+async def get_history(since: str = None, until: str = None, level: int = 1, section_x: int = None,
+                      section_y: int = None, format: str = "json"):
+    """Replay of a view between two times (ISO 8601, UTC; default the whole history).
+
+    JSON is streamed as newline-delimited objects: a {"type": "state"} line with
+    the view's pixels at `since` (repeated after a clear or snapshot import),
+    then {"type": "paints", "pixels": [[x, y, color, time], ...]} lines in paint
+    order; color "" is an erase. format=bin streams the same as section
+    payloads and history frames (wire.py).
+    """
+    _check_level(level)
+    if level == 1:
+        section_x, section_y = 0, 0
+    elif section_x is None or section_y is None:
+        raise HTTPException(status_code=400, detail=f"section_x and section_y required for level {level}")
+    if format not in ("json", "bin"):
+        raise HTTPException(status_code=400, detail="format must be one of json, bin")
+    _pixel_bounds_for_level(level, section_x, section_y)
+    earliest = _history_start()
+    start = earliest if since is None else _history_time(since)
+    end = history_now() if until is None else _history_time(until)
+    if start < earliest:
+        raise HTTPException(status_code=400, detail=f"History starts at {format_time(earliest)}")
+    if end < start:
+        raise HTTPException(status_code=400, detail="until must not be before since")
+    binary = format == "bin"
+    return StreamingResponse(
+        _stream_history(level, section_x, section_y, start, end, binary),
+        media_type=BINARY_MEDIA_TYPE if binary else "application/x-ndjson",
+    )
+
+@router.get("/history/pixel")
+async def get_pixel_history(x: int, y: int, limit: int = 100):
+    """Most recent paints of one pixel, newest first"""
+    if not CanvasModel.is_valid_pixel(x, y):
+        raise HTTPException(status_code=400, detail="Invalid pixel coordinates")
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    events = await asyncio.to_thread(paint_history.pixel_history, x, y, limit)
+    return {
+        "x": x,
+        "y": y,
+        "paints": [{"color": INDEX_TO_COLOR[index], "time": format_time(ts)} for _, _, index, ts in events],
     }
+
+async def _commit_paints(painted: Dict[Tuple[int, int], str], client: str) -> int:
+    """Paint path shared by /paint, /paint/batch and /ws: validate, admit, apply in
+    memory, journal for group commit and publish. Raises HTTPException on refusal."""
+    for (x, y), color in painted.items():
+        if not CanvasModel.is_valid_pixel(x, y):
+            raise HTTPException(status_code=400, detail="Invalid pixel coordinates")
+        if not CanvasModel.is_valid_color(color):
+            raise HTTPException(status_code=400, detail="Invalid color")
     
-    await manager.broadcast(str(update_message))
+    ratelimit.check_paint(client, len(painted), paint_journal.pending_count)
+    await _publish_paints(painted)
+    return len(painted)
+
+async def _publish_paints(painted: Dict[Tuple[int, int], str]) -> None:
+    """Apply already-validated paints in memory, hand them to the journal for group
+    commit and publish them. A color of "" erases the pixel (reverts only).
+    A failed commit does not fail the paint: the journal keeps it queued and
+    retries, so it is published and acknowledged like any other. Nor does a
+    failed publish: the paint is already durable, so it is only fanned out to
+    this worker's viewers, and other workers miss it until they reload."""
+    for (x, y), color in painted.items():
+        _apply_pixel(x, y, color)
+    await paint_journal.append((x, y, color) for (x, y), color in painted.items())
     
+    # Sent to viewers on every worker in the next coalesced delta frame
+    pixels = [[x, y, color] for (x, y), color in painted.items()]
+    for start in range(0, len(pixels), CanvasModel.MAX_BATCH_PIXELS):
+        event = {"type": "pixels", "pixels": pixels[start:start + CanvasModel.MAX_BATCH_PIXELS]}
+        try:
+            await bus.publish(event)
+        except Exception:
+            logger.exception("Publishing paints failed; only this worker's viewers get them")
+            await handle_bus_event({**event, "origin": bus.worker_id})
+
+@router.post("/paint")
+async def paint_pixel(request: PaintRequest, http_request: Request):
+    """Paint a pixel with a specific color"""
+    await _commit_paints({(request.x, request.y): request.color}, ratelimit.client_key(http_request))
     return {"message": "Pixel painted successfully"}
 
+@router.post("/paint/batch")
+async def paint_pixels(request: PaintBatchRequest, http_request: Request):
+    """Paint many pixels in one journal append"""
+    total = len(request.pixels) + sum(max(run.length, 0) for run in request.runs)
+    if total == 0:
+        raise HTTPException(status_code=400, detail="No pixels to paint")
+    if total > CanvasModel.MAX_BATCH_PIXELS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {CanvasModel.MAX_BATCH_PIXELS} pixels")
+    
+    # Expand runs and collapse repeated coordinates (last write wins)
+    painted: Dict[Tuple[int, int], str] = {}
+    for pixel in request.pixels:
+        painted[(pixel.x, pixel.y)] = pixel.color
+    for run in request.runs:
+        if run.length < 1:
+            raise HTTPException(status_code=400, detail="Run length must be positive")
+        for x in range(run.x, run.x + run.length):
+            painted[(x, run.y)] = run.color
+    
+    count = await _commit_paints(painted, ratelimit.client_key(http_request))
+    return {"message": "Pixels painted successfully", "count": count}
+
 @router.post("/zoom")
 async def zoom_to_position(request: ZoomRequest):
     """Zoom to a specific position"""
-    if request.level < 1 or request.level > 6:
-        raise HTTPException(status_code=400, detail="Level must be between 1 and 6")
+    _check_level(request.level)
     
     # Validate section coordinates based on level
     # Level grid sizes are always 3 in our UI hierarchy
@@ -450,39 +615,312 @@ async def get_colors():
     """Get available colors"""
     return {"colors": CanvasModel.COLORS}
 
+@router.get("/config")
+async def get_config():
+    """Board geometry, so clients need not assume the default depth"""
+    return {
+        "depth": CanvasModel.DEPTH,
+        "size": CanvasModel.TOTAL_SIZE,
+        "max_level": CanvasModel.MAX_LEVEL,
+        # Pixels per side of one section, for levels 1..max_level
+        "section_sizes": [CanvasModel.section_size(level) for level in range(1, CanvasModel.MAX_LEVEL + 1)],
+        "max_view_size": MAX_VIEW_SIZE,
+    }
+
+def _parse_ws_command(data: str) -> Optional[dict]:
+    try:
+        command = json.loads(data)
+    except ValueError:
+        return None
+    return command if isinstance(command, dict) else None
+
+def _paint_from_command(command: dict) -> Dict[Tuple[int, int], str]:
+    """Pixels of a JSON paint command {"type": "paint", "seq", "pixels": [[x, y, color], ...]}"""
+    pixels = command.get("pixels")
+    if not isinstance(pixels, list) or not pixels:
+        raise HTTPException(status_code=400, detail="No pixels to paint")
+    if len(pixels) > CanvasModel.MAX_BATCH_PIXELS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {CanvasModel.MAX_BATCH_PIXELS} pixels")
+    painted: Dict[Tuple[int, int], str] = {}
+    for pixel in pixels:
+        if not isinstance(pixel, list) or len(pixel) != 3 or not all(isinstance(v, int) for v in pixel[:2]):
+            raise HTTPException(status_code=400, detail="Pixels must be [x, y, color]")
+        painted[(pixel[0], pixel[1])] = pixel[2]
+    return painted
+
+def _paint_from_frame(data: bytes) -> Tuple[int, Dict[Tuple[int, int], str]]:
+    """Sequence number and pixels of a binary paint frame (see wire.py)"""
+    try:
+        sequence, cells = decode_paint_frame(data)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if not cells:
+        raise HTTPException(status_code=400, detail="No pixels to paint")
+    if len(cells) > CanvasModel.MAX_BATCH_PIXELS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {CanvasModel.MAX_BATCH_PIXELS} pixels")
+    painted: Dict[Tuple[int, int], str] = {}
+    for x, y, index in cells:
+        if not 0 < index < len(INDEX_TO_COLOR):
+            raise HTTPException(status_code=400, detail="Invalid color")
+        painted[(x, y)] = INDEX_TO_COLOR[index]
+    return sequence, painted
+
+async def _ws_paint(websocket: WebSocket, client: str, sequence: int, binary: bool,
+                    painted: Dict[Tuple[int, int], str] = None, error: HTTPException = None) -> None:
+    """Run one socket paint through the shared paint path and ack it with its sequence number"""
+    status, count, retry_after = 200, 0, 0.0
+    detail = None
+    try:
+        if error is not None:
+            raise error
+        count = await _commit_paints(painted, client)
+    except HTTPException as exc:
+        status, detail = exc.status_code, exc.detail
+        retry_after = float((exc.headers or {}).get("Retry-After", 0))
+    except Exception:
+        logger.exception("WebSocket paint failed")
+        status, detail = 500, "Paint failed"
+    if binary:
+        manager.send_personal_message(encode_ack_frame(sequence, status, count, int(retry_after * 1000)), websocket)
+        return
+    ack = {"type": "ack", "seq": sequence, "status": status, "count": count}
+    if detail is not None:
+        ack["detail"] = detail
+    if retry_after:
+        ack["retry_after"] = retry_after
+    manager.send_personal_message(json.dumps(ack), websocket)
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """Live updates and painting.
+
+    Send {"type": "subscribe", "level", "section_x", "section_y"} (optionally
+    "format": "bin") to receive only delta frames for that view, {"type":
+    "unsubscribe"} to go back to receiving everything.
+
+    Paint with {"type": "paint", "seq": n, "pixels": [[x, y, color], ...]} or a
+    binary paint frame (wire.py). Each paint goes through the same validation,
+    rate limiting and journal as POST /paint and is answered with an ack
+    carrying its sequence number ({"type": "ack", ...} or a binary ack frame)
+    once the journal's durability mode is satisfied. Paints are applied in the
+    order received; acks for pipelined paints may arrive out of order.
+    """
     await manager.connect(websocket)
+    client = ratelimit.client_key(websocket)
+    inflight: Set[asyncio.Task] = set()
     try:
         while True:
-            data = await websocket.receive_text()
-            await manager.send_personal_message(f"Message text was: {data}", websocket)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if inflight and len(inflight) >= WS_MAX_INFLIGHT_PAINTS:
+                # Backpressure: stop reading until an earlier paint is acknowledged
+                await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+
+            data = message.get("bytes")
+            if data is not None:
+                try:
+                    sequence, painted = _paint_from_frame(data)
+                    paint = _ws_paint(websocket, client, sequence, True, painted)
+                except HTTPException as exc:
+                    paint = _ws_paint(websocket, client, peek_paint_sequence(data), True, error=exc)
+                # Created in arrival order, so paints are applied in that order
+                task = asyncio.get_running_loop().create_task(paint)
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+                continue
+
+            data = message.get("text") or ""
+            command = _parse_ws_command(data)
+            if command and command.get("type") == "paint":
+                sequence = command.get("seq", 0)
+                try:
+                    paint = _ws_paint(websocket, client, sequence, False, _paint_from_command(command))
+                except HTTPException as exc:
+                    paint = _ws_paint(websocket, client, sequence, False, error=exc)
+                task = asyncio.get_running_loop().create_task(paint)
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+            elif command and command.get("type") == "subscribe":
+                try:
+                    level = int(command["level"])
+                    section_x = int(command.get("section_x") or 0)
+                    section_y = int(command.get("section_y") or 0)
+                except (KeyError, TypeError, ValueError, OverflowError):
+                    manager.send_personal_message(json.dumps({"type": "error", "detail": "Invalid subscription"}), websocket)
+                    continue
+                if not CanvasModel.is_valid_level(level):
+                    manager.send_personal_message(json.dumps({"type": "error", "detail": f"Level must be between 1 and {CanvasModel.MAX_LEVEL}"}), websocket)
+                    continue
+                view = normalize_view(level, section_x, section_y)
+                binary = command.get("format") == "bin"
+                manager.subscribe(websocket, view, binary)
+                manager.send_personal_message(json.dumps({
+                    "type": "subscribed", "level": view[0], "section_x": view[1], "section_y": view[2],
+                    "format": "bin" if binary else "json",
+                }), websocket)
+            elif command and command.get("type") == "unsubscribe":
+                manager.unsubscribe(websocket)
+                manager.send_personal_message(json.dumps({"type": "unsubscribed"}), websocket)
+            else:
+                manager.send_personal_message(f"Message text was: {data}", websocket)
     except WebSocketDisconnect:
-        manager.disconnect(websocket) 
+        pass
+    finally:
+        # Whatever ended the connection, release its queue, writer task and subscription
+        manager.disconnect(websocket)
 
 @router.post("/report")
-async def report_content(level: int, x: int, y: int, reason: str = "unspecified"):
-    REPORTS.append({
-        "id": len(REPORTS) + 1,
-        "level": level,
-        "x": x,
-        "y": y,
-        "reason": reason,
-        "created_at": datetime.utcnow().isoformat() + "Z",
-    })
+async def report_content(request: Request, level: int, x: int, y: int, reason: str = "unspecified"):
+    """Report section (x, y) of `level` (3^level sections per side)"""
+    if not reports.is_valid_section(level, x, y):
+        raise HTTPException(status_code=400, detail="Invalid report section")
+    ratelimit.check_report(ratelimit.client_key(request))
+    async with AsyncSessionLocal() as db:
+        await reports.record_report(db, level, x, y, reason)
     return {"message": "Report received"}
 
 @router.get("/admin/reports")
-async def list_reports(_: bool = Depends(verify_admin)):
-    return {"reports": REPORTS}
+async def list_reports(status: str = "open", order: str = "recent", level: int = None, x0: int = None,
+                       y0: int = None, x1: int = None, y1: int = None, limit: int = 50, cursor: str = None,
+                       _: bool = Depends(verify_admin)):
+    """One page of reports, most recently reported (order=recent) or most reported
+    (order=count) first. Pass next_cursor back as `cursor` for the next page.
+    x0, y0, x1, y1 (inclusive pixels) keep reports of sections starting inside them."""
+    if status not in reports.REPORT_STATUSES:
+        raise HTTPException(status_code=400, detail="status must be one of open, resolved, all")
+    if order not in reports.REPORT_ORDERS:
+        raise HTTPException(status_code=400, detail="order must be one of recent, count")
+    if limit < 1 or limit > reports.MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {reports.MAX_PAGE_SIZE}")
+    bounds = (x0, y0, x1, y1)
+    if all(value is None for value in bounds):
+        bounds = None
+    elif any(value is None for value in bounds):
+        raise HTTPException(status_code=400, detail="x0, y0, x1 and y1 must be given together")
+    async with AsyncSessionLocal() as db:
+        try:
+            page, next_cursor = await reports.list_reports(db, status, order, level, bounds, limit, cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"reports": page, "next_cursor": next_cursor}
+
+@router.get("/admin/reports/sections")
+async def report_sections(level: int = 1, section_x: int = None, section_y: int = None,
+                          _: bool = Depends(verify_admin)):
+    """Open-report counts for the 3x3 sections of a view (addressed like /level/{level})"""
+    _check_level(level)
+    if level > 1 and (section_x is None or section_y is None):
+        raise HTTPException(status_code=400, detail=f"section_x and section_y required for level {level}")
+    async with AsyncSessionLocal() as db:
+        sections = await reports.section_counts(db, level, section_x, section_y)
+    return {"level": level, "section_x": section_x or 0, "section_y": section_y or 0, "sections": sections}
+
+@router.get("/admin/reports/hotspots")
+async def report_hotspots(level: int = 3, limit: int = 20, _: bool = Depends(verify_admin)):
+    """Sections of a level with the most open reports"""
+    _check_level(level)
+    if limit < 1 or limit > reports.MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {reports.MAX_PAGE_SIZE}")
+    async with AsyncSessionLocal() as db:
+        return {"level": level, "hotspots": await reports.hotspots(db, level, limit)}
+
+@router.post("/admin/reports/{report_id}/resolve")
+async def resolve_report(report_id: int, _: bool = Depends(verify_admin)):
+    async with AsyncSessionLocal() as db:
+        report = await reports.resolve_report(db, report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="No open report with that id")
+    return {"message": "Report resolved", "report": report}
+
+@router.get("/admin/realtime")
+async def realtime_stats(_: bool = Depends(verify_admin)):
+    """WebSocket fan-out health: connections, outbound queue depth, drops and evictions,
+    plus admission-control state"""
+    return {**manager.stats(), **ratelimit.stats()}
 
 @router.post("/admin/clear")
-async def admin_clear_canvas(db: Session = Depends(get_db), _: bool = Depends(verify_admin)):
-    # Danger: clear all pixels
-    db.query(Canvas).delete()
-    db.commit()
+async def admin_clear_canvas(_: bool = Depends(verify_admin)):
+    # Danger: clear all pixels (queued paints are dropped along with the rows)
+    await paint_journal.clear()
+    _clear_canvas_state()
+    paint_history.reset(canvas_store)
     # Reset reports as content is cleared
-    REPORTS.clear()
-    # Notify clients (optional)
-    await manager.broadcast("{\"type\": \"canvas_cleared\"}")
-    return {"message": "Canvas cleared"} 
\ No newline at end of file
+    async with AsyncSessionLocal() as db:
+        await reports.clear_reports(db)
+    # Other workers drop their copies; every worker notifies its clients
+    await bus.publish({"type": "clear"})
+    return {"message": "Canvas cleared"} 
+
+@router.get("/admin/snapshot")
+async def export_snapshot(format: str = "png", _: bool = Depends(verify_admin)):
+    """Whole board as an indexed PNG (metadata in tEXt chunks) or raw index bytes,
+    streamed a band of chunk rows at a time"""
+    if format not in SNAPSHOT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be one of png, raw")
+    async with AsyncSessionLocal() as db:
+        latest = (await db.execute(select(func.max(Canvas.updated_at)))).scalar()
+    # Served from memory, so paints still queued in the journal are included too
+    metadata = snapshot_metadata(latest)
+    headers = {
+        "Content-Disposition": f'attachment; filename="doodlr-snapshot.{format}"',
+        "X-Width": str(canvas_store.size),
+        "X-Height": str(canvas_store.size),
+        "X-Exported-At": metadata["exported_at"],
+        "X-Latest-Paint": metadata["latest_paint"],
+    }
+    # A sync iterator: Starlette encodes each band in its threadpool, off the event loop
+    return StreamingResponse(iter_snapshot(canvas_store, format, metadata), media_type=MEDIA_TYPES[format], headers=headers)
+
+@router.post("/admin/snapshot")
+async def import_snapshot(request: Request, _: bool = Depends(verify_admin)):
+    """Replace the board with a PNG or raw snapshot sent as the request body"""
+    body = await request.body()
+    # Decoding and indexing a whole board is slow on deep canvases; keep it off the event loop
+    try:
+        cells, metadata = await asyncio.to_thread(decode_snapshot, body)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    stamped = parse_timestamp(metadata.get("latest_paint") or request.headers.get("x-latest-paint"))
+    rows = await asyncio.to_thread(snapshot_rows, cells, stamped)
+    board = CanvasStore(canvas_store.size, canvas_store.chunk_size)
+    await asyncio.to_thread(board.replace, cells)
+    # Queued paints are dropped; the table is replaced in one transaction
+    await paint_journal.clear(rows)
+    reset_at = history_now()
+    # Swapped in without yielding, so no paint lands between the clear and the new board
+    _clear_canvas_state()
+    canvas_store.adopt(board)
+    # Checkpointed from the snapshot, not the live board, which is taking paints again
+    await asyncio.to_thread(reset_history, cells, reset_at)
+    await bus.publish({"type": "reload"})
+    return {"message": "Snapshot imported", "painted": len(rows), "latest_paint": stamped.isoformat()}
+
+@router.post("/admin/revert")
+async def admin_revert(at: str, level: int = 1, section_x: int = None, section_y: int = None,
+                       _: bool = Depends(verify_admin)):
+    """Roll a view back to how it looked at time `at` (ISO 8601, UTC). Pixels changed
+    since are repainted or erased through the normal paint path, so the revert is
+    journaled, kept in the history and broadcast like any other paint."""
+    _check_level(level)
+    if level == 1:
+        section_x, section_y = 0, 0
+    elif section_x is None or section_y is None:
+        raise HTTPException(status_code=400, detail=f"section_x and section_y required for level {level}")
+    earliest = _history_start()
+    ts = _history_time(at)
+    if ts < earliest or ts > history_now():
+        raise HTTPException(status_code=400, detail=f"at must be between {format_time(earliest)} and now")
+    # Commit this worker's queued paints so the history is complete up to now
+    await paint_journal.flush()
+    start_x, start_y, span_x, span_y = _pixel_bounds_for_level(level, section_x, section_y)
+    target = await asyncio.to_thread(paint_history.state_at, ts, start_x, start_y, span_x, span_y)
+    current = canvas_store.window(start_x, start_y, span_x, span_y)
+    painted: Dict[Tuple[int, int], str] = {}
+    if target != current:
+        for offset, index in enumerate(target):
+            if index != current[offset]:
+                painted[(start_x + offset % span_x, start_y + offset // span_x)] = INDEX_TO_COLOR[index]
+    if painted:
+        await _publish_paints(painted)
+    return {"message": "View reverted", "reverted": len(painted), "at": format_time(ts)}
@@ -0,0 +1,169 @@
+"""Whole-board snapshots for backup, restore and migration.
+
+A snapshot is the board's row-major palette indices (0 = unpainted,
+n = CanvasModel.COLORS[n - 1]), one byte per pixel, in one of two forms:
+
+    png   8-bit indexed PNG; metadata is stored in tEXt chunks
+    raw   the bare TOTAL_SIZE * TOTAL_SIZE index bytes; metadata travels
+          separately (X- headers over HTTP, a .json sidecar from the CLI)
+
+Metadata: exported_at and latest_paint (ISO 8601, UTC). Imports stamp the
+restored rows with latest_paint when present.
+
+The admin API (GET/POST /admin/snapshot) serves and restores the live board.
+The CLI works directly on the database and should be run with the server
+stopped:
+
+    python snapshot.py export board.png [--format png|raw]
+    python snapshot.py import board.png
+"""
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+import argparse
+import json
+import os
+import time
+from sqlalchemy import delete, func, select
+from database import CANVAS_BULK_INSERT, Canvas, SessionLocal, canvas_timestamp, engine
+from canvas_store import ChunkGrid, color_to_index, index_to_color
+from history import paint_history
+from models.canvas import CanvasModel
+from rendering import PNG_SIGNATURE, RENDER_PALETTE, decode_indexed_png, encode_indexed_png, iter_indexed_png
+
+SNAPSHOT_FORMATS = ("png", "raw")
+
+SNAPSHOT_SIZE = CanvasModel.TOTAL_SIZE
+
+TEXT_PREFIX = "doodlr:"
+
+
+def read_cells(db) -> Tuple[bytearray, Optional[datetime]]:
+    """Board indices and newest paint time, read as plain rows (no ORM objects)"""
+    cells = bytearray(SNAPSHOT_SIZE * SNAPSHOT_SIZE)
+    # Oldest first so that the newest row wins for any duplicated coordinate
+    rows = db.execute(select(Canvas.x, Canvas.y, Canvas.color).order_by(Canvas.updated_at, Canvas.id))
+    for x, y, color in rows:
+        if 0 <= x < SNAPSHOT_SIZE and 0 <= y < SNAPSHOT_SIZE:
+            cells[y * SNAPSHOT_SIZE + x] = color_to_index(color)
+    latest = db.execute(select(func.max(Canvas.updated_at))).scalar()
+    return cells, latest
+
+
+def encode_snapshot(cells: bytes, fmt: str, metadata: Dict[str, str]) -> bytes:
+    if fmt == "raw":
+        return bytes(cells)
+    text = {TEXT_PREFIX + key: value for key, value in metadata.items() if value}
+    return encode_indexed_png(cells, SNAPSHOT_SIZE, SNAPSHOT_SIZE, RENDER_PALETTE, text)
+
+
+def iter_snapshot(board: ChunkGrid, fmt: str, metadata: Dict[str, str]) -> Iterator[bytes]:
+    """encode_snapshot of a board, one band of chunk rows at a time, so a large
+    board is never held encoded (or dense) in memory. Each band is read from the
+    board as it is reached."""
+    size = board.size
+    bands = (board.window(0, y, size, board.chunk_size) for y in range(0, size, board.chunk_size))
+    if fmt == "raw":
+        yield from bands
+        return
+    text = {TEXT_PREFIX + key: value for key, value in metadata.items() if value}
+    yield from iter_indexed_png(bands, size, size, RENDER_PALETTE, text)
+
+
+def decode_snapshot(data: bytes) -> Tuple[bytearray, Dict[str, str]]:
+    """Board indices and metadata from PNG or raw snapshot bytes; ValueError if invalid"""
+    if data.startswith(PNG_SIGNATURE):
+        cells, width, height, _, text = decode_indexed_png(data)
+        if (width, height) != (SNAPSHOT_SIZE, SNAPSHOT_SIZE):
+            raise ValueError(f"Snapshot is {width}x{height}, expected {SNAPSHOT_SIZE}x{SNAPSHOT_SIZE}")
+        metadata = {key[len(TEXT_PREFIX):]: value for key, value in text.items() if key.startswith(TEXT_PREFIX)}
+    elif len(data) == SNAPSHOT_SIZE * SNAPSHOT_SIZE:
+        cells, metadata = bytearray(data), {}
+    else:
+        raise ValueError(f"Expected a PNG or {SNAPSHOT_SIZE * SNAPSHOT_SIZE} raw bytes, got {len(data)} bytes")
+    if max(cells, default=0) > len(CanvasModel.COLORS):
+        raise ValueError("Snapshot uses palette indices outside the color list")
+    return cells, metadata
+
+
+def snapshot_metadata(latest_paint: Optional[datetime]) -> Dict[str, str]:
+    return {
+        "exported_at": datetime.utcnow().isoformat(),
+        "latest_paint": latest_paint.isoformat() if latest_paint else "",
+    }
+
+
+def parse_timestamp(value: Optional[str]) -> datetime:
+    """Timestamp for restored rows: the snapshot's latest paint, else now"""
+    if value:
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.utcnow()
+
+
+def snapshot_rows(cells: bytes, stamped: datetime) -> List[tuple]:
+    """CANVAS_BULK_INSERT parameters for every painted cell"""
+    size = SNAPSHOT_SIZE
+    ts = canvas_timestamp(stamped)
+    return [
+        (offset % size, offset // size, index_to_color(index), ts, ts)
+        for offset, index in enumerate(cells) if index
+    ]
+
+
+def reset_history(cells: bytes, ts: float = None) -> None:
+    """Record an imported board in the paint history"""
+    board = ChunkGrid()
+    board.fill(cells)
+    paint_history.reset(board, ts)
+
+
+def export_file(path: str, fmt: str) -> dict:
+    with SessionLocal() as db:
+        cells, latest = read_cells(db)
+    metadata = snapshot_metadata(latest)
+    with open(path, "wb") as f:
+        f.write(encode_snapshot(cells, fmt, metadata))
+    if fmt == "raw":
+        with open(path + ".json", "w") as f:
+            json.dump(metadata, f, indent=2)
+    return {"path": path, "format": fmt, "painted": len(cells) - cells.count(0), **metadata}
+
+
+def import_file(path: str) -> dict:
+    with open(path, "rb") as f:
+        cells, metadata = decode_snapshot(f.read())
+    sidecar = path + ".json"
+    if not metadata and os.path.exists(sidecar):
+        with open(sidecar) as f:
+            metadata = json.load(f)
+    rows = snapshot_rows(cells, parse_timestamp(metadata.get("latest_paint")))
+    # Replace the whole table in one transaction; the insert runs as a single executemany
+    with engine.begin() as conn:
+        conn.execute(delete(Canvas))
+        if rows:
+            conn.exec_driver_sql(CANVAS_BULK_INSERT, rows)
+    reset_history(cells)
+    return {"path": path, "painted": len(rows), **metadata}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import a whole-board snapshot (stop the server first)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write the board to a file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=SNAPSHOT_FORMATS, default=None,
+                               help="defaults to png unless the path ends in .raw/.bin")
+    import_parser = commands.add_parser("import", help="replace the board with a snapshot file")
+    import_parser.add_argument("path")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "export":
+        fmt = args.format or ("raw" if args.path.endswith((".raw", ".bin")) else "png")
+        result = export_file(args.path, fmt)
+    else:
+        result = import_file(args.path)
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(result, indent=2))
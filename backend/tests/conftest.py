@@ -0,0 +1,50 @@
+"""Test setup: flat imports from backend/, and a scratch database, journal and
+history directory so the tests never touch a real board. The environment is
+set before any backend module is imported, since they read it at import time."""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+SCRATCH = tempfile.mkdtemp(prefix="doodlr-tests-")
+atexit.register(shutil.rmtree, SCRATCH, ignore_errors=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{SCRATCH}/doodlr.db"
+os.environ["DOODLR_JOURNAL_PATH"] = os.path.join(SCRATCH, "doodlr.journal")
+os.environ["DOODLR_HISTORY_PATH"] = os.path.join(SCRATCH, "doodlr.history")
+os.environ["DOODLR_BUS_URL"] = "memory"
+
+
+@pytest.fixture
+def canvas_table():
+    """An empty canvas table, emptied again afterwards"""
+    from sqlalchemy import delete
+    from database import Canvas, SessionLocal
+
+    def empty():
+        with SessionLocal() as db:
+            db.execute(delete(Canvas))
+            db.commit()
+
+    empty()
+    yield
+    empty()
+
+
+@pytest.fixture
+def local_timezone():
+    """Run the test with the host clock set to a zone well away from UTC"""
+    import time
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "America/New_York"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import pytest
+from sqlalchemy import select
+import bus as bus_module
+from bus import RedisBus
+from canvas_store import canvas_store
+from database import Canvas, SessionLocal
+from journal import PaintJournal
+from realtime import manager
+from routes import canvas as canvas_routes
+
+
+def test_remote_clear_drops_locally_queued_paints(tmp_path, canvas_table, monkeypatch):
+    journal = PaintJournal(str(tmp_path / "journal"), mode="async", interval_ms=10_000)
+    monkeypatch.setattr(canvas_routes, "paint_journal", journal)
+
+    async def run():
+        canvas_store.set(3, 4, "red")
+        await journal.append([(3, 4, "red")])
+        await canvas_routes.handle_bus_event({"type": "clear", "origin": "another-worker"})
+        assert journal.pending_count == 0
+        assert os.path.getsize(journal.path) == 0
+        await journal.stop()
+
+    asyncio.run(run())
+    assert canvas_store.get(3, 4) == 0
+    with SessionLocal() as db:
+        assert db.execute(select(Canvas)).first() is None
+
+
+def test_remote_reload_rereads_the_board(tmp_path, canvas_table, monkeypatch):
+    journal = PaintJournal(str(tmp_path / "journal"), mode="async", interval_ms=10_000)
+    monkeypatch.setattr(canvas_routes, "paint_journal", journal)
+    # Another worker imported a snapshot holding one pixel
+    with SessionLocal() as db:
+        db.add(Canvas(x=7, y=8, color="blue"))
+        db.commit()
+
+    async def run():
+        canvas_store.set(3, 4, "red")
+        await journal.append([(3, 4, "red")])
+        await canvas_routes.handle_bus_event({"type": "reload", "origin": "another-worker"})
+        assert journal.pending_count == 0
+        await journal.stop()
+
+    asyncio.run(run())
+    assert canvas_store.get(3, 4) == 0
+    assert canvas_store.get_color(7, 8) == "blue"
+
+
+def test_paint_succeeds_when_publishing_fails(canvas_table, monkeypatch):
+    from starlette.testclient import TestClient
+    from main import app
+
+    async def unreachable(event):
+        raise ConnectionError("bus down")
+
+    with TestClient(app) as client:
+        monkeypatch.setattr(canvas_routes.bus, "publish", unreachable)
+        monkeypatch.setattr(manager, "flush_tick", lambda: None)
+        response = client.post("/paint", json={"x": 9, "y": 9, "color": "red"})
+        assert response.status_code == 200
+        assert canvas_store.get_color(9, 9) == "red"
+        # This worker's viewers still get the paint
+        assert manager._pending[(9, 9)] == "red"
+        manager.discard_pending()
+
+
+def _redis_buses(monkeypatch, count: int):
+    """RedisBus instances with distinct worker ids sharing one fakeredis server"""
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis.asyncio
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.asyncio, "from_url", lambda url: fakeredis.aioredis.FakeRedis(server=server))
+    return [RedisBus("redis://bus", worker_id=f"worker-{i}") for i in range(count)]
+
+
+async def _wait_for(condition, timeout: float = 2.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out waiting for bus events"
+        await asyncio.sleep(0.01)
+
+
+def test_redis_buses_deliver_each_others_events(monkeypatch):
+    first, second = _redis_buses(monkeypatch, 2)
+    received = {first.worker_id: [], second.worker_id: []}
+
+    def handler(bus):
+        async def handle(event):
+            # What handle_bus_event does: events from this worker were already applied
+            if event["origin"] != bus.worker_id:
+                received[bus.worker_id].append(event)
+        return handle
+
+    async def run():
+        await first.start(handler(first))
+        await second.start(handler(second))
+        await first.publish({"type": "pixels", "pixels": [[1, 2, "red"]]})
+        await second.publish({"type": "clear"})
+        await _wait_for(lambda: all(received.values()))
+        await asyncio.sleep(0.05)
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(run())
+    assert received[first.worker_id] == [{"type": "clear", "origin": second.worker_id}]
+    assert received[second.worker_id] == [{"type": "pixels", "pixels": [[1, 2, "red"]], "origin": first.worker_id}]
+
+
+def test_redis_bus_resubscribes_after_a_failure(monkeypatch):
+    [listener, publisher] = _redis_buses(monkeypatch, 2)
+    monkeypatch.setattr(bus_module, "RECONNECT_S", 0.01)
+    events = []
+
+    async def handle(event):
+        events.append(event)
+
+    async def run():
+        await listener.start(handle)
+        await publisher.start(handle)
+        # Drop the listener's subscription as a lost connection would
+        failing = listener._pubsub
+
+        async def broken():
+            raise ConnectionError("connection lost")
+            yield
+
+        failing.listen = broken
+        listener._task.cancel()
+        try:
+            await listener._task
+        except asyncio.CancelledError:
+            pass
+        listener._task = asyncio.get_running_loop().create_task(listener._listen())
+        await _wait_for(lambda: listener._pubsub is not None and listener._pubsub is not failing)
+        await asyncio.sleep(0.05)
+        await publisher.publish({"type": "clear"})
+        await _wait_for(lambda: any(event["origin"] == publisher.worker_id for event in events))
+        await listener.stop()
+        await publisher.stop()
+
+    asyncio.run(run())
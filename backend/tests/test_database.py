@@ -0,0 +1,15 @@
+import pytest
+from database import create_async_db_engine, create_db_engine
+
+
+@pytest.mark.parametrize("url", ["postgresql://doodlr:secret@db/doodlr", "mysql+pymysql://db/doodlr"])
+def test_non_sqlite_urls_are_refused(url):
+    with pytest.raises(ValueError, match="SQLite"):
+        create_db_engine(url)
+    with pytest.raises(ValueError, match="SQLite"):
+        create_async_db_engine(url)
+
+
+def test_async_engine_runs_on_aiosqlite(tmp_path):
+    for url in (f"sqlite:///{tmp_path}/a.db", f"sqlite+pysqlite:///{tmp_path}/b.db"):
+        assert create_async_db_engine(url).url.drivername == "sqlite+aiosqlite"
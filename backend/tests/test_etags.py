@@ -0,0 +1,43 @@
+from starlette.testclient import TestClient
+from main import app
+from versions import etag_matches
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"x", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+
+
+def test_view_revalidation(canvas_table):
+    view = {"section_x": 0, "section_y": 0}
+    with TestClient(app) as client:
+        first = client.get("/level/2", params=view)
+        etag = first.headers["etag"]
+        assert client.get("/level/2", params=view, headers={"If-None-Match": etag}).status_code == 304
+        # Binary and JSON payloads are cached separately
+        binary = client.get("/level/2", params={**view, "format": "bin"}, headers={"If-None-Match": etag})
+        assert binary.status_code == 200
+
+        # A paint outside the view leaves it current
+        assert client.post("/paint", json={"x": 700, "y": 700, "color": "red"}).status_code == 200
+        assert client.get("/level/2", params=view, headers={"If-None-Match": etag}).status_code == 304
+
+        assert client.post("/paint", json={"x": 5, "y": 5, "color": "red"}).status_code == 200
+        changed = client.get("/level/2", params=view, headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+
+
+def test_cached_json_view_follows_paints(canvas_table):
+    with TestClient(app) as client:
+        before = client.get("/level/1").json()
+        assert client.get("/level/1").json() == before
+        assert client.post("/paint", json={"x": 300, "y": 10, "color": "teal"}).status_code == 200
+        after = client.get("/level/1").json()
+        section = next(section for section in after["sections"] if (section["x"], section["y"]) == (1, 0))
+        assert {"x": 300, "y": 10, "color": "teal"} in section["pixels"]
+        assert after["level"] == 1 and set(section) == {"x", "y", "pixels", "level"}
@@ -0,0 +1,103 @@
+import os
+import time
+from starlette.testclient import TestClient
+from canvas_store import ChunkGrid, canvas_store, color_to_index
+from history import INDEX_HEADER, PaintHistory, format_time, history_now, paint_history
+from journal import RECORD
+from main import app
+
+SIZE = 243
+PARTITION_S = 100
+
+
+def _history(tmp_path) -> PaintHistory:
+    history = PaintHistory(str(tmp_path), partition_s=PARTITION_S, grace_s=0, tile=27, size=SIZE)
+    history._write_checkpoint("reset", 0, ChunkGrid(SIZE))
+    return history
+
+
+def _paint(history: PaintHistory, *records) -> None:
+    """Archive (x, y, color, time) records as one committed journal segment"""
+    segment = os.path.join(history.path, "segment")
+    with open(segment, "wb") as f:
+        f.write(b"".join(RECORD.pack(x, y, color_to_index(color), ts) for x, y, color, ts in records))
+    history.archive(segment)
+    os.remove(segment)
+
+
+def test_sealed_index_lists_only_painted_tiles(tmp_path):
+    history = _history(tmp_path)
+    _paint(history, (1, 1, "red", 10), (200, 200, "blue", 20), (2, 1, "green", 30), (1, 1, "black", 40))
+    before = history.state_at(50, 0, 0, SIZE, SIZE)
+    assert history.seal(now=PARTITION_S) == 1
+
+    path = os.path.join(history.path, "events-0.idx")
+    with open(path, "rb") as f:
+        count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))[-1]
+    assert count == 2
+    # Header, two tile numbers, three offsets, four records
+    assert os.path.getsize(path) == INDEX_HEADER.size + 2 * 4 + 3 * 4 + 4 * RECORD.size
+
+    assert history.state_at(50, 0, 0, SIZE, SIZE) == before
+    assert history.state_at(35, 0, 0, 3, 3)[3:6] == bytes([0, color_to_index("red"), color_to_index("green")])
+    assert [event[2] for event in history.pixel_history(1, 1, 10)] == [color_to_index("black"), color_to_index("red")]
+    # Regions over unpainted tiles, or between painted ones, read nothing
+    assert history._read_index(path, (100, 0, 150, 242)) == []
+    assert len(history._read_index(path, (0, 0, 242, 242))) == 4
+    assert history._read_index(path, (190, 190, 210, 210)) == [(200, 200, color_to_index("blue"), 20)]
+
+
+def test_state_at_spans_partitions_and_seals(tmp_path):
+    history = _history(tmp_path)
+    _paint(history, (5, 5, "red", 10), (6, 5, "blue", 90))
+    _paint(history, (5, 5, "green", 150), (7, 5, "black", 250))
+    reads = {ts: history.state_at(ts, 0, 0, 9, 9) for ts in (5, 50, 120, 200, 300)}
+    assert reads[50][5 * 9 + 5] == color_to_index("red")
+    assert reads[200][5 * 9 + 5:5 * 9 + 8] == bytes([color_to_index("green"), color_to_index("blue"), 0])
+
+    # Sealing the first two partitions derives checkpoints at 100 and 200 and changes no read
+    assert history.seal(now=250) == 2
+    assert [checkpoint.time for checkpoint in history.checkpoints()] == [0, 100, 200]
+    assert {ts: history.state_at(ts, 0, 0, 9, 9) for ts in reads} == reads
+
+
+def test_replay_restarts_after_reset(tmp_path):
+    history = _history(tmp_path)
+    _paint(history, (1, 1, "red", 10))
+    board = ChunkGrid(SIZE)
+    board.put(2, 2, color_to_index("blue"))
+    history._write_checkpoint("reset", 20, board)
+    _paint(history, (3, 3, "green", 30))
+
+    frames = list(history.replay(0, 50, 0, 0, 4, 4))
+    assert [frame[0] for frame in frames] == ["state", "events", "state", "events"]
+    assert frames[1][1] == [(1, 1, color_to_index("red"), 10)]
+    # The board after the reset holds only what the reset wrote
+    assert frames[2][1] == 20
+    assert frames[2][2] == bytes([0] * 10 + [color_to_index("blue")] + [0] * 5)
+    assert frames[3][1] == [(3, 3, color_to_index("green"), 30)]
+
+
+def test_admin_revert_restores_a_region(canvas_table):
+    admin = ("admin", "evergreen")
+    # Level 3 view (7, 7) covers pixels 567..647 on both axes
+    view = {"level": 3, "section_x": 7, "section_y": 7}
+    with TestClient(app) as client:
+        for x, y, color in ((570, 570, "red"), (571, 570, "blue")):
+            assert client.post("/paint", json={"x": x, "y": y, "color": color}).status_code == 200
+        time.sleep(0.01)
+        at = format_time(history_now())
+        time.sleep(0.01)
+        for x, y, color in ((570, 570, "green"), (600, 600, "black"), (700, 700, "black")):
+            assert client.post("/paint", json={"x": x, "y": y, "color": color}).status_code == 200
+
+        response = client.post("/admin/revert", params={"at": at, **view}, auth=admin)
+        assert response.status_code == 200
+        assert response.json()["reverted"] == 2
+        assert canvas_store.window(570, 570, 2, 1) == bytes([color_to_index("red"), color_to_index("blue")])
+        assert canvas_store.window(600, 600, 1, 1) == b"\x00"
+        # Outside the view nothing changes
+        assert canvas_store.window(700, 700, 1, 1) == bytes([color_to_index("black")])
+        assert client.post("/admin/revert", params={"at": "2000-01-01T00:00:00", **view}, auth=admin).status_code == 400
+    # The revert is journaled like any paint, so the erase is in the history once committed
+    assert [event[2] for event in paint_history.pixel_history(600, 600, 2)] == [0, color_to_index("black")]
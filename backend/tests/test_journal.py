@@ -0,0 +1,131 @@
+from datetime import datetime, timezone
+import asyncio
+import os
+import threading
+import time
+import pytest
+from sqlalchemy import select
+from database import Canvas, SessionLocal
+from journal import RECORD, PaintJournal, _read_records
+
+
+def _rows():
+    with SessionLocal() as db:
+        return {(x, y): (color, updated_at) for x, y, color, updated_at in db.execute(
+            select(Canvas.x, Canvas.y, Canvas.color, Canvas.updated_at)
+        )}
+
+
+def _crashed_segment(base: str, pid: int, records) -> None:
+    """Segment and (unlocked) lock file as left behind by a crashed worker"""
+    with open(f"{base}-{pid}", "wb") as f:
+        f.write(b"".join(RECORD.pack(*record) for record in records))
+    open(f"{base}-{pid}.lock", "wb").close()
+
+
+def test_append_records_epoch_time(tmp_path, canvas_table, local_timezone):
+    journal = PaintJournal(str(tmp_path / "journal"), mode="async")
+
+    async def paint():
+        await journal.append([(1, 2, "red")])
+        records = _read_records(journal.path)
+        await journal.stop()
+        return records
+
+    before = time.time()
+    [(x, y, index, ts)] = asyncio.run(paint())
+    assert (x, y) == (1, 2) and index
+    assert before <= ts <= time.time()
+    assert _rows()[(1, 2)][1] == datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+def test_recover_keeps_utc_times(tmp_path, canvas_table, local_timezone):
+    ts = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc).timestamp()
+    base = str(tmp_path / "journal")
+    _crashed_segment(base, 99999, [(5, 6, 1, ts)])
+    assert PaintJournal(base).recover() == 1
+    assert _rows()[(5, 6)] == ("red", datetime(2026, 1, 2, 3, 4, 5))
+    assert not os.listdir(tmp_path)
+
+
+def test_recover_newest_paint_wins_across_segments(tmp_path, canvas_table):
+    base = str(tmp_path / "journal")
+    _crashed_segment(base, 99998, [(1, 1, 1, 100.0), (2, 2, 3, 300.0)])
+    _crashed_segment(base, 99999, [(1, 1, 2, 200.0), (2, 2, 4, 250.0), (3, 3, 5, 100.0)])
+    assert PaintJournal(base).recover() == 3
+    rows = _rows()
+    assert rows[(1, 1)][0] == "green"
+    assert rows[(2, 2)][0] == "blue"
+
+
+def test_recover_applies_erases_and_archives(tmp_path, canvas_table):
+    base = str(tmp_path / "journal")
+    _crashed_segment(base, 99998, [(7, 7, 1, 100.0), (8, 8, 2, 100.0)])
+    journal = PaintJournal(base)
+    journal.recover()
+    _crashed_segment(base, 99999, [(7, 7, 0, 200.0)])
+    archived = []
+    journal.archive = archived.append
+    journal.recover()
+    assert (7, 7) not in _rows() and (8, 8) in _rows()
+    assert f"{base}-99999" in archived
+
+
+def test_recover_skips_segments_of_live_workers(tmp_path, canvas_table):
+    base = str(tmp_path / "journal")
+    live = PaintJournal(base, mode="async")
+
+    async def paint_and_recover():
+        await live.append([(4, 4, "blue")])
+        recovered = PaintJournal(base).recover()
+        await live.stop()
+        return recovered
+
+    assert asyncio.run(paint_and_recover()) == 0
+
+
+class _FailingSession:
+    async def __aenter__(self):
+        raise OSError("database unavailable")
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_failed_group_commit_keeps_paints_queued(tmp_path, canvas_table, monkeypatch):
+    import journal
+    paints = PaintJournal(str(tmp_path / "journal"), mode="group", interval_ms=10_000)
+
+    async def paint():
+        with monkeypatch.context() as patch:
+            patch.setattr(journal, "AsyncSessionLocal", _FailingSession)
+            waiting = asyncio.ensure_future(paints.append([(9, 9, "teal")]))
+            await asyncio.sleep(0)
+            with pytest.raises(OSError):
+                await paints.flush()
+            # The paint is accepted even though its commit failed
+            await waiting
+            assert paints.pending_count == 1
+        await paints.stop()
+
+    asyncio.run(paint())
+    assert _rows()[(9, 9)][0] == "teal"
+
+
+def test_default_mode_returns_before_the_commit(tmp_path, canvas_table):
+    journal = PaintJournal(str(tmp_path / "journal"), interval_ms=10_000)
+    archived = []
+    journal.archive = lambda path: archived.append((path, threading.current_thread() is threading.main_thread()))
+
+    async def run():
+        await journal.append([(1, 2, "red")])
+        assert journal.pending_count == 1
+        await journal.flush()
+        await journal.stop()
+
+    asyncio.run(run())
+    assert journal.mode == "async"
+    # The committed segment is archived off the event loop's thread
+    assert archived == [(journal.flushing_path, False)]
+    with SessionLocal() as db:
+        assert db.execute(select(Canvas.x, Canvas.y, Canvas.color)).all() == [(1, 2, "red")]
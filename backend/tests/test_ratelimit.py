@@ -0,0 +1,65 @@
+import math
+import pytest
+from fastapi import HTTPException
+import ratelimit
+from ratelimit import TokenBucketLimiter
+
+
+def test_bucket_allows_a_burst_then_refills_at_rate():
+    limiter = TokenBucketLimiter(rate=2, burst=4)
+    assert limiter.acquire("a", 4, now=0) == 0
+    assert limiter.acquire("a", 1, now=0) == pytest.approx(0.5)
+    assert limiter.acquire("a", 1, now=0.5) == 0
+    # Refill stops at the burst size
+    assert limiter.acquire("a", 4, now=100) == 0
+    assert limiter.acquire("a", 1, now=100) == pytest.approx(0.5)
+
+
+def test_buckets_are_per_key():
+    limiter = TokenBucketLimiter(rate=1, burst=1)
+    assert limiter.acquire("a", now=0) == 0
+    assert limiter.acquire("b", now=0) == 0
+    assert limiter.acquire("a", now=0) > 0
+
+
+def test_cost_over_burst_never_fits():
+    assert TokenBucketLimiter(rate=10, burst=5).acquire("a", 6, now=0) == math.inf
+
+
+def test_refund_returns_tokens():
+    limiter = TokenBucketLimiter(rate=1, burst=3)
+    limiter.acquire("a", 3, now=0)
+    limiter.refund("a", 2)
+    assert limiter.acquire("a", 2, now=0) == 0
+
+
+def test_idle_buckets_are_evicted():
+    limiter = TokenBucketLimiter(rate=1, burst=1, ttl=10)
+    limiter.acquire("a", now=0)
+    limiter.acquire("b", now=5)
+    limiter.acquire("c", now=11)
+    assert len(limiter) == 2
+
+
+def test_check_paint_rejects_with_retry_after(monkeypatch):
+    monkeypatch.setattr(ratelimit, "paint_limiter", TokenBucketLimiter(rate=1, burst=2))
+    monkeypatch.setattr(ratelimit, "global_paint_limiter", None)
+    ratelimit.check_paint("client", 2, queued=0)
+    with pytest.raises(HTTPException) as too_fast:
+        ratelimit.check_paint("client", 1, queued=0)
+    assert too_fast.value.status_code == 429
+    assert int(too_fast.value.headers["Retry-After"]) >= 1
+    with pytest.raises(HTTPException) as busy:
+        ratelimit.check_paint("other", 1, queued=ratelimit.WRITE_QUEUE_MAX)
+    assert busy.value.status_code == 429
+
+
+def test_global_budget_refunds_the_client(monkeypatch):
+    client = TokenBucketLimiter(rate=1, burst=10)
+    monkeypatch.setattr(ratelimit, "paint_limiter", client)
+    monkeypatch.setattr(ratelimit, "global_paint_limiter", TokenBucketLimiter(rate=1, burst=1))
+    ratelimit.check_paint("client", 1, queued=0)
+    with pytest.raises(HTTPException):
+        ratelimit.check_paint("client", 1, queued=0)
+    # The refused paint's tokens went back to the client's bucket
+    assert client._buckets["client"][0] == pytest.approx(9, abs=0.01)
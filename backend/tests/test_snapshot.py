@@ -0,0 +1,49 @@
+from starlette.testclient import TestClient
+from canvas_store import ChunkGrid, canvas_store, color_to_index
+from main import app
+from rendering import decode_indexed_png
+from snapshot import SNAPSHOT_SIZE, decode_snapshot, encode_snapshot, iter_snapshot
+
+ADMIN = ("admin", "evergreen")
+
+
+def _board() -> ChunkGrid:
+    board = ChunkGrid(SNAPSHOT_SIZE, 27)
+    for x, y, color in ((0, 0, "red"), (26, 27, "blue"), (SNAPSHOT_SIZE - 1, SNAPSHOT_SIZE - 1, "teal")):
+        board.put(x, y, color_to_index(color))
+    return board
+
+
+def test_streamed_snapshot_matches_encoded():
+    board = _board()
+    metadata = {"exported_at": "2026-01-01T00:00:00", "latest_paint": ""}
+    assert b"".join(iter_snapshot(board, "raw", metadata)) == board.to_bytes()
+
+    pieces = list(iter_snapshot(board, "png", metadata))
+    # One IDAT per band of chunk rows, so the export is never encoded in one buffer
+    assert len(pieces) > 2
+    cells, width, height, _, _ = decode_indexed_png(b"".join(pieces))
+    assert (width, height) == (SNAPSHOT_SIZE, SNAPSHOT_SIZE)
+    assert cells == board.to_bytes()
+    assert decode_snapshot(b"".join(pieces)) == decode_snapshot(encode_snapshot(board.to_bytes(), "png", metadata))
+
+
+def test_import_then_export(canvas_table):
+    board = _board()
+    with TestClient(app) as client:
+        imported = client.post("/admin/snapshot", content=encode_snapshot(board.to_bytes(), "png", {}), auth=ADMIN)
+        assert imported.status_code == 200
+        assert imported.json()["painted"] == 3
+        assert canvas_store.to_bytes() == board.to_bytes()
+        # The level 1 overview is read from the pyramid rebuilt for the imported board
+        assert client.get("/render/1", params={"format": "raw"}).status_code == 200
+
+        assert client.post("/paint", json={"x": 5, "y": 5, "color": "green"}).status_code == 200
+        board.put(5, 5, color_to_index("green"))
+        for fmt in ("png", "raw"):
+            exported = client.get("/admin/snapshot", params={"format": fmt}, auth=ADMIN)
+            assert exported.status_code == 200
+            assert decode_snapshot(exported.content)[0] == board.to_bytes()
+
+        refused = client.post("/admin/snapshot", content=b"not a snapshot", auth=ADMIN)
+        assert refused.status_code == 400
@@ -0,0 +1,16 @@
+import json
+from starlette.testclient import TestClient
+from main import app
+from realtime import manager
+
+
+def test_bad_subscription_is_refused_and_connection_cleaned_up():
+    client = TestClient(app)
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_text('{"type": "subscribe", "level": 1e400}')
+        assert json.loads(websocket.receive_text()) == {"type": "error", "detail": "Invalid subscription"}
+        websocket.send_text('{"type": "subscribe", "level": 2, "section_x": 1, "section_y": 2}')
+        assert json.loads(websocket.receive_text())["type"] == "subscribed"
+        assert len(manager.clients) == 1
+    assert not manager.clients
+    assert not manager.views
@@ -0,0 +1,104 @@
+import pytest
+from starlette.testclient import TestClient
+import wire
+from models.canvas import CanvasModel
+
+
+def _paint_frame(sequence: int, cells) -> bytes:
+    return wire.PAINT_HEADER.pack(wire.PAINT_MAGIC, wire.PAINT_VERSION, sequence, len(cells)) + b"".join(
+        wire.DELTA_CELL.pack(*cell) for cell in cells
+    )
+
+
+def test_paint_frame_round_trip():
+    cells = [(0, 0, 1), (728, 3, 14), (65535, 65535, 255)]
+    assert wire.decode_paint_frame(_paint_frame(42, cells)) == (42, cells)
+    assert wire.decode_paint_frame(_paint_frame(7, [])) == (7, [])
+
+
+@pytest.mark.parametrize("frame", [
+    b"",
+    b"DDPT",
+    _paint_frame(1, [(1, 2, 3)])[:-1],
+    _paint_frame(1, [(1, 2, 3)]) + b"\0",
+    b"DDAK" + _paint_frame(1, [(1, 2, 3)])[4:],
+    _paint_frame(1, [(1, 2, 3)])[:4] + bytes([wire.PAINT_VERSION + 1]) + _paint_frame(1, [(1, 2, 3)])[5:],
+])
+def test_malformed_paint_frames_are_refused(frame):
+    with pytest.raises(ValueError):
+        wire.decode_paint_frame(frame)
+
+
+def test_peek_sequence_of_a_malformed_frame():
+    assert wire.peek_paint_sequence(_paint_frame(99, [(1, 2, 3)])[:-1]) == 99
+    assert wire.peek_paint_sequence(b"DD") == 0
+
+
+def test_ack_frame_round_trip():
+    frame = wire.encode_ack_frame(123, 429, painted=0, retry_after_ms=1500)
+    assert wire.ACK_FRAME.unpack(frame) == (wire.ACK_MAGIC, wire.ACK_VERSION, 123, 429, 0, 1500)
+
+
+def test_delta_frame_round_trip():
+    cells = [(1, 2, 3), (700, 701, 14)]
+    frame = wire.encode_delta_frame(5, iter(cells))
+    magic, version, tick, count = wire.DELTA_HEADER.unpack_from(frame)
+    assert (magic, version, tick, count) == (wire.DELTA_MAGIC, wire.DELTA_VERSION, 5, 2)
+    assert list(wire.DELTA_CELL.iter_unpack(frame[wire.DELTA_HEADER.size:])) == cells
+
+
+def test_history_frame_round_trip():
+    events = [(1, 2, 3, 1700000000.25), (4, 5, 0, 1700000001.5)]
+    frame = wire.encode_history_frame(events)
+    assert wire.HISTORY_HEADER.unpack_from(frame) == (wire.HISTORY_MAGIC, wire.HISTORY_VERSION, 2)
+    assert list(wire.HISTORY_PAINT.iter_unpack(frame[wire.HISTORY_HEADER.size:])) == events
+
+
+def test_section_window_header():
+    cells = bytes(range(9))
+    payload = wire.encode_section_window(5, 27, 54, 3, 3, 1, cells)
+    header = wire.SECTION_HEADER.unpack_from(payload)
+    assert header == (wire.SECTION_MAGIC, wire.SECTION_VERSION, 5, len(CanvasModel.COLORS), 27, 54, 3, 3, 1)
+    assert payload[wire.SECTION_HEADER.size:] == cells
+
+
+def test_wants_binary():
+    assert wire.wants_binary("application/octet-stream")
+    assert not wire.wants_binary("application/json")
+    assert wire.wants_binary("application/json", "bin")
+    assert not wire.wants_binary("application/octet-stream", "json")
+
+
+def _next_ack(websocket) -> bytes:
+    """The next ack frame, skipping the delta frames broadcast for the paints"""
+    while True:
+        data = websocket.receive().get("bytes")
+        if data and data.startswith(wire.ACK_MAGIC):
+            return data
+
+
+def test_binary_paint_over_websocket_is_acked(canvas_table):
+    from main import app
+    with TestClient(app) as client, client.websocket_connect("/ws") as websocket:
+        websocket.send_bytes(_paint_frame(17, [(10, 11, 1), (12, 13, 2)]))
+        assert wire.ACK_FRAME.unpack(_next_ack(websocket)) == (wire.ACK_MAGIC, wire.ACK_VERSION, 17, 200, 2, 0)
+        websocket.send_bytes(b"DDPT\x01")
+        assert wire.ACK_FRAME.unpack(_next_ack(websocket))[3] == 400
+
+
+@pytest.mark.parametrize("section_x", [-1, 3, 99999999999])
+def test_off_board_sections_are_refused_in_every_format(section_x):
+    from main import app
+    view = {"section_x": section_x, "section_y": 0}
+    requests = [
+        ("/level/2", {"format": "json"}),
+        ("/level/2", {"format": "bin"}),
+        ("/history", {"level": 2, "format": "json"}),
+        ("/history", {"level": 2, "format": "bin"}),
+        ("/render/2", {"format": "raw"}),
+        ("/changes", {"level": 2, "since": 0}),
+    ]
+    with TestClient(app) as client:
+        for path, params in requests:
+            response = client.get(path, params={**view, **params})
+            assert response.status_code == 400, (path, params, response.text)
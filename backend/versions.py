@@ -0,0 +1,109 @@
+"""Per-section version counters for conditional reads.
+
+Every applied paint takes the next value of a process-wide sequence and
+stamps it on each view containing the pixel, i.e. the pixel's ancestors in
+the 3^n hierarchy, keyed like the render cache: (level, section_x,
+section_y). A view's version therefore only moves when something inside it
+changes, and read endpoints can answer If-None-Match from these counters
+without rendering or touching the database.
+
+The same sequence numbers index ChangeRing, a bounded log of recent paints
+that lets reconnecting clients fetch only what changed since the version
+they last saw.
+
+The counters live in process memory and start over on restart, so ETags
+also carry a per-process generation; a tag issued by another worker or an
+earlier process never matches and just costs one full response.
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+import os
+import uuid
+
+ViewKey = Tuple[int, int, int]
+
+CHANGE_RING_SIZE = int(os.environ.get("DOODLR_CHANGE_RING_SIZE", "65536"))
+
+
+class SectionVersions:
+    def __init__(self):
+        self.generation = uuid.uuid4().hex[:12]
+        self.sequence = 0
+        self._versions: Dict[ViewKey, int] = {}
+        # Views never painted since the last clear report this version
+        self._floor = 0
+
+    def get(self, view: ViewKey) -> int:
+        return self._versions.get(view, self._floor)
+
+    def bump(self, views: Iterable[ViewKey]) -> int:
+        """Stamp the given views with the next sequence number and return it"""
+        self.sequence += 1
+        for view in views:
+            self._versions[view] = self.sequence
+        return self.sequence
+
+    def clear(self) -> None:
+        """Every view changes on a canvas clear"""
+        self.sequence += 1
+        self._versions.clear()
+        self._floor = self.sequence
+
+    def etag(self, view: ViewKey, representation: str) -> str:
+        level, section_x, section_y = view
+        return f'"{self.generation}-{level}.{section_x}.{section_y}-{self.get(view)}-{representation}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """RFC 9110 weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ChangeRing:
+    """Append-only ring of the most recent paints as (sequence, x, y, color)"""
+
+    def __init__(self, capacity: int = CHANGE_RING_SIZE):
+        self._entries: deque = deque(maxlen=capacity)
+        # Changes at or before this sequence are not available
+        self._horizon = 0
+
+    def record(self, sequence: int, x: int, y: int, color: str) -> None:
+        if len(self._entries) == self._entries.maxlen:
+            self._horizon = self._entries[0][0]
+        self._entries.append((sequence, x, y, color))
+
+    def clear(self, sequence: int) -> None:
+        """Forget everything; a clear can only be caught up with a snapshot"""
+        self._entries.clear()
+        self._horizon = sequence
+
+    def covers(self, since: int) -> bool:
+        return since >= self._horizon
+
+    def since(self, since: int, start_x: int, start_y: int, end_x: int, end_y: int) -> Optional[List[List]]:
+        """Latest color of each pixel in the inclusive window painted after `since`,
+        or None when the ring no longer reaches back that far."""
+        if not self.covers(since):
+            return None
+        latest: Dict[Tuple[int, int], str] = {}
+        for sequence, x, y, color in reversed(self._entries):
+            if sequence <= since:
+                break
+            if start_x <= x <= end_x and start_y <= y <= end_y:
+                latest.setdefault((x, y), color)
+        # Oldest first, so applying them in order leaves the newest colors
+        return [[x, y, color] for (x, y), color in reversed(latest.items())]
+
+
+section_versions = SectionVersions()
+change_ring = ChangeRing()
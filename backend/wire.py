@@ -0,0 +1,148 @@
+"""Compact binary encodings for section payloads and live delta frames.
+
+A section response is a fixed little-endian header followed by the 3x3 view
+as one row-major buffer of palette indices (0 = unpainted, n = COLORS[n - 1]):
+
+    offset  size  field
+    0       4     magic b"DDLR"
+    4       1     format version
+    5       1     level
+    6       2     palette size (len(CanvasModel.COLORS))
+    8       4     start_x of the view
+    12      4     start_y of the view
+    16      4     width in pixels
+    20      4     height in pixels
+    24      4     section size (pixels per side of each of the 3x3 sections)
+    28      ...   width * height palette indices
+
+A delta frame carries the cells changed during one broadcast tick:
+
+    offset  size  field
+    0       4     magic b"DDLT"
+    4       1     format version
+    5       4     tick number
+    9       4     cell count
+    13      5*n   cells as (x u16, y u16, palette index u8)
+
+Clients paint over /ws with paint frames, using the same cell layout:
+
+    offset  size  field
+    0       4     magic b"DDPT"
+    4       1     format version
+    5       4     client sequence number (echoed in the ack)
+    9       2     cell count
+    11      5*n   cells as (x u16, y u16, palette index u8)
+
+and get one ack frame per paint frame once it is accepted (or refused):
+
+    offset  size  field
+    0       4     magic b"DDAK"
+    4       1     format version
+    5       4     sequence number of the paint frame
+    9       2     HTTP-style status (200, 400, 429, ...)
+    11      2     pixels painted
+    13      4     retry after, in milliseconds (429 only, else 0)
+
+GET /history?format=bin streams section payloads (the view at the start of
+the replay, and again after each clear or import) interleaved with history
+frames of the paints in between, oldest first:
+
+    offset  size  field
+    0       4     magic b"DDHS"
+    4       1     format version
+    5       4     paint count
+    9       13*n  paints as (x u16, y u16, palette index u8, time f64 seconds);
+                  palette index 0 is an erase
+"""
+from typing import List, Tuple
+import struct
+from models.canvas import CanvasModel
+
+SECTION_MAGIC = b"DDLR"
+SECTION_VERSION = 1
+SECTION_HEADER = struct.Struct("<4sBBHIIIII")
+
+DELTA_MAGIC = b"DDLT"
+DELTA_VERSION = 1
+DELTA_HEADER = struct.Struct("<4sBII")
+DELTA_CELL = struct.Struct("<HHB")
+
+PAINT_MAGIC = b"DDPT"
+PAINT_VERSION = 1
+PAINT_HEADER = struct.Struct("<4sBIH")
+
+ACK_MAGIC = b"DDAK"
+ACK_VERSION = 1
+ACK_FRAME = struct.Struct("<4sBIHHI")
+
+HISTORY_MAGIC = b"DDHS"
+HISTORY_VERSION = 1
+HISTORY_HEADER = struct.Struct("<4sBI")
+HISTORY_PAINT = struct.Struct("<HHBd")
+
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+
+def encode_section_window(level: int, start_x: int, start_y: int, width: int, height: int,
+                          section_size: int, cells: bytes) -> bytes:
+    """Prefix a row-major palette-index window with the section header"""
+    header = SECTION_HEADER.pack(
+        SECTION_MAGIC,
+        SECTION_VERSION,
+        level,
+        len(CanvasModel.COLORS),
+        start_x,
+        start_y,
+        width,
+        height,
+        section_size,
+    )
+    return header + cells
+
+
+def encode_delta_frame(tick: int, cells) -> bytes:
+    """Binary delta frame from (x, y, palette index) tuples"""
+    cells = list(cells)
+    pack = DELTA_CELL.pack
+    return DELTA_HEADER.pack(DELTA_MAGIC, DELTA_VERSION, tick, len(cells)) + b"".join(
+        pack(x, y, index) for x, y, index in cells
+    )
+
+
+def encode_history_frame(events) -> bytes:
+    """History frame from (x, y, palette index, time) tuples"""
+    events = list(events)
+    pack = HISTORY_PAINT.pack
+    return HISTORY_HEADER.pack(HISTORY_MAGIC, HISTORY_VERSION, len(events)) + b"".join(
+        pack(*event) for event in events
+    )
+
+
+def decode_paint_frame(data: bytes) -> Tuple[int, List[Tuple[int, int, int]]]:
+    """(sequence, [(x, y, palette index), ...]) from a paint frame; ValueError if malformed"""
+    if len(data) < PAINT_HEADER.size:
+        raise ValueError("Paint frame too short")
+    magic, version, sequence, count = PAINT_HEADER.unpack_from(data)
+    if magic != PAINT_MAGIC or version != PAINT_VERSION:
+        raise ValueError("Not a paint frame")
+    if len(data) != PAINT_HEADER.size + count * DELTA_CELL.size:
+        raise ValueError("Paint frame length does not match its cell count")
+    return sequence, list(DELTA_CELL.iter_unpack(data[PAINT_HEADER.size:]))
+
+
+def peek_paint_sequence(data: bytes) -> int:
+    """Best-effort sequence number of a (possibly malformed) paint frame, for its ack"""
+    if len(data) >= PAINT_HEADER.size:
+        return PAINT_HEADER.unpack_from(data)[2]
+    return 0
+
+
+def encode_ack_frame(sequence: int, status: int, painted: int = 0, retry_after_ms: int = 0) -> bytes:
+    return ACK_FRAME.pack(ACK_MAGIC, ACK_VERSION, sequence, status, painted, retry_after_ms)
+
+
+def wants_binary(accept: str, fmt: str = None) -> bool:
+    """True when the client asked for the binary section format"""
+    if fmt is not None:
+        return fmt == "bin"
+    return BINARY_MEDIA_TYPE in (accept or "")
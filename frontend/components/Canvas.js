@@ -16,21 +16,16 @@ const Canvas = () => {
     loading,
     fetchParams,
     drawingMode,
+    applyDelta,
+    sectionSizes,
   } = useCanvas();
 
   const { width: winWidth, height: winHeight } = useWindowDimensions();
 
   const getGridSize = () => 3;
 
-  // True underlying pixel span per section at each level (matches backend model)
-  const getSectionPixelSpan = () => {
-    if (currentLevel === 1) return 243;
-    if (currentLevel === 2) return 81;
-    if (currentLevel === 3) return 27;
-    if (currentLevel === 4) return 9;
-    if (currentLevel === 5) return 3;
-    return 1;
-  };
+  // True underlying pixel span per section at each level (from the backend's /config)
+  const getSectionPixelSpan = () => sectionSizes[currentLevel - 1] ?? 1;
 
   // Fit canvas to viewport: leave breathable padding for chrome/controls
   const horizontalPadding = 40; // px
@@ -204,7 +199,27 @@ const Canvas = () => {
     const base = getApiBaseUrl().replace(/^http/, 'ws');
     const ws = new WebSocket(`${base.replace(/\/$/, '')}/ws`);
 
-    ws.onmessage = () => {
+    // Only receive paints inside the view being shown
+    ws.onopen = () => {
+      ws.send(JSON.stringify({
+        type: 'subscribe',
+        level: currentLevel,
+        section_x: fetchParams?.sectionX ?? 0,
+        section_y: fetchParams?.sectionY ?? 0,
+      }));
+    };
+
+    ws.onmessage = (event) => {
+      let message = null;
+      try {
+        message = JSON.parse(event.data);
+      } catch {}
+      if (message?.type === 'subscribed') return;
+      // Pixel grids can take delta cells directly; the SVG view still refetches
+      if (message?.type === 'delta' && shouldShowDrawing()) {
+        applyDelta(message.pixels);
+        return;
+      }
       const now = Date.now();
       const elapsed = now - lastRefreshTsRef.current;
       if (elapsed >= 1000) {
@@ -218,7 +233,7 @@ const Canvas = () => {
       }
     };
     return () => ws.close();
-  }, [currentLevel, fetchParams]);
+  }, [currentLevel, fetchParams, drawingMode]);
 
   const renderSection = (section) => {
     const sectionSize = getSectionSize();
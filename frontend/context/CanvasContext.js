@@ -9,6 +9,8 @@ const initialState = {
   canvasData: [],
   selectedColor: 'red',
   colors: [],
+  // Pixels per section side for levels 1..max; the default depth until /config answers
+  sectionSizes: [243, 81, 27, 9, 3, 1],
   loading: false,
   error: null,
   navigationHistory: [],
@@ -37,6 +39,8 @@ const canvasReducer = (state, action) => {
       return { ...state, selectedColor: action.payload };
     case 'SET_COLORS':
       return { ...state, colors: action.payload };
+    case 'SET_SECTION_SIZES':
+      return { ...state, sectionSizes: action.payload };
     case 'SET_LOADING':
       return { ...state, loading: action.payload };
     case 'SET_ERROR':
@@ -58,6 +62,34 @@ const canvasReducer = (state, action) => {
           return section;
         })
       };
+    case 'APPLY_DELTA': {
+      // Patch painted cells from a live delta frame into the current view's sections
+      const sizes = state.sectionSizes;
+      const level = state.fetchParams.level;
+      const base = sizes[level - 1];
+      const startX = level === 1 ? 0 : (state.fetchParams.sectionX ?? 0) * sizes[level - 2];
+      const startY = level === 1 ? 0 : (state.fetchParams.sectionY ?? 0) * sizes[level - 2];
+      const updates = new Map();
+      action.payload.forEach(([x, y, color]) => {
+        const sx = Math.floor((x - startX) / base);
+        const sy = Math.floor((y - startY) / base);
+        if (sx < 0 || sx > 2 || sy < 0 || sy > 2) return;
+        const key = `${sx},${sy}`;
+        if (!updates.has(key)) updates.set(key, []);
+        updates.get(key).push({ x, y, color });
+      });
+      if (updates.size === 0) return state;
+      return {
+        ...state,
+        canvasData: state.canvasData.map(section => {
+          const changed = updates.get(`${section.x},${section.y}`);
+          if (!changed) return section;
+          const pixels = section.pixels.filter(p => !changed.some(c => c.x === p.x && c.y === p.y));
+          // An empty color is an erase (admin revert)
+          return { ...section, pixels: [...pixels, ...changed.filter(c => c.color)] };
+        })
+      };
+    }
     case 'ADD_TO_HISTORY':
       return {
         ...state,
@@ -106,6 +138,8 @@ export const CanvasProvider = ({ children }) => {
       try {
         const response = await canvasAPI.getColors();
         dispatch({ type: 'SET_COLORS', payload: response.colors });
+        const config = await canvasAPI.getConfig();
+        dispatch({ type: 'SET_SECTION_SIZES', payload: config.section_sizes });
         const data = await canvasAPI.getRootCanvas();
         dispatch({ type: 'SET_CANVAS_DATA', payload: data.sections });
         dispatch({ type: 'SET_CURRENT_LEVEL', payload: 1 });
@@ -307,6 +341,11 @@ export const CanvasProvider = ({ children }) => {
   };
 
   const isDrawableLevel = () => state.currentLevel >= 4 && state.currentLevel <= 5;
+
+  // Apply [[x, y, color], ...] cells from a WebSocket delta frame without refetching
+  const applyDelta = (pixels) => {
+    dispatch({ type: 'APPLY_DELTA', payload: pixels });
+  };
  
   const value = {
     ...state,
@@ -321,6 +360,7 @@ export const CanvasProvider = ({ children }) => {
     toggleDrawingMode,
     setDrawingMode,
     isDrawableLevel,
+    applyDelta,
   };
 
   return (
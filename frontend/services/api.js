@@ -35,6 +35,45 @@ function resolveApiBaseUrl() {
 const API_BASE_URL = resolveApiBaseUrl();
 export const getApiBaseUrl = () => API_BASE_URL;
 
+// Binary section payload (see backend/wire.py): 28-byte little-endian header + palette indices
+const SECTION_MAGIC = 'DDLR';
+const SECTION_HEADER_SIZE = 28;
+
+export const decodeSectionPayload = (buffer, colors) => {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(
+    view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3)
+  );
+  if (magic !== SECTION_MAGIC) {
+    throw new Error('Invalid section payload');
+  }
+  const level = view.getUint8(5);
+  const startX = view.getUint32(8, true);
+  const startY = view.getUint32(12, true);
+  const width = view.getUint32(16, true);
+  const height = view.getUint32(20, true);
+  const sectionSize = view.getUint32(24, true);
+  const cells = new Uint8Array(buffer, SECTION_HEADER_SIZE, width * height);
+
+  // Rebuild the same {x, y, pixels, level} sections the JSON endpoint returns
+  const sections = [];
+  for (let sy = 0; sy < 3; sy++) {
+    for (let sx = 0; sx < 3; sx++) {
+      const pixels = [];
+      for (let py = sy * sectionSize; py < (sy + 1) * sectionSize; py++) {
+        for (let px = sx * sectionSize; px < (sx + 1) * sectionSize; px++) {
+          const index = cells[py * width + px];
+          if (index) {
+            pixels.push({ x: startX + px, y: startY + py, color: colors[index - 1] });
+          }
+        }
+      }
+      sections.push({ x: sx, y: sy, pixels, level });
+    }
+  }
+  return { level, startX, startY, width, height, sectionSize, cells, sections };
+};
+
 const api = axios.create({
   baseURL: API_BASE_URL,
   headers: {
@@ -60,6 +99,18 @@ export const canvasAPI = {
     return response.data;
   },
 
+  // Get canvas at specific level using the compact binary format
+  getCanvasLevelBinary: async (level, sectionX = null, sectionY = null, colors = null) => {
+    const params = { format: 'bin' };
+    if (sectionX !== null && sectionY !== null) {
+      params.section_x = sectionX;
+      params.section_y = sectionY;
+    }
+    const palette = colors ?? (await api.get('/colors')).data.colors;
+    const response = await api.get(`/level/${level}`, { params, responseType: 'arraybuffer' });
+    return decodeSectionPayload(response.data, palette);
+  },
+
   // Get rendered SVG for levels 1..5
   getRenderedSvg: async (level, sectionX = null, sectionY = null) => {
     let url = `/render/${level}`;
@@ -70,6 +121,35 @@ export const canvasAPI = {
     return response.data;
   },
 
+  // Get downsampled overview (dominant color per block) for levels 1..5
+  getOverview: async (level, sectionX = null, sectionY = null, block = null) => {
+    const params = {};
+    if (sectionX !== null && sectionY !== null) {
+      params.section_x = sectionX;
+      params.section_y = sectionY;
+    }
+    if (block !== null) {
+      params.block = block;
+    }
+    const response = await api.get(`/overview/${level}`, { params });
+    return response.data;
+  },
+
+  // Pixels changed in a view since `since` (the X-Canvas-Version of an earlier read);
+  // the response has full=true and sections when a snapshot is needed instead
+  getChanges: async (since, level, sectionX = null, sectionY = null, generation = null) => {
+    const params = { since, level };
+    if (sectionX !== null && sectionY !== null) {
+      params.section_x = sectionX;
+      params.section_y = sectionY;
+    }
+    if (generation !== null) {
+      params.generation = generation;
+    }
+    const response = await api.get('/changes', { params });
+    return response.data;
+  },
+
   // Paint a pixel
   paintPixel: async (x, y, color) => {
     const response = await api.post('/paint', {
@@ -80,6 +160,15 @@ export const canvasAPI = {
     return response.data;
   },
 
+  // Paint many pixels in one request; pixels = [{x, y, color}], runs = [{x, y, length, color}]
+  paintPixels: async (pixels = [], runs = []) => {
+    const response = await api.post('/paint/batch', {
+      pixels,
+      runs,
+    });
+    return response.data;
+  },
+
   // Zoom to position
   zoomToPosition: async (level, sectionX, sectionY) => {
     const response = await api.post('/zoom', {
@@ -95,5 +184,11 @@ export const canvasAPI = {
     const response = await api.get('/colors');
     return response.data;
   },
+
+  // Board geometry: depth, size and per-level section sizes (DOODLR_CANVAS_DEPTH)
+  getConfig: async () => {
+    const response = await api.get('/config');
+    return response.data;
+  },
 };
 
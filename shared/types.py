@@ -24,14 +24,16 @@ class ZoomRequest(BaseModel):
     section_x: int
     section_y: int
 
-# Canvas dimensions
-TOTAL_SIZE = 729  # 729x729 = 531,441 pixels
-SECTION_SIZE = 243  # 243x243 pixels per top-level section
-SUBSECTION_SIZE = 81  # 81x81 pixels per level-2 subsection
-AREA_SIZE = 27  # 27x27 pixels per level-3 area
+# Canvas dimensions at the default depth of 6 levels (DOODLR_CANVAS_DEPTH on the
+# backend; GET /config reports the depth a server actually runs with)
+DEPTH = 6
+TOTAL_SIZE = 3 ** DEPTH  # 729x729 = 531,441 pixels
+SECTION_SIZE = TOTAL_SIZE // 3  # 243x243 pixels per top-level section
+SUBSECTION_SIZE = SECTION_SIZE // 3  # 81x81 pixels per level-2 subsection
+AREA_SIZE = SUBSECTION_SIZE // 3  # 27x27 pixels per level-3 area
 # Additional derived levels
-BLOCK_SIZE = 9  # level-4
-CELL_SIZE = 3   # level-5
+BLOCK_SIZE = AREA_SIZE // 3  # level-4
+CELL_SIZE = BLOCK_SIZE // 3   # level-5
 
 # Available colors
 COLORS = [